@@ -1,6 +1,8 @@
 import pandas as pd
+import pyarrow.dataset as ds
 
 from data import getSummonerMatchDataFromDB
+from parquetstore import loadParquet
 
 
 def createMatchAnalysis(matchID):
@@ -57,7 +59,37 @@ def createCorrelationMatricesFromList(matchList):
     return result_df
 
 
+def loadSummonerParticipantStats(puuid, months=None, queues=(420,), columns=None):
+    """
+    Load a summoner's per-game stats from the Parquet export (python manage.py export-parquet) instead of Postgres.
+
+    Parameters:
+    puuid (str): The PUUID of the summoner.
+    months (list, optional): 'YYYY-MM' months to load, other months are not read at all. Defaults to every month.
+    queues (tuple, optional): Queue IDs to load. Defaults to (420,), None loads every queue.
+    columns (list, optional): The columns to read. Defaults to every column.
+
+    Returns:
+    pd.DataFrame: One row per game of the summoner.
+    """
+    return loadParquet('participants', columns=columns, months=months, queues=queues,
+                       rowFilter=ds.field('puuid') == puuid)
 
 
+def createChampionStatsFromParquet(puuid, months=None, queues=(420,)):
+    """
+    Per-champion games, win rate and average KDA of a summoner, computed from the Parquet export.
 
+    Parameters:
+    puuid (str): The PUUID of the summoner.
+    months (list, optional): 'YYYY-MM' months to include. Defaults to every month.
+    queues (tuple, optional): Queue IDs to include. Defaults to (420,).
 
+    Returns:
+    pd.DataFrame: games, win_rate and kda per champion_name, most played first.
+    """
+    df = loadSummonerParticipantStats(puuid, months, queues,
+                                      columns=['champion_name', 'win', 'kills', 'deaths', 'assists'])
+    df['kda'] = (df['kills'] + df['assists']) / df['deaths'].clip(lower=1)
+    stats = df.groupby('champion_name').agg(games=('win', 'size'), win_rate=('win', 'mean'), kda=('kda', 'mean'))
+    return stats.sort_values('games', ascending=False).round(2)
@@ -1,8 +1,11 @@
 import plotly.graph_objects as go
+import streamlit as st
 
 from data import *
 from plot import plotCorrelationHeatmap
 
+getLastNMatchIDSOfSummonerFromDB = st.cache_resource(getLastNMatchIDSOfSummonerFromDB)
+
 
 def main():
     st.title("Your Rift, WEEKLY")
@@ -95,14 +98,15 @@ def displayHome():
     userSummonerName = st.text_input("Enter Your Summoner Name:")
     if userSummonerName:
         if userSummonerName.lower() in summonerNames:
-            summonerMatches = getThisWeekMatchIDSFromDB(userSummonerName)
-            victories, defeats = getSummonerWinLossRatioFromDB(userSummonerName, matchesList=summonerMatches)
-            hoursPlayed, minutesPlayed, weeklyGames = getSummonerHoursAndGamesFromDB(userSummonerName,
-                                                                                     matchesList=summonerMatches)
-            favoriteChampion, favoriteTimes, championPoolDiversity = getChampionPoolDiversityAndFavoriteChampionFromDB(
-                userSummonerName, matchesList=summonerMatches)
-            bestGame, bestChampion, bestKills, bestDeaths, bestAssists = getBestGameFromDB(userSummonerName,
-                                                                                           matchesList=summonerMatches)
+            # One primary key lookup on the summoner_period_stats rollup, maintained at ingest
+            periodStats = getSummonerPeriodStatsFromDB(userSummonerName)
+            victories, defeats = periodStats['victories'], periodStats['defeats']
+            hoursPlayed, minutesPlayed = periodStats['hoursPlayed'], periodStats['minutesPlayed']
+            weeklyGames = periodStats['gamesPlayed']
+            favoriteChampion, favoriteTimes = periodStats['favoriteChampion'], periodStats['favoriteTimes']
+            championPoolDiversity = periodStats['championPool']
+            bestChampion, bestKills = periodStats['bestChampion'], periodStats['bestKills']
+            bestDeaths, bestAssists = periodStats['bestDeaths'], periodStats['bestAssists']
             displaySummonerNameHeader(userSummonerName)
             col1, col2, col3 = st.columns(3)
             col1.metric("Current Rank", getSummonerRankFromDB(userSummonerName))
@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from configservice import getConfigService
+
+# Every logger of the project lives under this name, so the 'Logging' config section can set their levels
+# without touching the loggers of aiohttp, urllib3 or streamlit.
+rootLoggerName = 'lol'
+
+loggingDefaults = {'level': 'INFO', 'format': 'color', 'levels': {}}
+
+# Level -> ANSI color of the console formatter, the codes cPrintS uses
+levelColors = {
+    logging.DEBUG: '94',
+    logging.INFO: '92',
+    logging.WARNING: '93',
+    logging.ERROR: '91',
+    logging.CRITICAL: '101',
+}
+
+# The attributes every LogRecord has, anything else on a record came from extra={...} and is a structured field
+recordAttributes = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+queueListener = None
+setupLock = threading.Lock()
+
+
+def getFields(record):
+    """Return the structured fields a record was logged with (logger.info('...', extra={'matchId': ...}))."""
+    return {key: value for key, value in vars(record).items() if key not in recordAttributes}
+
+
+class ColorFormatter(logging.Formatter):
+    """
+    The console format: '12:01:02 INFO  data: 100 of 100 matches upserted batch=3', with the level colored like
+    cPrintS and the structured fields appended as key=value pairs.
+
+    Parameters:
+    color (bool): Color the level and the fields. Defaults to True, False gives plain key=value lines.
+    """
+
+    def __init__(self, color=True):
+        super().__init__()
+        self.color = color
+
+    def format(self, record):
+        hms = time.strftime('%H:%M:%S', time.localtime(record.created))
+        name = record.name[len(rootLoggerName) + 1:] if record.name.startswith(rootLoggerName + '.') else record.name
+        fields = ' '.join(f'{key}={value}' for key, value in getFields(record).items())
+        if self.color:
+            level = f'\033[{levelColors.get(record.levelno, "97")}m{record.levelname:<5}\033[0m'
+            fields = fields and f'\033[96m{fields}\033[0m'
+        else:
+            level = f'{record.levelname:<5}'
+        line = f'{hms} {level} {name}: {record.getMessage()}' + (f' {fields}' if fields else '')
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the structured fields, for log shippers."""
+
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage(), **getFields(record)}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that leaves the formatting to the listener thread.
+
+    The stock handler formats the whole record in the logging thread. Here only the message is rendered (so later
+    changes to the arguments don't show up in the line), the colors, fields and tracebacks are assembled by the
+    listener.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def getLoggingConfig():
+    """Return the settings of the optional 'Logging' config section, the defaults when the config can't be read."""
+    try:
+        section = getConfigService().get().get('Logging', {})
+    except (OSError, ValueError):
+        section = {}
+    return {**loggingDefaults, **section}
+
+
+def setupLogging(config=None):
+    """
+    Sets up the project loggers, once per process. getLogger calls it, so the entry points don't have to.
+
+    Records go through an unbounded in-memory queue to a listener thread that formats them and writes them to stdout,
+    so a coroutine or a worker thread that logs never waits on the terminal. Records below the configured level are
+    dropped by the logger before their message is even formatted.
+
+    Parameters:
+    config (dict, optional): {"level": "INFO", "format": "color", "plain" or "json",
+        "levels": {"riotclient": "DEBUG", ...}}. Defaults to the 'Logging' config section.
+    """
+    global queueListener
+    with setupLock:
+        if queueListener is not None:
+            return
+        config = {**loggingDefaults, **(config or getLoggingConfig())}
+
+        formatter = JsonFormatter() if config['format'] == 'json' else ColorFormatter(color=config['format'] == 'color')
+        consoleHandler = logging.StreamHandler(sys.stdout)
+        consoleHandler.setFormatter(formatter)
+
+        logQueue = queue.SimpleQueue()
+        rootLogger = logging.getLogger(rootLoggerName)
+        rootLogger.setLevel(config['level'].upper())
+        rootLogger.handlers = [DeferredQueueHandler(logQueue)]
+        rootLogger.propagate = False
+        for name, level in config['levels'].items():
+            logging.getLogger(f'{rootLoggerName}.{name}').setLevel(level.upper())
+
+        queueListener = logging.handlers.QueueListener(logQueue, consoleHandler)
+        queueListener.start()
+        atexit.register(stopLogging)
+
+
+def stopLogging():
+    """Writes out the queued records and stops the listener thread."""
+    global queueListener
+    with setupLock:
+        if queueListener is not None:
+            queueListener.stop()
+            queueListener = None
+
+
+def getLogger(name):
+    """
+    Return the logger of a module, e.g. log = getLogger('data').
+
+    Log with %-style arguments (log.debug('Fetched %s', matchID)) rather than f-strings, so a disabled level costs
+    one integer comparison. Structured fields are passed as extra={'matchId': ...}.
+    """
+    setupLogging()
+    return logging.getLogger(f'{rootLoggerName}.{name}')
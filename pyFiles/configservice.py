@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+
+defaultConfigPath = '/home/shai/Desktop/config.json'
+
+
+class ConfigService:
+    """
+    The parsed config file, loaded once and reloaded when the file changes, with lookup indexes over 'SummonerData'.
+
+    Whether the file changed is checked by its mtime and size, at most once every checkInterval seconds, so a hot loop
+    reading the config costs a dict lookup instead of opening and parsing the JSON. The returned config is shared
+    between callers and must not be modified.
+
+    Parameters:
+    path (str): The config JSON file.
+    checkInterval (float): Seconds between two checks of the file. Defaults to 1.
+    """
+
+    def __init__(self, path, checkInterval=1.0):
+        self.path = path
+        self.checkInterval = checkInterval
+        self.lock = threading.Lock()
+        self.signature = None
+        self.checkedAt = 0.0
+        self.config = None
+        self.summonersByName = {}
+        self.namesByPuuid = {}
+        self.namesBySummonerID = {}
+
+    def refresh(self):
+        """Reload the file if it changed since it was last read."""
+        now = time.monotonic()
+        if self.config is not None and now - self.checkedAt < self.checkInterval:
+            return
+        with self.lock:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature != self.signature:
+                with open(self.path, 'r') as f:
+                    config = json.load(f)
+                self.buildIndexes(config)
+                self.config = config
+                self.signature = signature
+            self.checkedAt = now
+
+    def buildIndexes(self, config):
+        summonersByName = {}
+        namesByPuuid = {}
+        namesBySummonerID = {}
+        for name, details in config.get('SummonerData', {}).items():
+            summonersByName[name] = details
+            # The first summoner listed wins, like the linear scans these replace
+            if details.get('puuid') is not None:
+                namesByPuuid.setdefault(details['puuid'], details.get('summonerName'))
+            if details.get('summonerID') is not None:
+                namesBySummonerID.setdefault(details['summonerID'], details.get('summonerName'))
+        self.summonersByName, self.namesByPuuid, self.namesBySummonerID = \
+            summonersByName, namesByPuuid, namesBySummonerID
+
+    def get(self, key=None):
+        """Return the whole config, or the value of one top level key (KeyError if it is missing)."""
+        self.refresh()
+        return self.config if key is None else self.config[key]
+
+    def getSummonerDetails(self, summonerName):
+        self.refresh()
+        return self.summonersByName.get(summonerName)
+
+    def getSummonerNameFromPuuid(self, puuid):
+        self.refresh()
+        return self.namesByPuuid.get(puuid)
+
+    def getSummonerNameFromID(self, summonerID):
+        self.refresh()
+        return self.namesBySummonerID.get(summonerID)
+
+
+configServices = {}
+configServicesLock = threading.Lock()
+
+
+def getConfigService(path=defaultConfigPath):
+    """Return the shared ConfigService of a config file, created on first use."""
+    service = configServices.get(path)
+    if service is None:
+        with configServicesLock:
+            service = configServices.setdefault(path, ConfigService(path))
+    return service
@@ -1,25 +1,33 @@
+import asyncio
 import os
 
-import pandas as pd
 import psycopg2 as ps
 import psycopg2.extras
-import requests
-import streamlit as st
-from sqlalchemy import create_engine
 
+from applog import getLogger
+from db import connect_db, getConnection, getEngine
+from duckstore import getAnalyticsStore
+from httpcache import getHttpCache
+from matchkeys import getMatchKey
+from matchstore import getMatchStore
+from partitions import ensureMatchPartitions
+from projection import getProjection, projectMatch
+from riotclient import RiotClient
 from utils import *
 
-dbname = getDataFromConfig(key='Database')['DataBaseConnectInfo']['dbname']
-user = getDataFromConfig(key='Database')['DataBaseConnectInfo']['user']
-password = getDataFromConfig(key='Database')['DataBaseConnectInfo']['password']
-port = getDataFromConfig(key='Database')['DataBaseConnectInfo']['port']
-host = getDataFromConfig(key='Database')['DataBaseConnectInfo']['host']
+log = getLogger('data')
 
-requestHeaders = getDataFromConfig(key='API')['requestHeaders']
+requestHeaders = getRequestHeaders()
 
+riotClient = RiotClient(requestHeaders, httpCache=getHttpCache())
+matchStore = getMatchStore()
+matchProjection = getProjection()
+# The local DuckDB mirror the dashboard and analysis readers query instead of Postgres, None to read Postgres
+analyticsStore = getAnalyticsStore()
 
-# @myLogger
-def request(url, headers=None, params=None, max_retries=5, defaultRetryAfter=30):
+
+@myLogger
+def request(url, headers=None, params=None, max_retries=5, defaultRetryAfter=30, useCache=False):
     """
     A function to make a request to a URL with optional headers and parameters. Automatically retries on rate limit.
 
@@ -28,51 +36,16 @@ def request(url, headers=None, params=None, max_retries=5, defaultRetryAfter=30)
     headers (dict, optional): The headers to include in the request. Defaults to None.
     params (dict, optional): The parameters to include in the request. Defaults to None.
     max_retries (int, optional): Maximum number of retries if rate limited. Defaults to 5.
+    useCache (bool, optional): Serve the request from the persistent HTTP cache while fresh and revalidate it with
+        If-None-Match / If-Modified-Since after that. Defaults to False.
 
     Returns:
     The response object if the status code is 200, the status code if 429 or 404, and the status code with explanation for all other cases.
-    """
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code == 200:
-                cPrintS(f'{{green}}Request successful.')
-                return response
-            elif response.status_code == 429:
-                # Rate limit hit. Wait and retry.
-                waitTime = response.headers.get('Retry-After', defaultRetryAfter)
-                cPrintS(
-                    f'{{yellow}}Function {{cyan}}request{{yellow}} hit the rate limit, Sleeping for {waitTime} seconds and retrying...')
-                countdown(int(waitTime))  # Using your custom countdown function for waiting
-                continue
-            elif response.status_code == 404:
-                cPrintS(f'{{yellow}}Request Function is returning: 404 Not Found.')
-                return response
-            else:
-                # Other errors
-                cPrintS(f'{{red}}Error Code: {response.status_code} || {explainStatus(response.status_code)}')
-                return response
-
-        except requests.exceptions.RequestException as e:
-            cPrintS(f'{{red}}Error making request: {e}')
-            if attempt == max_retries - 1:
-                cPrintS('{red}Max retries reached. Unable to resolve the request error.')
-                return f'Error: {str(e)}'
-
-    # If all retries fail
-    return 'Failed after maximum retries'
 
-
-# @myLogger
-def connect_db():
-    return ps.connect(
-        dbname=dbname,
-        user=user,
-        password=password,
-        host=host,
-        port=port
-    )
+    Requests go through the pooled RiotClient, which keeps the connection to each host alive between calls.
+    """
+    return riotClient.request(url, headers=headers, params=params, max_retries=max_retries,
+                              defaultRetryAfter=defaultRetryAfter, useCache=useCache)
 
 
 def updateConfigSummonerData(configFilePath='../config/config.json'):
@@ -84,17 +57,15 @@ def updateConfigSummonerData(configFilePath='../config/config.json'):
     if 'puuids' not in json_data:
         json_data['puuids'] = []
 
-    # Connect to the PostgreSQL database
-    conn = connect_db()
-    cursor = conn.cursor()
-
     # Fetch all summoners from the database
     query = """
     SELECT puuid, name, "summonerID"
     FROM summoners;
     """
-    cursor.execute(query)
-    all_summoners = cursor.fetchall()
+    with getConnection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            all_summoners = cursor.fetchall()
 
     # Ensure SummonerData section exists
     if 'SummonerData' not in json_data:
@@ -115,16 +86,12 @@ def updateConfigSummonerData(configFilePath='../config/config.json'):
         if fetched_puuid not in json_data['puuids']:
             json_data['puuids'].append(fetched_puuid)
 
-    # Close the database connection
-    cursor.close()
-    conn.close()
-
     # Write the updated JSON data back to the file
     with open(configFilePath, 'w') as file:
         json.dump(json_data, file, indent=4)
 
 
-# @myLogger
+@myLogger
 def getLatestVersion():
     """
     Retrieves the latest version of the game data from the Riot Games API.
@@ -138,11 +105,8 @@ def getLatestVersion():
         str: The latest version of the game data.
     """
 
-    # API url from where to fetch versions
-    versions_url = "https://ddragon.leagueoflegends.com/api/versions.json"
-
     # Make a GET request to the versions API
-    response = request(versions_url)
+    response = riotClient.getDdragonVersions(useCache=True)
 
     # Convert the response to JSON format
     versions = response.json()
@@ -151,7 +115,7 @@ def getLatestVersion():
     return versions[0]
 
 
-# @myLogger
+@myLogger
 def updateLatestVersion():
     """
     This function retrieves the latest version of the game, gets the current timestamp,
@@ -167,18 +131,20 @@ def updateLatestVersion():
     latest_version = getLatestVersion()
     timestamp = datetime.now()
     # Connect to the database and execute the commands
-    conn = connect_db()
-    with conn.cursor() as cur:
-        # Delete all rows from the table 'latest_version'
-        cur.execute('DELETE FROM latest_version;')
-
-        # Insert the latest version and the current timestamp into the table 'latest_version'
-        cur.execute("INSERT INTO latest_version (version, last_checked) VALUES (%s, %s);", (latest_version, timestamp))
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Delete all rows from the table 'latest_version'
+            cur.execute('DELETE FROM latest_version;')
+
+            # Insert the latest version and the current timestamp into the table 'latest_version'
+            cur.execute("INSERT INTO latest_version (version, last_checked) VALUES (%s, %s);",
+                        (latest_version, timestamp))
+        conn.commit()
 
     cPrint(f"Latest version {latest_version} saved on {timestamp}", 'cyan')
 
 
-# @myLogger
+@myLogger
 def getLatestChampions(version, language='en_US'):
     """
     getLatestChampions is a function that fetches the latest champions from the API using the given version and
@@ -193,10 +159,8 @@ def getLatestChampions(version, language='en_US'):
     Returns:
         - champions (dict): A dictionary containing champion keys as keys and champion IDs as values.
     """
-    # creates the url for the API using the given version and language
-    championsURL = f"http://ddragon.leagueoflegends.com/cdn/{version}/data/{language}/champion.json"
-    # sends a get request to the generated url
-    response = request(championsURL)
+    # sends a get request for the given version and language
+    response = riotClient.getDdragonChampions(version, language, useCache=True)
     # converts the response to json format
     championsData = response.json()
     # gets the champion ids and keys from the resulting json and creates a dictionary
@@ -205,12 +169,12 @@ def getLatestChampions(version, language='en_US'):
     return champions
 
 
-# @myLogger
+@myLogger
 def updateLatestChampions(champions_dict):
     # SQL to upsert champion data
     upsert_sql = """
     INSERT INTO champions (championID, championName, updateDate) 
-    VALUES (%s, %s, %s) 
+    VALUES %s 
     ON CONFLICT (championID) 
     DO UPDATE SET championName = EXCLUDED.championName, updateDate = EXCLUDED.updateDate;
     """
@@ -218,23 +182,19 @@ def updateLatestChampions(champions_dict):
     # Current date to mark when the update happens
     update_date = datetime.now().date()
 
-    conn = connect_db()  # Ensure you have a function to connect to your database
     try:
-        cur = conn.cursor()
-        for champion_id, champion_name in champions_dict.items():
-            # Execute upsert for each champion
-            cur.execute(upsert_sql, (champion_id, champion_name, update_date))
-        conn.commit()
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Upsert all champions in one statement
+                psycopg2.extras.execute_values(cur, upsert_sql, [(champion_id, champion_name, update_date) for
+                                                                 champion_id, champion_name in champions_dict.items()])
+            conn.commit()
         cPrint("Champions table updated successfully.", 'green')
-        cur.close()
     except (Exception, ps.DatabaseError) as error:
         cPrint(f"Error updating champions table: {error}", 'red')
-    finally:
-        if conn is not None:
-            conn.close()
 
 
-# @myLogger
+@myLogger
 def getChampionRotations():
     """
     getChampionRotations is a function that fetches the currently free-to-play champion rotations from the Riot Games
@@ -249,11 +209,8 @@ def getChampionRotations():
     Returns:
     - freeChampions (list): A list containing the IDs of the currently free-to-play champions in the game.
 """
-    # Define the URL to get the champion rotations
-    rotationsURL = 'https://euw1.api.riotgames.com/lol/platform/v3/champion-rotations'
-
     # Send the GET request
-    response = request(rotationsURL, headers=requestHeaders)
+    response = riotClient.getChampionRotations(useCache=True)
 
     # Convert the response to JSON
     freeChampionsData = response.json()
@@ -265,34 +222,28 @@ def getChampionRotations():
     return freeChampions
 
 
-# @myLogger
+@myLogger
 def upsertFreeRotation(free_champions):
     # free_champions is a list of champion IDs for the current week
 
     delete_sql = "TRUNCATE TABLE current_free_champions;"  # Clears the existing data
-    insert_sql = "INSERT INTO current_free_champions (championID) VALUES (%s);"
+    insert_sql = "INSERT INTO current_free_champions (championID) VALUES %s;"
 
-    conn = connect_db()  # Ensure you have a function to connect to your database
     try:
-        cur = conn.cursor()
-        # Clear the table
-        cur.execute(delete_sql)
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Clear the table
+                cur.execute(delete_sql)
 
-        # Insert the new list of free champions
-        for champion_id in free_champions:
-            cur.execute(insert_sql, (champion_id,))
-
-        conn.commit()
-        cur.close()
+                # Insert the new list of free champions in one statement
+                psycopg2.extras.execute_values(cur, insert_sql, [(champion_id,) for champion_id in free_champions])
+            conn.commit()
         cPrint("Current free champions updated successfully.", 'green')
     except (Exception, ps.DatabaseError) as error:
         cPrint(f"Error: {error}", 'red')
-    finally:
-        if conn is not None:
-            conn.close()
 
 
-# @myLogger
+@myLogger
 def getSummonerData(summonerName):
     """
     Retrieves summoner data from the Riot Games API for a specified summoner name in the EUW (Europe West) region.
@@ -316,15 +267,13 @@ def getSummonerData(summonerName):
     this basic example.
     """
 
-    infoURL = f'https://euw1.api.riotgames.com/lol/summoner/v4/summoners/by-name/{summonerName}'
-
-    response = request(infoURL, headers=requestHeaders)
+    response = riotClient.getSummonerByName(summonerName)
     summonerData = response.json()
     summonerData.update({'name': summonerName})
     return summonerData
 
 
-# @myLogger
+@myLogger
 def upsertSummonerData(summonerData):
     sql = """
     INSERT INTO summoners (puuid, name, summonerLevel, "summonerID") 
@@ -334,24 +283,20 @@ def upsertSummonerData(summonerData):
         "summonerID" = EXCLUDED."summonerID"
     """
 
-    conn = None
     try:
-        conn = connect_db()  # Assuming you have a predefined function for database connection
-        cur = conn.cursor()
-        # Execute the upsert operation
-        cur.execute(sql, (
-            summonerData['puuid'],
-            summonerData['name'],
-            summonerData['summonerLevel'],
-            summonerData['id'],
-        ))
-        conn.commit()
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Execute the upsert operation
+                cur.execute(sql, (
+                    summonerData['puuid'],
+                    summonerData['name'],
+                    summonerData['summonerLevel'],
+                    summonerData['id'],
+                ))
+            conn.commit()
         cPrint(f"Summoner {summonerData['name']} upserted successfully.", 'green')
     except (Exception, ps.DatabaseError) as error:
         cPrint(f"Error upserting Summoner data: {error}", 'red')
-    finally:
-        if conn is not None:
-            conn.close()
 
 
 # testPlayer = getSummonerData('DenSygeKamel69')
@@ -359,23 +304,346 @@ def upsertSummonerData(summonerData):
 # updateConfigSummonerData()
 
 
-# @myLogger
+@myLogger
 def getMatchData(matchID):
     """
     Retrieve match data from the Riot Games API using the provided match ID.
 
+    The local match store is checked first, and every match fetched from the API is saved to it, so a match is only
+    ever downloaded once.
+
     Args:
         matchID (str): The ID of the match to retrieve data for.
 
     Returns: dict or str or int: The match data if the request is successful, 'limit' if the rate limit is hit,
     or the HTTP status code if there is an error.
     """
-    url = f'https://europe.api.riotgames.com/lol/match/v5/matches/{matchID}'
-    response = request(url, headers=requestHeaders)
-    return response.json() if response.status_code == 200 else response.status_code
+    if matchStore is not None:
+        matchData = matchStore.get(matchID)
+        if matchData is not None:
+            return matchData
+
+    response = riotClient.getMatch(matchID)
+    if response.status_code != 200:
+        return response.status_code
+    matchData = response.json()
+    if matchStore is not None:
+        matchStore.put(matchData)
+    return matchData
+
+
+# The single row upsert uses a 16 placeholder row, the bulk upsert lets execute_values fill in a list of rows.
+# (platform, game_id, datetime) is the compact match key (matchkeys.py) with the partition key of a 'matches' table
+# partitioned by month (partitions.py)
+matchUpsertTemplate = """
+    INSERT INTO matches (
+        matchid, datetime, matchmetadata, matchinfo, 
+        matchparticipant0, matchparticipant1, matchparticipant2, matchparticipant3, matchparticipant4, 
+        matchparticipant5, matchparticipant6, matchparticipant7, matchparticipant8, matchparticipant9,
+        platform, game_id
+    ) 
+    VALUES {values} 
+    ON CONFLICT (platform, game_id, datetime) 
+    DO UPDATE SET 
+        matchmetadata = EXCLUDED.matchmetadata, 
+        matchinfo = EXCLUDED.matchinfo, 
+        matchparticipant0 = EXCLUDED.matchparticipant0, 
+        matchparticipant1 = EXCLUDED.matchparticipant1, 
+        matchparticipant2 = EXCLUDED.matchparticipant2, 
+        matchparticipant3 = EXCLUDED.matchparticipant3, 
+        matchparticipant4 = EXCLUDED.matchparticipant4, 
+        matchparticipant5 = EXCLUDED.matchparticipant5, 
+        matchparticipant6 = EXCLUDED.matchparticipant6, 
+        matchparticipant7 = EXCLUDED.matchparticipant7, 
+        matchparticipant8 = EXCLUDED.matchparticipant8, 
+        matchparticipant9 = EXCLUDED.matchparticipant9,
+        ingested_at = NOW()
+    """
+matchUpsertSql = matchUpsertTemplate.format(values='(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+matchBulkUpsertSql = matchUpsertTemplate.format(values='%s') + 'RETURNING matchid'
 
 
 # @myLogger
+def getMatchRow(matchData):
+    """
+    Convert a match-v5 response into the row tuple of the 'matches' table, in the column order of matchUpsertSql.
+
+    Parameters:
+        matchData (dict): A dictionary containing match data.
+
+    Returns:
+        tuple: matchid, datetime, metadata, info (without participants), the ten participant columns as JSON and the
+        compact key (platform, game_id).
+
+    With a 'Projection' in the config only the projected fields are kept (see projection.py).
+    """
+    if matchProjection is not None:
+        matchData = projectMatch(matchData, matchProjection)
+
+    # Extract the relevant data from the matchData dictionary
+    matchid = matchData['metadata']['matchId']
+    matchDateTime = timestampToDate(matchData['info']['gameStartTimestamp'])
+    matchMetadata = json.dumps(matchData['metadata'])
+    matchInfo = matchData['info'].copy()
+    if 'participants' in matchInfo:
+        del matchInfo['participants']
+    matchInfo = json.dumps(matchInfo)
+
+    # Extract the participant data, missing participants are stored as NULL
+    participants = matchData['info']['participants']
+    participantColumns = [json.dumps(participants[i]) if len(participants) > i else None for i in range(10)]
+
+    return (matchid, matchDateTime, matchMetadata, matchInfo, *participantColumns, *getMatchKey(matchid))
+
+
+# Typed per-participant columns of 'match_participants': column name, match-v5 participant key, SQL type
+participantFields = [
+    ('puuid', 'puuid', 'text'),
+    ('team_id', 'teamId', 'smallint'),
+    ('champion_id', 'championId', 'int'),
+    ('champion_name', 'championName', 'text'),
+    ('team_position', 'teamPosition', 'text'),
+    ('win', 'win', 'boolean'),
+    ('kills', 'kills', 'int'),
+    ('deaths', 'deaths', 'int'),
+    ('assists', 'assists', 'int'),
+    ('gold_earned', 'goldEarned', 'int'),
+    ('gold_spent', 'goldSpent', 'int'),
+    ('total_damage_dealt_to_champions', 'totalDamageDealtToChampions', 'int'),
+    ('total_damage_taken', 'totalDamageTaken', 'int'),
+    ('total_minions_killed', 'totalMinionsKilled', 'int'),
+    ('vision_score', 'visionScore', 'int'),
+    ('wards_placed', 'wardsPlaced', 'int'),
+    ('wards_killed', 'wardsKilled', 'int'),
+    ('time_played', 'timePlayed', 'int'),
+]
+participantKeyColumns = ['platform', 'game_id', 'participant_index']
+participantColumns = ['matchid', *participantKeyColumns, 'game_start', 'queue_id', 'game_duration',
+                      *[column for column, _, _ in participantFields]]
+participantUpdateSql = ', '.join(f'{column} = EXCLUDED.{column}' for column in participantColumns
+                                 if column not in participantKeyColumns)
+participantUpsertSql = f"""
+    INSERT INTO match_participants ({', '.join(participantColumns)})
+    VALUES %s
+    ON CONFLICT ({', '.join(participantKeyColumns)})
+    DO UPDATE SET {participantUpdateSql}
+    """
+
+
+@myLogger
+def createMatchParticipantsTable():
+    """
+    Creates the 'match_participants' table, one typed row per player of every match in 'matches', indexed on
+    (puuid, game_start) so per-summoner queries are index lookups instead of scans over the participant jsonb columns.
+    """
+    fieldColumns = ',\n'.join(f'            {column} {sqlType}' for column, _, sqlType in participantFields)
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS match_participants (
+                matchid text NOT NULL,
+                platform smallint NOT NULL,
+                game_id bigint NOT NULL,
+                participant_index smallint NOT NULL,
+                game_start timestamp NOT NULL,
+                queue_id int,
+                game_duration int,
+{fieldColumns},
+                PRIMARY KEY (platform, game_id, participant_index)
+            );
+            CREATE INDEX IF NOT EXISTS match_participants_puuid_game_start_idx
+                ON match_participants (puuid, game_start DESC);
+            CREATE INDEX IF NOT EXISTS match_participants_matchid_idx ON match_participants (matchid);
+            """)
+        conn.commit()
+
+
+# @myLogger
+def getParticipantRows(matchData):
+    """
+    Convert a match-v5 response into the 'match_participants' rows of its players, in the column order of
+    participantColumns.
+
+    Parameters:
+        matchData (dict): A dictionary containing match data.
+
+    Returns:
+        list: One tuple per participant.
+    """
+    matchid = matchData['metadata']['matchId']
+    platform, gameID = getMatchKey(matchid)
+    gameStart = timestampToDate(matchData['info']['gameStartTimestamp'])
+    queueId = matchData['info'].get('queueId')
+    gameDuration = matchData['info'].get('gameDuration')
+    return [(matchid, platform, gameID, index, gameStart, queueId, gameDuration,
+             *[participant.get(key) for _, key, _ in participantFields])
+            for index, participant in enumerate(matchData['info']['participants'])]
+
+
+@myLogger
+def backfillMatchParticipants(batchSize=1000, onlyMissing=True):
+    """
+    Fills 'match_participants' from the participant jsonb columns of the matches already in the DB.
+
+    The rows are extracted by the DB itself (INSERT ... SELECT), one transaction per batch of matches walked in matchid
+    order, so an interrupted backfill can simply be started again.
+
+    Parameters:
+        batchSize (int): Matches per transaction. Defaults to 1000.
+        onlyMissing (bool): Skip matches that already have participant rows. Defaults to True.
+
+    Returns:
+        int: The number of participant rows written.
+    """
+    participantSelect = ', '.join(f"(p.data ->> '{key}')::{sqlType}" for _, key, sqlType in participantFields)
+    participantValues = ', '.join(f'({i}, m.matchparticipant{i})' for i in range(10))
+    backfillSql = f"""
+    INSERT INTO match_participants ({', '.join(participantColumns)})
+    SELECT m.matchid, m.platform, m.game_id, p.idx, m.datetime, (m.matchinfo ->> 'queueId')::int,
+           (m.matchinfo ->> 'gameDuration')::int, {participantSelect}
+    FROM matches m
+    CROSS JOIN LATERAL (VALUES {participantValues}) AS p (idx, data)
+    WHERE m.matchid = ANY(%s) AND p.data IS NOT NULL
+    ON CONFLICT ({', '.join(participantKeyColumns)})
+    DO UPDATE SET {participantUpdateSql};
+    """
+    batchSql = """
+    SELECT m.matchid
+    FROM matches m
+    WHERE m.matchid > %s
+      AND (NOT %s OR NOT EXISTS (SELECT 1 FROM match_participants mp WHERE mp.matchid = m.matchid))
+    ORDER BY m.matchid
+    LIMIT %s;
+    """
+
+    createMatchParticipantsTable()
+    lastMatchID = ''
+    matchesDone = rowsWritten = 0
+    while True:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(batchSql, (lastMatchID, onlyMissing, batchSize))
+                matchIds = [row[0] for row in cur.fetchall()]
+                if not matchIds:
+                    break
+                cur.execute(backfillSql, (matchIds,))
+                rowsWritten += cur.rowcount
+            conn.commit()
+        lastMatchID = matchIds[-1]
+        matchesDone += len(matchIds)
+        cPrintS(f'{{green}}Backfilled participants of {{cyan}}{matchesDone}{{green}} matches '
+                f'({{cyan}}{rowsWritten}{{green}} rows)')
+    return rowsWritten
+
+
+# Period granularities of 'summoner_period_stats', any date_trunc field works
+periodGranularities = ['week', 'month']
+
+# Recomputes the rollup rows of every (summoner, granularity, period, queue) a list of matches falls into, from the
+# summoner's match_participants rows of that period only. Recomputing (instead of adding the new games) keeps the
+# rollup right when a match is upserted again. Only players in the 'summoners' table get rollup rows.
+periodStatsRefreshSql = """
+WITH keys AS (
+    SELECT DISTINCT mp.puuid, g.granularity, date_trunc(g.granularity, mp.game_start) AS period_start,
+                    COALESCE(mp.queue_id, 0) AS queue_id
+    FROM match_participants mp
+    CROSS JOIN unnest(%(granularities)s::text[]) AS g (granularity)
+    WHERE mp.matchid = ANY(%(matchIds)s) AND mp.puuid IN (SELECT puuid FROM summoners)
+),
+games AS (
+    SELECT k.puuid, k.granularity, k.period_start, k.queue_id, mp.matchid, mp.game_start, mp.win, mp.game_duration,
+           mp.champion_name, mp.kills, mp.deaths, mp.assists,
+           (mp.kills + mp.assists)::numeric / GREATEST(mp.deaths, 1) AS kda
+    FROM keys k
+    JOIN match_participants mp
+      ON mp.puuid = k.puuid
+     AND mp.game_start >= k.period_start
+     AND mp.game_start < k.period_start + ('1 ' || k.granularity)::interval
+     AND COALESCE(mp.queue_id, 0) = k.queue_id
+),
+champions AS (
+    SELECT puuid, granularity, period_start, queue_id, jsonb_object_agg(champion_name, games) AS champion_counts
+    FROM (SELECT puuid, granularity, period_start, queue_id, champion_name, COUNT(*) AS games
+          FROM games
+          GROUP BY puuid, granularity, period_start, queue_id, champion_name) AS c
+    GROUP BY puuid, granularity, period_start, queue_id
+),
+best AS (
+    SELECT DISTINCT ON (puuid, granularity, period_start, queue_id)
+           puuid, granularity, period_start, queue_id, matchid, champion_name, kills, deaths, assists, kda
+    FROM games
+    ORDER BY puuid, granularity, period_start, queue_id, kda DESC, game_start
+),
+totals AS (
+    SELECT puuid, granularity, period_start, queue_id,
+           COUNT(*) FILTER (WHERE win) AS wins,
+           COUNT(*) FILTER (WHERE NOT win) AS losses,
+           COALESCE(SUM(game_duration), 0) AS total_duration
+    FROM games
+    GROUP BY puuid, granularity, period_start, queue_id
+)
+INSERT INTO summoner_period_stats (puuid, granularity, period_start, queue_id, wins, losses, total_duration,
+                                   champion_counts, best_matchid, best_champion_name, best_kills, best_deaths,
+                                   best_assists, best_kda, updated_at)
+SELECT t.puuid, t.granularity, t.period_start, t.queue_id, t.wins, t.losses, t.total_duration, c.champion_counts,
+       b.matchid, b.champion_name, b.kills, b.deaths, b.assists, b.kda, NOW()
+FROM totals t
+JOIN champions c USING (puuid, granularity, period_start, queue_id)
+JOIN best b USING (puuid, granularity, period_start, queue_id)
+ON CONFLICT (puuid, granularity, period_start, queue_id) DO UPDATE SET
+    wins = EXCLUDED.wins,
+    losses = EXCLUDED.losses,
+    total_duration = EXCLUDED.total_duration,
+    champion_counts = EXCLUDED.champion_counts,
+    best_matchid = EXCLUDED.best_matchid,
+    best_champion_name = EXCLUDED.best_champion_name,
+    best_kills = EXCLUDED.best_kills,
+    best_deaths = EXCLUDED.best_deaths,
+    best_assists = EXCLUDED.best_assists,
+    best_kda = EXCLUDED.best_kda,
+    updated_at = NOW();
+"""
+
+
+@myLogger
+def refreshSummonerPeriodStats(cur, matchIds):
+    """
+    Brings the 'summoner_period_stats' rows of the periods a list of matches falls into up to date.
+
+    Runs on the caller's cursor, so the rollup is committed in the same transaction as the matches.
+    """
+    if matchIds:
+        cur.execute(periodStatsRefreshSql, {'matchIds': list(matchIds), 'granularities': periodGranularities})
+
+
+@myLogger
+def rebuildSummonerPeriodStats(batchSize=1000):
+    """
+    Rebuilds 'summoner_period_stats' from scratch out of 'match_participants', e.g. after a new summoner was added or
+    after backfillMatchParticipants.
+
+    The old rows are deleted and the new ones computed in a single transaction, so readers keep seeing the complete
+    old rollup until the rebuild commits, and a failed rebuild leaves it untouched. DELETE is used instead of TRUNCATE,
+    which would lock the readers out for the whole rebuild.
+
+    Parameters:
+        batchSize (int): Matches refreshed per statement. Defaults to 1000.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            SELECT DISTINCT matchid FROM match_participants WHERE puuid IN (SELECT puuid FROM summoners);
+            """)
+            matchIds = [row[0] for row in cur.fetchall()]
+            cur.execute("DELETE FROM summoner_period_stats;")
+            for start in range(0, len(matchIds), batchSize):
+                refreshSummonerPeriodStats(cur, matchIds[start:start + batchSize])
+                cPrintS(f'{{green}}Rebuilt period stats of {{cyan}}{min(start + batchSize, len(matchIds))}{{green}} '
+                        f'of {{cyan}}{len(matchIds)}{{green}} matches')
+        conn.commit()
+
+
+@myLogger
 def upsertMatchData(matchData):
     """
     This function inserts or updates (upserts) match data into the 'matches' table in the database.
@@ -390,81 +658,91 @@ def upsertMatchData(matchData):
 
     Returns:
         bool: True if the operation was successful, False otherwise.
+    """
+    results = upsertMatchDataBatch([matchData])
+    return bool(results) and all(result is True for result in results.values())
 
-    Raises:
-        Exception: If there is an error executing the SQL query.
-        psycopg2.DatabaseError: If there is an error connecting to the database or executing the SQL query.
+
+@myLogger
+def upsertMatchDataBatch(matchDataList, timelines=None):
     """
+    Upserts a list of matches into the 'matches' table, and their players into 'match_participants', in one
+    transaction that also brings the affected 'summoner_period_stats' rollup rows up to date. Timelines given for the
+    matches are written to 'match_timelines' as compact frame arrays in the same transaction.
 
-    sql = """
-    INSERT INTO matches (
-        matchid, datetime, matchmetadata, matchinfo, 
-        matchparticipant0, matchparticipant1, matchparticipant2, matchparticipant3, matchparticipant4, 
-        matchparticipant5, matchparticipant6, matchparticipant7, matchparticipant8, matchparticipant9
-    ) 
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
-    ON CONFLICT (matchid) 
-    DO UPDATE SET 
-        matchid = EXCLUDED.matchid, 
-        datetime = EXCLUDED.datetime, 
-        matchmetadata = EXCLUDED.matchmetadata, 
-        matchinfo = EXCLUDED.matchinfo, 
-        matchparticipant0 = EXCLUDED.matchparticipant0, 
-        matchparticipant1 = EXCLUDED.matchparticipant1, 
-        matchparticipant2 = EXCLUDED.matchparticipant2, 
-        matchparticipant3 = EXCLUDED.matchparticipant3, 
-        matchparticipant4 = EXCLUDED.matchparticipant4, 
-        matchparticipant5 = EXCLUDED.matchparticipant5, 
-        matchparticipant6 = EXCLUDED.matchparticipant6, 
-        matchparticipant7 = EXCLUDED.matchparticipant7, 
-        matchparticipant8 = EXCLUDED.matchparticipant8, 
-        matchparticipant9 = EXCLUDED.matchparticipant9
+    All rows go to the DB in a single multi-row INSERT ... ON CONFLICT statement (psycopg2.extras.execute_values), and
+    the transaction is committed once, so a backfill pays one commit per batch instead of one per match. If the
+    statement fails because of a bad row, the batch is retried row by row under savepoints, so only the bad rows are
+    left out and reported.
+
+    Parameters:
+        matchDataList (list): A list of match-v5 match dictionaries.
+        timelines (dict, optional): Match ID -> match-v5 timeline, for any of the matches. Defaults to None.
+
+    Returns:
+        dict: Match ID -> True if the match was upserted, or the error message if it was not.
     """
-    conn = None
+    from timelines import getTimelineRow, timelineUpsertSql  # numpy, only needed by the writers
+
+    results = {}
+    rows = {}
+    participantRows = {}
+    timelineRows = {}
+    for matchID, timelineData in (timelines or {}).items():
+        try:
+            timelineRows[matchID] = getTimelineRow(matchID, timelineData)
+        except (KeyError, TypeError, ValueError) as error:
+            log.warning('Skipping the invalid timeline of match %s: %r', matchID, error)
+    for matchData in matchDataList:
+        try:
+            matchRow = getMatchRow(matchData)
+            rows[matchRow[0]] = matchRow  # a match listed twice is written once, ON CONFLICT can't touch a row twice
+            participantRows[matchRow[0]] = getParticipantRows(matchData)
+        except (KeyError, TypeError, ValueError) as error:
+            matchID = (matchData.get('metadata') or {}).get('matchId') if isinstance(matchData, dict) else None
+            results[matchID] = f'Invalid match data: {error!r}'
+    if not rows:
+        return results
+
     try:
-        conn = connect_db()  # Assuming you have a predefined function for database connection
-        cur = conn.cursor()
-
-        # Extract the relevant data from the matchData dictionary
-        matchid = matchData['metadata']['matchId']
-        matchDateTime = timestampToDate(matchData['info']['gameStartTimestamp'])
-        matchMetadata = json.dumps(matchData['metadata'])
-        matchInfo = matchData['info'].copy()
-        if 'participants' in matchInfo:
-            del matchInfo['participants']
-        matchInfo = json.dumps(matchInfo)
-
-        # Extract the participant data
-        participants = matchData['info']['participants']
-        participant0 = json.dumps(participants[0]) if len(participants) > 0 else None
-        participant1 = json.dumps(participants[1]) if len(participants) > 1 else None
-        participant2 = json.dumps(participants[2]) if len(participants) > 2 else None
-        participant3 = json.dumps(participants[3]) if len(participants) > 3 else None
-        participant4 = json.dumps(participants[4]) if len(participants) > 4 else None
-        participant5 = json.dumps(participants[5]) if len(participants) > 5 else None
-        participant6 = json.dumps(participants[6]) if len(participants) > 6 else None
-        participant7 = json.dumps(participants[7]) if len(participants) > 7 else None
-        participant8 = json.dumps(participants[8]) if len(participants) > 8 else None
-        participant9 = json.dumps(participants[9]) if len(participants) > 9 else None
-
-        # Execute the upsert operation
-        cur.execute(sql, (
-            matchid, matchDateTime, matchMetadata, matchInfo,
-            participant0, participant1, participant2, participant3, participant4,
-            participant5, participant6, participant7, participant8, participant9
-        ))
-        conn.commit()
-        cPrint(f"Match {matchid} upserted successfully.", 'green')
-        return True
+        ensureMatchPartitions(row[1] for row in rows.values())
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    upserted = psycopg2.extras.execute_values(cur, matchBulkUpsertSql, list(rows.values()),
+                                                              page_size=len(rows), fetch=True)
+                    psycopg2.extras.execute_values(cur, participantUpsertSql,
+                                                   [row for matchID in rows for row in participantRows[matchID]],
+                                                   page_size=10 * len(rows))
+                    psycopg2.extras.execute_values(cur, timelineUpsertSql,
+                                                   [timelineRows[matchID] for matchID in rows if matchID in timelineRows])
+                    results.update({row[0]: True for row in upserted})
+                    refreshSummonerPeriodStats(cur, rows)
+                except ps.DatabaseError as error:
+                    log.warning('Bulk match upsert failed (%s), retrying the batch row by row', error)
+                    conn.rollback()
+                    for matchID, matchRow in rows.items():
+                        cur.execute('SAVEPOINT match_upsert')
+                        try:
+                            cur.execute(matchUpsertSql, matchRow)
+                            psycopg2.extras.execute_values(cur, participantUpsertSql, participantRows[matchID])
+                            if matchID in timelineRows:
+                                psycopg2.extras.execute_values(cur, timelineUpsertSql, [timelineRows[matchID]])
+                            results[matchID] = True
+                        except ps.DatabaseError as rowError:
+                            cur.execute('ROLLBACK TO SAVEPOINT match_upsert')
+                            results[matchID] = str(rowError)
+                    refreshSummonerPeriodStats(cur, [matchID for matchID in rows if results[matchID] is True])
+            conn.commit()
+        upsertedCount = sum(result is True for result in results.values())
+        log.debug('%s of %s matches upserted', upsertedCount, len(matchDataList))
     except (Exception, ps.DatabaseError) as error:
-        cPrint(f"Error upserting Match data: {error}", 'red')
-        return False
-    finally:
-        if conn is not None:
-            conn.close()
+        log.error('Error upserting match data: %s', error)
+        results.update({matchID: str(error) for matchID in rows})
+    return results
 
 
-# @myLogger
+@myLogger
 def getMatchIdsFromDB():
     """
     Fetches all match IDs from the 'matches' table in the database.
@@ -476,19 +754,55 @@ def getMatchIdsFromDB():
     Returns:
         list: A list of match IDs from the 'matches' table.
     """
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute("SELECT matchID FROM matches;")
-    matchesList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch all match IDs
+            cur.execute("SELECT matchID FROM matches;")
+            matchesList = [row[0] for row in cur.fetchall()]
     return matchesList
 
 
-# @myLogger
+# HTTP statuses that will not change on a retry. Only these are logged to 'upsert_errors', which
+# findMissingMatchesInDB skips; 429s, 5xx and DB errors are left to be retried by the next sync.
+permanentErrorCodes = (400, 403, 404)
+
+
+@myLogger
+def findMissingMatchesInDB(matchesList, skipKnownErrors=True):
+    """
+    Returns the match IDs from matchesList that are not in the 'matches' table, computed by the DB.
+
+    The candidate IDs are sent as one array parameter and anti-joined against 'matches' (and 'upsert_errors', so
+    matches that failed with a permanent status are skipped) on their primary keys, so the cost depends on the number
+    of candidates and not on the size of the table. Errors with other codes, like 429s and 5xx logged by older
+    versions, don't hide a match, so it is retried.
+
+    Parameters:
+        matchesList (list): The candidate match IDs.
+        skipKnownErrors (bool): Also leave out match IDs logged in 'upsert_errors' with one of permanentErrorCodes.
+            Defaults to True.
+
+    Returns:
+        list: The missing match IDs, in the order of matchesList.
+    """
+    sql = """
+    SELECT c.matchid
+    FROM unnest(%s::text[]) WITH ORDINALITY AS c (matchid, ord)
+    WHERE NOT EXISTS (SELECT 1 FROM matches m WHERE m.matchid = c.matchid)
+      AND (NOT %s OR NOT EXISTS (SELECT 1 FROM upsert_errors e
+                                 WHERE e.matchid = c.matchid AND e.errorcode::text = ANY(%s)))
+    ORDER BY c.ord;
+    """
+    candidates = list(dict.fromkeys(matchesList))  # drop duplicates, keep the order
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (candidates, skipKnownErrors, [str(code) for code in permanentErrorCodes]))
+            missingMatches = [row[0] for row in cur.fetchall()]
+    log.info('Missing matches: %s out of %s candidates', len(missingMatches), len(candidates))
+    return missingMatches
+
+
+@myLogger
 def getChampionsFromDB():
     """
     Fetches all match IDs from the 'matches' table in the database.
@@ -500,15 +814,11 @@ def getChampionsFromDB():
     Returns:
         list: A list of match IDs from the 'matches' table.
     """
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute("SELECT championname FROM champions;")
-    matchesList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch all match IDs
+            cur.execute("SELECT championname FROM champions;")
+            matchesList = [row[0] for row in cur.fetchall()]
     return matchesList
 
 
@@ -525,26 +835,27 @@ def getSummonerNamesFromDB(lower=False):
     Returns:
         list: A list of summoner names from the 'summoners' table.
     """
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute("""
-    SELECT name FROM summoners
-    WHERE name = 'Xavron' OR name = 'ShaiBY' OR name = 'GuySun';
-    """)
+    sql = """
+            SELECT name FROM summoners
+            WHERE name = 'Xavron' OR name = 'ShaiBY' OR name = 'GuySun';
+            """
+    if analyticsStore is not None:
+        rows = analyticsStore.fetchall(sql)
+    else:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Fetch all match IDs
+                cur.execute(sql)
+                rows = cur.fetchall()
     if lower:
-        summonerList = [row[0].lower() for row in cur.fetchall()]
+        summonerList = [row[0].lower() for row in rows]
     else:
-        summonerList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+        summonerList = [row[0] for row in rows]
     return summonerList
 
 
-# @myLogger
-def getAllSummonerMatches(puuid, region='europe', start=0, count=100):
+@myLogger
+def getAllSummonerMatches(puuid, region='europe', start=0, count=100, startTime=None, returnComplete=False):
     """
     Retrieves matches for a summoner identified by their PUUID.
 
@@ -553,21 +864,22 @@ def getAllSummonerMatches(puuid, region='europe', start=0, count=100):
         region (str): The region where the summoner plays. Defaults to 'europe'.
         start (int): The starting index for fetching matches. Defaults to 0.
         count (int): The number of matches to fetch in each batch. Defaults to 100.
+        startTime (int, optional): Only return matches started at or after this epoch timestamp in seconds.
+            Defaults to None (the whole history).
+        returnComplete (bool): Also return whether every page was listed. Defaults to False.
 
     Returns:
-        list: A list of all summoner matches IDS
+        list: A list of all summoner matches IDS. A page that failed ends the listing, so the list can be partial.
+        With returnComplete, a tuple (match IDs, False if a page failed).
     """
 
-    # Construct the URL for fetching matches
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
-
     matches = []  # List to store the match data
-    cPrintS(f'')
+    complete = True
     while True:
-        params = {"start": start, "count": count}
-        response = request(url, params=params, headers=requestHeaders)  # Make a request to the API
+        response = riotClient.getMatchIdsByPuuid(puuid, start=start, count=count, startTime=startTime,
+                                                 region=region)  # Make a request to the API
 
-        if response.status_code == 200:
+        if getattr(response, 'status_code', None) == 200:
             # Successful request
             data = response.json()
             if not data:  # No more data to fetch
@@ -575,16 +887,122 @@ def getAllSummonerMatches(puuid, region='europe', start=0, count=100):
             matches.extend(data)  # Add fetched data to the matches list
             start += count  # Increment the starting index for the next batch
             # Print the first and last matches added to keep track of progress
-            cPrintS(
-                f'{{white}}First match for this batch: {{cyan}}{data[0]} , {{white}}Last match for this batch: {{cyan}}{data[-1]}')
-            cPrintS(f'{{green}} Until now {{cyan}}{len(matches)} {{green}}matches have been fetched successfully :D')
+            log.debug('Fetched match IDs %s to %s, %s so far', data[0], data[-1], len(matches))
+            if len(data) < count:  # A short page is the last one
+                break
         else:
-            # Handle other HTTP Errors
-            cPrint(f'HTTP Error {response.status_code}: {response.text}', 'red')
-    return matches
+            # Handle other HTTP Errors, the request function already retried what could be retried
+            log.error('HTTP error %s: %s', getattr(response, 'status_code', response), getattr(response, 'text', ''))
+            complete = False
+            break
+    return (matches, complete) if returnComplete else matches
 
 
-# @myLogger
+@myLogger
+def createSummonerSyncStateTable():
+    """
+    Creates the 'summoner_sync_state' table, which keeps the newest ingested gameStartTimestamp (the high-water mark
+    of the incremental match sync) per summoner puuid.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS summoner_sync_state (
+                puuid text PRIMARY KEY,
+                last_game_start_timestamp bigint NOT NULL,
+                updated_at timestamp NOT NULL DEFAULT NOW()
+            );
+            """)
+        conn.commit()
+
+
+@myLogger
+def getSummonerSyncHighWaterMark(puuid):
+    """
+    Returns the gameStartTimestamp (epoch milliseconds) of the newest match ingested for a summoner, or None if the
+    summoner was never synced.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT last_game_start_timestamp FROM summoner_sync_state WHERE puuid = %s;", (puuid,))
+            row = cur.fetchone()
+    return row[0] if row else None
+
+
+@myLogger
+def updateSummonerSyncHighWaterMark(puuid):
+    """
+    Moves the high-water mark of a summoner to the newest gameStartTimestamp of their matches in the 'matches' table.
+    The mark never moves backwards.
+    """
+    sql = """
+    INSERT INTO summoner_sync_state (puuid, last_game_start_timestamp, updated_at)
+    SELECT %s, MAX((matchinfo ->> 'gameStartTimestamp')::bigint), NOW()
+    FROM matches
+    WHERE matchmetadata -> 'participants' @> %s::jsonb
+    HAVING MAX((matchinfo ->> 'gameStartTimestamp')::bigint) IS NOT NULL
+    ON CONFLICT (puuid) DO UPDATE SET
+        last_game_start_timestamp = GREATEST(summoner_sync_state.last_game_start_timestamp,
+                                             EXCLUDED.last_game_start_timestamp),
+        updated_at = NOW();
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (puuid, json.dumps([puuid])))
+        conn.commit()
+
+
+@myLogger
+def syncSummonerMatches(puuid, region='europe'):
+    """
+    Incrementally syncs a summoner's matches into the DB.
+
+    Only the match IDs started since the summoner's high-water mark are requested (match-v5 'startTime'), so a routine
+    refresh is a single API page no matter how long the history is. A summoner without a high-water mark gets a full
+    history sync. The mark is moved forward only if every page of the listing was fetched and no match failed with a
+    retryable error (rate limit, server or network error), so those matches are requested again on the next sync.
+
+    Parameters:
+    - puuid (str): The PUUID of the summoner.
+    - region (str): The region where the summoner plays. Defaults to 'europe'.
+
+    Returns:
+    dict: The ingestion stats of upsertListOfMatches, or None if there was nothing new to ingest
+    """
+    highWaterMark = getSummonerSyncHighWaterMark(puuid)
+    if highWaterMark is None:
+        log.info('No sync state for %s, syncing full history', getSummonerNameFromPuuid(puuid))
+        matchesList, listingComplete = getAllSummonerMatches(puuid, region=region, returnComplete=True)
+    else:
+        matchesList, listingComplete = getAllSummonerMatches(puuid, region=region, startTime=highWaterMark // 1000,
+                                                             returnComplete=True)
+        log.info('Found %s matches for %s since %s', len(matchesList), getSummonerNameFromPuuid(puuid),
+                 timestampToDate(highWaterMark))
+
+    stats = upsertListOfMatches(matchesList) if matchesList else None
+    retryableFailures = [matchID for matchID, error in (stats or {}).get('failed', {}).items()
+                         if not isinstance(error, int) or error == 429 or error >= 500]
+    if not listingComplete:
+        log.warning('Keeping the sync state of %s, the match listing failed before its last page and will be '
+                    'retried on the next sync', getSummonerNameFromPuuid(puuid))
+    elif retryableFailures:
+        log.warning('Keeping the sync state of %s, %s matches failed and will be retried on the next sync',
+                    getSummonerNameFromPuuid(puuid), len(retryableFailures))
+    else:
+        updateSummonerSyncHighWaterMark(puuid)
+    return stats
+
+
+@myLogger
+def syncAllSummonersMatches(region='europe'):
+    """
+    Incrementally syncs the matches of every summoner in the config 'puuids' list.
+    """
+    for puuid in getDataFromConfig(key='puuids'):
+        syncSummonerMatches(puuid, region=region)
+
+
+@myLogger
 def get50LatestSummonerMatches(puuid, region='europe'):
     """
     Retrieves the latest matches for a given summoner based on their unique identifier (puuid) and region.
@@ -597,76 +1015,40 @@ def get50LatestSummonerMatches(puuid, region='europe'):
     - dict or int: A dictionary of match details if the response status code is 200, otherwise the response status code.
     """
 
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
-
-    params = {
-        "start": 0,
-        "count": 50,
-    }
-    response = request(url, params=params, headers=requestHeaders)
+    response = riotClient.getMatchIdsByPuuid(puuid, start=0, count=50, region=region)
 
     return response.json()
 
 
-# @myLogger
-def upsertListOfMatches(matchesList):
+@myLogger
+def upsertListOfMatches(matchesList, concurrency=None):
     """
     A function that checks for missing IDs in the DB, retrieves their data, and upserts it.
 
+    The missing matches are handed to the concurrent ingestion pipeline in ingest.py, which fetches them with
+    bounded concurrency and writes them to the DB in batches.
+
     Parameters:
     - matchesList: a list of matches to be checked
+    - concurrency: the number of concurrent match fetchers, defaults to the 'Ingestion' config section
 
     Returns:
-    None
+    dict: The ingestion stats, or None if no matches were missing
     """
+    from ingest import ingestMatches  # ingest imports this module
 
-    cPrint('Checking what IDS are missing from DB and inserting...', 'yellow')
-    matchIdsFromDB = getMatchIdsFromDB()
-    missingMatches = findMissingMatches(getMatchIdsFromDB(), matchesList)
-    if matchIdsFromDB == 'empty':
-        cPrint('Adding all matches from list (DB is empty)', 'yellow')
-    elif len(missingMatches) == 0:
-        cPrint('No missing matches found (The DB is updated with latest Summoner Matches!)', 'green')
-        cPrint('Exiting...', 'green')
+    missingMatches = findMissingMatchesInDB(matchesList)
+    if len(missingMatches) == 0:
+        log.info('No missing matches found, the DB is up to date with the latest summoner matches')
         return None
-    else:
-        matchesList = missingMatches
-    matchesAdded = 0
-    requestCount = 0
-    for matchid in matchesList:
-        try:
-            while True:
-                cPrint(f'Match ID:{matchid}', 'cyan')
-                matchData = getMatchData(matchid)
-                requestCount += 1
-                if type(matchData) is dict:
-                    matchUpserted = upsertMatchData(matchData)
-                    if matchUpserted:
-                        cPrintS(f'{{green}}Added Match ID {{cyan}}{matchid}')
-                        matchesAdded += 1
-                        cPrintS(
-                            f'{{green}}Matches Added till now: {{cyan}}{matchesAdded}{{green}} out of{{cyan}} {len(missingMatches)}{{green}} matches')
-                        break  # Successfully processed the match, break the while loop to move to the next match
-                else:
-                    cPrint(
-                        f'Match {matchid} Data could not be found, skipping... {len(missingMatches) - requestCount} Matches Left',
-                        'yellow')
-                    upsertErrorToDB(matchid, matchData)
-                    break  # If there's no data, and it's not a rate limit, move to the next match
-        except Exception as e:
-            errorCode = getattr(e, 'obj', None)
-            if errorCode is not None:
-                cPrintS(
-                    f"{{yellow}}Error processing match {{cyan}} {matchid}, {{red}}Request couldn't find the Match Data\n"
-                    f"{e}:(Cant .json() because error code was returned instead of matchData {{cyan}}")
-                upsertErrorToDB(matchid, errorCode)
-                continue  # Skip to the next match ID
 
-    cPrintS(
-        f'{{green}}Finished! Matches Added: {{cyan}}{matchesAdded}{{green}} out of {{cyan}}{len(missingMatches)}{{green}} matches found')
+    stats = asyncio.run(ingestMatches(missingMatches, concurrency=concurrency))
+    log.info('Finished, %s of %s missing matches added (%.2f matches/sec)', stats['upserted'], len(missingMatches),
+             stats['matchesPerSecond'])
+    return stats
 
 
-# @myLogger
+@myLogger
 def upsertErrorToDB(match_id, error_code):
     """
     Upserts an error log into the public.upsert_errors table with validation
@@ -674,7 +1056,7 @@ def upsertErrorToDB(match_id, error_code):
 
     Parameters:
     - match_id (str): The ID of the match.
-    - error_code (int): The error code encountered during the upsert attempt.
+    - error_code (int): The HTTP status of the failed fetch, one of permanentErrorCodes.
     - db_params (dict): Database connection parameters including dbname, user, password, and host.
     """
     # SQL command to check for existing matchid with the same error code
@@ -695,42 +1077,32 @@ def upsertErrorToDB(match_id, error_code):
         errorcode = EXCLUDED.errorcode;
     """
 
-    # Establish a connection to the database
-    conn = None
-    cur = None  # Initialize cur to None
+    # Borrow a connection from the pool, an uncommitted transaction is rolled back when it is returned
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-
-        # Check if the error for the match ID already exists
-        cur.execute(check_sql, (match_id, error_code))
-        exists = cur.fetchone()[0]
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Check if the error for the match ID already exists
+                cur.execute(check_sql, (match_id, error_code))
+                exists = cur.fetchone()[0]
+
+                if exists:
+                    log.debug('Match ID %s with error code %s is already logged', match_id, error_code)
+                else:
+                    # Current timestamp
+                    now = datetime.now()
 
-        if exists:
-            cPrintS(f"{{green}}Match ID {match_id} with error code {error_code} is already logged.")
-        else:
-            # Current timestamp
-            now = datetime.now()
+                    # Execute the upsert
+                    cur.execute(upsert_sql, (match_id, now, error_code))
 
-            # Execute the upsert
-            cur.execute(upsert_sql, (match_id, now, error_code))
+                    # Commit the transaction
+                    conn.commit()
 
-            # Commit the transaction
-            conn.commit()
-
-            cPrintS(f"{{yellow}}Upsert error for match ID {match_id} logged successfully.")
+                    log.info('Upsert error %s of match ID %s logged', error_code, match_id)
     except Exception as e:
-        print(f"An error occurred: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+        log.error('Error logging the upsert error of match ID %s: %s', match_id, e)
 
 
-# @myLogger
+@myLogger
 def getErrorMatchesFromDB():
     """
     Fetches all match IDs from the 'matches' table in the database.
@@ -742,80 +1114,88 @@ def getErrorMatchesFromDB():
     Returns:
         list: A list of match IDs from the 'matches' table.
     """
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute("SELECT matchid FROM upsert_errors;")
-    matchesList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch all match IDs
+            cur.execute("SELECT matchid FROM upsert_errors;")
+            matchesList = [row[0] for row in cur.fetchall()]
     return matchesList
 
 
-# @myLogger
+# The participant fields of the match analysis: column name, match-v5 participant key
+matchAnalysisFields = [
+    ('puuid', 'puuid'),
+    ('summoner_name', 'summonerName'),
+    ('champion_name', 'championName'),
+    ('assists', 'assists'),
+    ('assist_me_pings', 'assistMePings'),
+    ('total_chmp_dmg_dealt', 'totalDamageDealtToChampions'),
+    ('chmp_magic_dmg_dealt', 'magicDamageDealtToChampions'),
+    ('chmp_physical_dmg_dealt', 'physicalDamageDealtToChampions'),
+    ('true_dmg_dealt', 'trueDamageDealtToChampions'),
+    ('total_dmg_taken', 'totalDamageTaken'),
+    ('deaths', 'deaths'),
+    ('gold_earned', 'goldEarned'),
+    ('gold_spent', 'goldSpent'),
+    ('kills', 'kills'),
+    ('wards_placed', 'wardsPlaced'),
+    ('wards_killed', 'wardsKilled'),
+]
+
+
+@myLogger
 def getSummonerMatchDataFromDB(matchID, summonerIndex):
     """
     Retrieves specific match data for a summoner from a PostgreSQL database.
     With the data from this function it is possible to plot the correlation matrix and more analysis
 
     Parameters:
-    - matchID: int, the ID of the match to retrieve data for
+    - matchID: str or int, the match ID ('EUW1_6907242392') or the bare game ID of an EUW1 match
     - summonerIndex: int, the index of the summoner in the match data
 
     Returns:
     - DataFrame: contains various match data for the specified summoner
     """
 
-    connectionString = getDataFromConfig(key='Database')['ConnectionString']
+    import pandas as pd  # loaded on first use, so importing this module stays light
+
+    platform, gameID = getMatchKey(matchID)
 
-    if matchID.startswith("EUW1_"):
-        matchID = matchID.replace("EUW1_", "", 1)
+    if analyticsStore is not None:
+        # The mirror keeps each participant as JSON text, decoded here the way psycopg2 decodes the jsonb fields
+        rows = analyticsStore.fetchall(f"""
+        SELECT matchparticipant{summonerIndex} FROM matches WHERE platform = ? AND game_id = ?;
+        """, [platform, gameID])
+        participants = [json.loads(row[0]) if row[0] is not None else {} for row in rows]
+        return pd.DataFrame([[participant.get(key) for _, key in matchAnalysisFields] for participant in participants],
+                            columns=[column for column, _ in matchAnalysisFields])
 
-    engine = create_engine(connectionString)
+    engine = getEngine()
 
+    fieldsSql = ',\n'.join(f"        m.matchparticipant{summonerIndex} -> '{key}' as {column}"
+                           for column, key in matchAnalysisFields)
     query = f"""
 SELECT 
-        m.matchparticipant{summonerIndex} -> 'puuid' as puuid,
-        m.matchparticipant{summonerIndex} -> 'summonerName' as summoner_name,
-        m.matchparticipant{summonerIndex} -> 'championName' as champion_name,
-        m.matchparticipant{summonerIndex} -> 'assists' as assists,
-        m.matchparticipant{summonerIndex} -> 'assistMePings' as assist_me_pings,
-        m.matchparticipant{summonerIndex} -> 'totalDamageDealtToChampions' as total_chmp_dmg_dealt,
-        m.matchparticipant{summonerIndex} -> 'magicDamageDealtToChampions' as chmp_magic_dmg_dealt,
-        m.matchparticipant{summonerIndex} -> 'physicalDamageDealtToChampions' as chmp_physical_dmg_dealt,
-        m.matchparticipant{summonerIndex} -> 'trueDamageDealtToChampions' as true_dmg_dealt,
-        m.matchparticipant{summonerIndex} -> 'totalDamageTaken' as total_dmg_taken,
-        m.matchparticipant{summonerIndex} -> 'deaths' as deaths,
-        m.matchparticipant{summonerIndex} -> 'goldEarned' as gold_earned,
-        m.matchparticipant{summonerIndex} -> 'goldSpent' as gold_spent,
-        m.matchparticipant{summonerIndex} -> 'kills' as kills,
-        m.matchparticipant{summonerIndex} -> 'wardsPlaced' as wards_placed,
-        m.matchparticipant{summonerIndex} -> 'wardsKilled' as wards_killed
+{fieldsSql}
 FROM matches as m
-WHERE (m.matchinfo ->> 'gameId') :: bigint = {matchID}
+WHERE m.platform = %(platform)s AND m.game_id = %(gameId)s
 """
-    return pd.read_sql_query(query, engine)
+    return pd.read_sql_query(query, engine, params={'platform': platform, 'gameId': gameID})
 
 
-# @myLogger
+@myLogger
 def getMatchDataFromDB(matchID):
-    # Connect to the database using your connect_db function
-    conn = connect_db()
-
-    # Cursor with dictionary fetch mode
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    # Execute the query
-    cursor.execute("""
-    SELECT * FROM matches WHERE matchid = %s
-    """, (matchID,))
-
-    # Fetch one result
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    # Borrow a connection from the pool
+    with getConnection() as conn:
+        # Cursor with dictionary fetch mode
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            # Execute the query
+            cursor.execute("""
+            SELECT * FROM matches WHERE matchid = %s
+            """, (matchID,))
+
+            # Fetch one result
+            result = cursor.fetchone()
 
     if result:
         # Constructing the matchData dictionary from the result
@@ -839,26 +1219,33 @@ def getMatchDataFromDB(matchID):
         return None
 
 
-# @myLogger
+@myLogger
 def getMatchKnownParticipantsIndex(matchID):
     configPuuids = getDataFromConfig(key='puuids')
     summonersFound = 0
 
-    df = getMatchDataFromDB(matchID)
+    # A primary key lookup on match_participants instead of loading and scanning the whole match
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            SELECT puuid, participant_index
+            FROM match_participants
+            WHERE matchid = %s AND puuid = ANY(%s)
+            ORDER BY participant_index;
+            """, (matchID, configPuuids))
+            knownParticipants = cur.fetchall()
+
     participantsIndexes = {}
-    for i, participant in enumerate(df['matchmetadata']["participants"]):
-        if participant in configPuuids:
-            summonersFound += 1
-            participantsIndexes[participant] = i
-            cPrintS(
-                f'{{green}}Found Summoner puuid: {{cyan}}{participant} {{green}}at index{{cyan}} {i} {{green}}and '
-                f'added to result dict')
-    cPrintS(f'{{green}}Found total of {{cyan}}{summonersFound}{{green}} summoners in match {{cyan}}{matchID}')
+    for participant, i in knownParticipants:
+        summonersFound += 1
+        participantsIndexes[participant] = i
+        log.debug('Found summoner %s at participant index %s', participant, i)
+    log.debug('Found %s summoners in match %s', summonersFound, matchID)
     return participantsIndexes
 
 
-@st.cache_resource
-# @myLogger
+# Cached with st.cache_resource by app.py
+@myLogger
 def getLastNMatchIDSOfSummonerFromDB(summonerName, n=3):
     """
     A function to retrieve the last N match IDs of a summoner from the database.
@@ -871,37 +1258,102 @@ def getLastNMatchIDSOfSummonerFromDB(summonerName, n=3):
     - list of str: a list of the last N match IDs of the summoner
     """
 
+    import pandas as pd  # loaded on first use, so importing this module stays light
+
     summonerPuuid = getDetailsFromSummonerName(summonerName)
 
-    engine = create_engine(getDataFromConfig(key='Database')['ConnectionString'])
-    query = f"""
+    if analyticsStore is not None:
+        rows = analyticsStore.fetchall("""
+        SELECT matchid FROM match_participants WHERE puuid = ? ORDER BY game_start DESC LIMIT ?;
+        """, [summonerPuuid, n])
+        return [row[0] for row in rows]
+
+    engine = getEngine()
+    # The last games are looked for in the recent monthly partitions first (the datetime bound prunes the older ones),
+    # and in the whole table only for a summoner who did not play n games in that window
+    query = """
    SELECT m.matchID
     FROM matches m
-    WHERE m.matchmetadata -> 'participants' @> '["{summonerPuuid}"]'::jsonb
+    WHERE m.matchmetadata -> 'participants' @> %(participants)s::jsonb
+      AND m.datetime >= %(since)s
     ORDER BY datetime desc
-    limit {n};
+    limit %(n)s;
 
      """
-    queryResponse = pd.read_sql_query(query, engine)
-    return queryResponse.iloc[:, 0].tolist()
+    params = {'participants': json.dumps([summonerPuuid]), 'since': getMonthStart(offset=-2), 'n': n}
+    matchIds = pd.read_sql_query(query, engine, params=params).iloc[:, 0].tolist()
+    if len(matchIds) < n:
+        params['since'] = datetime(1970, 1, 1)
+        matchIds = pd.read_sql_query(query, engine, params=params).iloc[:, 0].tolist()
+    return matchIds
+
+
+def getStartAndChampionFromMatchColumns(matchID, summonerPuuid):
+    """
+    Reads a summoner's game start (epoch ms) and champion from the matchparticipantN columns of 'matches', for a match
+    that has no 'match_participants' rows yet.
+
+    Returns:
+        tuple or None: (game start timestamp in ms, champion name), None if the match or the summoner isn't found.
+    """
+    columns = ', '.join(f'matchparticipant{i}' for i in range(10))
+    if analyticsStore is not None:
+        rows = analyticsStore.fetchall(f"""
+        SELECT epoch_ms(datetime), participants, {columns} FROM matches WHERE matchid = ?;
+        """, [matchID])
+        row = rows[0] if rows else None
+    else:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                SELECT (EXTRACT(EPOCH FROM datetime) * 1000)::bigint, matchmetadata -> 'participants', {columns}
+                FROM matches
+                WHERE matchid = %s;
+                """, (matchID,))
+                row = cur.fetchone()
+    if row is None:
+        return None
+    # The DuckDB mirror returns the JSON columns as strings
+    participants = json.loads(row[1]) if isinstance(row[1], str) else row[1]
+    if summonerPuuid not in (participants or []):
+        return None
+    participant = row[2 + participants.index(summonerPuuid)]
+    participant = json.loads(participant) if isinstance(participant, str) else participant
+    return row[0], participant['championName']
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getGameStartTimestampAndSummonerChampionName(matchID, summonerName):
     summonerPuuid = getDetailsFromSummonerName(summonerName)
-    knownMatchParticipants = getMatchKnownParticipantsIndex(matchID)
-    summonerIndex = knownMatchParticipants[summonerPuuid]
-    df = getMatchDataFromDB(matchID)
-    matchID = df['matchmetadata']['matchId']
-    matchStartTimestampStr = timestampToDate(df['matchinfo']['gameStartTimestamp'], convert=True)
+    if analyticsStore is not None:
+        rows = analyticsStore.fetchall("""
+        SELECT epoch_ms(game_start), champion_name FROM match_participants WHERE matchid = ? AND puuid = ?;
+        """, [matchID, summonerPuuid])
+        row = rows[0] if rows else None
+    else:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                SELECT (EXTRACT(EPOCH FROM game_start) * 1000)::bigint, champion_name
+                FROM match_participants
+                WHERE matchid = %s AND puuid = %s;
+                """, (matchID, summonerPuuid))
+                row = cur.fetchone()
+    if row is None:
+        # Not backfilled into match_participants yet, read the participant JSON of the match itself
+        row = getStartAndChampionFromMatchColumns(matchID, summonerPuuid)
+    if row is None:
+        raise LookupError(f'Match {matchID} has no participant data for {summonerName}, run '
+                          f'"python manage.py backfill-participants" if the match is in the DB')
+    gameStartTimestamp, summonerChampionPlayed = row
+    matchStartTimestampStr = timestampToDate(gameStartTimestamp, convert=True)
     matchStartTimestamp = datetime.strptime(matchStartTimestampStr, '%Y-%m-%d %H:%M:%S')
     matchStartDate = matchStartTimestamp.strftime('%d/%m/%y %H:%H')
-    summonerChampionPlayed = df['participants'][summonerIndex]['championName']
     return matchID, matchStartDate, summonerChampionPlayed
 
 
-# @myLogger
+@myLogger
 def downloadChampionIcons():
     """
     Downloads missing League of Legends champion icons based on the current list of champions in the database.
@@ -926,8 +1378,7 @@ def downloadChampionIcons():
     # Download icons for champions not in the existingChampions list
     for champion in championList:
         if champion not in existingChampions:
-            iconURL = f'http://ddragon.leagueoflegends.com/cdn/{gameVersion}/img/champion/{champion}.png'
-            response = request(url=iconURL)
+            response = riotClient.getDdragonChampionIcon(gameVersion, champion)
             if response.status_code == 200:
                 with open(f'championIcons/{champion}.png', 'wb') as f:
                     f.write(response.content)
@@ -948,43 +1399,39 @@ def downloadChampionIcons():
         cPrintS('{{green}}All champion icons are up-to-date.')
 
 
-# @myLogger
+@myLogger
 def upsertChampionLinksToDB(championsLinks):
     """
     Upsert links for champions in the PostgreSQL database.
 
     :param championsLinks: A dictionary with champion names as keys and their links as values.
     """
-    conn = None
+    # SQL for upserting the champion link to db from the dictionary
+    upsert_sql = """
+    UPDATE champions
+    SET "iconLink" = v.link
+    FROM (VALUES %s) AS v (link, championName)
+    WHERE champions.championName = v.championName
+    """
+
     try:
-        # Connect to the PostgreSQL database
-        conn = connect_db()
-        cur = conn.cursor()
-
-        # SQL for upserting the champion link to db from the dictionary
-        upsert_sql = """
-        UPDATE champions
-        SET "iconLink" = %s
-        WHERE championName = %s
-        """
-
-        # Execute the upsert command for each champion
-        for champion, link in championsLinks.items():
-            cur.execute(upsert_sql, (link, champion))
-
-        # Commit the changes
-        conn.commit()
+        # Borrow a connection from the pool
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                # Execute the upsert command for all champions in one statement
+                psycopg2.extras.execute_values(cur, upsert_sql,
+                                               [(link, champion) for champion, link in championsLinks.items()])
+
+            # Commit the changes
+            conn.commit()
 
         print("Champion links have been upserted successfully.")
 
     except (Exception, ps.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
 
 
-# @myLogger
+@myLogger
 def getSummonerRankedSoloData(summonerID):
     """
     Retrieves the ranked stats of a summoner from the Riot Games API.
@@ -1006,11 +1453,8 @@ def getSummonerRankedSoloData(summonerID):
     """
 
     rankedSoloData = {}
-    # Construct the URL for fetching ranked stats
-    rankedStatsURL = f"https://euw1.api.riotgames.com/lol/league/v4/entries/by-summoner/{summonerID}"
-
     # Send a GET request to the API
-    response = request(rankedStatsURL, headers=requestHeaders)
+    response = riotClient.getLeagueEntriesBySummoner(summonerID)
 
     # Convert the response to JSON format
     rankedStatsData = response.json()
@@ -1023,7 +1467,7 @@ def getSummonerRankedSoloData(summonerID):
     return rankedSoloData
 
 
-# @myLogger
+@myLogger
 def getSummonerSoloDuoRank(summonerName):
     """
     Retrieves the ranked stats of a summoner from the Riot Games API.
@@ -1046,11 +1490,8 @@ def getSummonerSoloDuoRank(summonerName):
 
     summonerID = getDetailsFromSummonerName(summonerName, 'summonerID')
 
-    # Construct the URL for fetching ranked stats
-    rankedStatsURL = f"https://euw1.api.riotgames.com/lol/league/v4/entries/by-summoner/{summonerID}"
-
     # Send a GET request to the API
-    response = request(rankedStatsURL, headers=requestHeaders)
+    response = riotClient.getLeagueEntriesBySummoner(summonerID)
 
     # Convert the response to JSON format
     rankedStatsData = response.json()
@@ -1068,8 +1509,84 @@ def getSummonerSoloDuoRank(summonerName):
 # @myLogger
 
 
+@myLogger
+def getSummonerPeriodStatsFromDB(summonerName, granularity='month', queueId=420):
+    """
+    Reads a summoner's stats for the current period from the 'summoner_period_stats' rollup with one primary key
+    lookup, so the cost does not grow with the number of matches the summoner has.
+
+    Parameters:
+    - summonerName (str): The name of the summoner.
+    - granularity (str): The period, 'week' or 'month'. Defaults to 'month'.
+    - queueId (int): The queue. Defaults to 420 (ranked solo/duo).
+
+    Returns:
+    - dict: victories, defeats, hoursPlayed, minutesPlayed, gamesPlayed, championPool (champion -> games),
+    favoriteChampion, favoriteTimes, bestGame, bestChampion, bestKills, bestDeaths and bestAssists (see
+    buildPeriodSummary).
+    """
+    summonerPuuid = getDetailsFromSummonerName(summonerName)
+    sql = """
+            SELECT wins, losses, total_duration, champion_counts, best_matchid, best_champion_name, best_kills,
+                   best_deaths, best_assists
+            FROM summoner_period_stats
+            WHERE puuid = %s AND granularity = %s AND period_start = date_trunc(%s, CURRENT_DATE)::timestamp
+              AND queue_id = %s;
+            """
+    params = (summonerPuuid, granularity, granularity, queueId)
+    if analyticsStore is not None:
+        rows = analyticsStore.fetchall(sql.replace('%s', '?'), list(params))
+        row = None
+        if rows:
+            row = dict(zip(['wins', 'losses', 'total_duration', 'champion_counts', 'best_matchid',
+                            'best_champion_name', 'best_kills', 'best_deaths', 'best_assists'], rows[0]))
+            row['champion_counts'] = json.loads(row['champion_counts'])
+    else:
+        with getConnection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(sql, params)
+                row = cur.fetchone()
+
+    if row is None:
+        # No games in this period yet
+        row = {'wins': 0, 'losses': 0, 'total_duration': 0, 'champion_counts': {}, 'best_matchid': None,
+               'best_champion_name': None, 'best_kills': None, 'best_deaths': None, 'best_assists': None}
+    return buildPeriodSummary(row)
+
+
+@myLogger
+def buildPeriodSummary(row):
+    """
+    Turns a row of period totals (wins, losses, total_duration, champion_counts and the best_* game columns) into the
+    summary dict the home page shows.
+    """
+    championPool = row['champion_counts']
+    favoriteChampion = max(championPool, key=championPool.get) if championPool else None
+    favoriteTimes = championPool[favoriteChampion] if championPool else 0
+    if favoriteTimes == 1:
+        favoriteChampion = None
+    hoursPlayed = int(row['total_duration'] / 3600)
+    minutesPlayed = ((row['total_duration'] / 3600) - hoursPlayed) * 60
+
+    return {
+        'victories': row['wins'],
+        'defeats': row['losses'],
+        'hoursPlayed': hoursPlayed,
+        'minutesPlayed': round(minutesPlayed),
+        'gamesPlayed': row['wins'] + row['losses'],
+        'championPool': championPool,
+        'favoriteChampion': favoriteChampion,
+        'favoriteTimes': favoriteTimes,
+        'bestGame': row['best_matchid'],
+        'bestChampion': row['best_champion_name'],
+        'bestKills': row['best_kills'],
+        'bestDeaths': row['best_deaths'],
+        'bestAssists': row['best_assists'],
+    }
+
+
 #@st.cache_data
-# @myLogger
+@myLogger
 def getSummonerRankFromDB(summonerName):
     """
     Retrieves the ranked stats of a summoner from the PostgreSQL database.
@@ -1082,29 +1599,30 @@ def getSummonerRankFromDB(summonerName):
     The structure and content of the returned data are defined by the Riot Games API and may change over time.
     """
 
-    conn = connect_db()
-    cur = conn.cursor()
+    if analyticsStore is not None:
+        rankedStatsData = analyticsStore.fetchall("""
+        SELECT concat("rankedSoloData" ->> 'tier', ' ', "rankedSoloData" ->> 'rank') FROM summoners WHERE name = ?;
+        """, [summonerName])[0][0]
+        return rankedStatsData
 
-    # Fetch the ranked stats data from the database
-    cur.execute(f"""
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch the ranked stats data from the database
+            cur.execute(f"""
     select 
     concat("rankedSoloData" -> 'tier', ' ' ,  "rankedSoloData" -> 'rank')
     from summoners as s
     where name = '{summonerName}';
 
 """)
-    rankedStatsData = cur.fetchone()[0]
+            rankedStatsData = cur.fetchone()[0]
     rankedStatsData = rankedStatsData.replace('"', '')
 
-    # Close the connection
-    cur.close()
-    conn.close()
-
     return rankedStatsData
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getThisWeekMatchIDSFromDB(summonerName):
     """
     Fetches all match IDs from the 'matches' table in the database.
@@ -1118,30 +1636,27 @@ def getThisWeekMatchIDSFromDB(summonerName):
     """
     summonerPuuid = getDetailsFromSummonerName(summonerName)
 
-    sql = f"""
+    # The participants filter is written as @> so it can use the GIN index of the migrations
+    sql = """
 SELECT matchID
 FROM matches
-WHERE datetime >= date_trunc('month', CURRENT_DATE)
-  AND datetime < date_trunc('month', CURRENT_DATE) + INTERVAL '1 MONTH'
+WHERE datetime >= %s
+  AND datetime < %s
   AND (matchinfo -> 'queueId')::int = 420
-  AND jsonb_path_exists(matchmetadata, '$.participants ? (@ == "{summonerPuuid}")');
+  AND matchmetadata -> 'participants' @> %s::jsonb;
 
     """
 
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute(sql)
-    matchesList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch all match IDs, the month bounds are sent as timestamp literals so the planner prunes the partitions
+            cur.execute(sql, (getMonthStart(), getMonthStart(offset=1), json.dumps([summonerPuuid])))
+            matchesList = [row[0] for row in cur.fetchall()]
     return matchesList
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getPreviousMonthMatchIDSFromDB(summonerName):
     """
     Fetches all match IDs from the 'matches' table in the database.
@@ -1155,106 +1670,116 @@ def getPreviousMonthMatchIDSFromDB(summonerName):
     """
     summonerPuuid = getDetailsFromSummonerName(summonerName)
 
-    sql = f"""
+    # The participants filter is written as @> so it can use the GIN index of the migrations
+    sql = """
    SELECT matchID
     FROM matches
-    WHERE datetime >= date_trunc('month', CURRENT_DATE - INTERVAL '1 MONTH')
-  AND datetime < date_trunc('month', CURRENT_DATE)
+    WHERE datetime >= %s
+  AND datetime < %s
   AND (matchinfo -> 'queueId')::int = 420
-  AND jsonb_path_exists(matchmetadata, '$.participants ? (@ == "{summonerPuuid}")');
+  AND matchmetadata -> 'participants' @> %s::jsonb;
     """
 
-    conn = connect_db()
-    cur = conn.cursor()
-    # Fetch all match IDs
-    cur.execute(sql)
-    matchesList = [row[0] for row in cur.fetchall()]
-
-    # Close the connection
-    cur.close()
-    conn.close()
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            # Fetch all match IDs, the month bounds are sent as timestamp literals so the planner prunes the partitions
+            cur.execute(sql, (getMonthStart(offset=-1), getMonthStart(), json.dumps([summonerPuuid])))
+            matchesList = [row[0] for row in cur.fetchall()]
     return matchesList
 
 
-#@st.cache_data
-# @myLogger
-def getSummonerWinLossRatioFromDB(summonerName, matchesList):
+# Aggregates a summoner's games in match_participants server-side: totals, champion counts and the best-KDA game
+# (KDA = (kills + assists) / deaths, or kills + assists without deaths), {filter} narrows down the games
+summonerSummarySql = """
+WITH games AS (
+    SELECT matchid, game_start, win, game_duration, champion_name, kills, deaths, assists,
+           (kills + assists)::numeric / GREATEST(deaths, 1) AS kda
+    FROM match_participants
+    WHERE puuid = %(puuid)s AND {filter}
+),
+best AS (
+    SELECT matchid, champion_name, kills, deaths, assists
+    FROM games
+    ORDER BY kda DESC, game_start
+    LIMIT 1
+)
+SELECT COUNT(*) FILTER (WHERE win) AS wins,
+       COUNT(*) FILTER (WHERE NOT win) AS losses,
+       COALESCE(SUM(game_duration), 0) AS total_duration,
+       (SELECT COALESCE(jsonb_object_agg(champion_name, games), '{{}}'::jsonb)
+        FROM (SELECT champion_name, COUNT(*) AS games FROM games GROUP BY champion_name) AS c) AS champion_counts,
+       (SELECT matchid FROM best) AS best_matchid,
+       (SELECT champion_name FROM best) AS best_champion_name,
+       (SELECT kills FROM best) AS best_kills,
+       (SELECT deaths FROM best) AS best_deaths,
+       (SELECT assists FROM best) AS best_assists
+FROM games;
+"""
+
+
+@myLogger
+def getSummonerSummary(puuid, filterSql, params):
+    with getConnection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(summonerSummarySql.format(filter=filterSql), {'puuid': puuid, **params})
+            row = cur.fetchone()
+    return buildPeriodSummary(row)
+
+
+@myLogger
+def getSummonerPeriodSummary(puuid, start, end, queue=420):
+    """
+    Summarizes a summoner's games between start and end in one aggregate query over match_participants.
+
+    Parameters:
+    - puuid (str): The PUUID of the summoner.
+    - start (datetime): The first game start to include (UTC).
+    - end (datetime): The game start to stop before (UTC).
+    - queue (int, optional): Only count this queue, None counts every queue. Defaults to 420 (ranked solo/duo).
+
+    Returns:
+    - dict: victories, defeats, hoursPlayed, minutesPlayed, gamesPlayed, championPool (champion -> games),
+    favoriteChampion, favoriteTimes, bestGame, bestChampion, bestKills, bestDeaths and bestAssists (see
+    buildPeriodSummary).
+    """
+    return getSummonerSummary(
+        puuid,
+        "game_start >= %(start)s AND game_start < %(end)s AND (%(queue)s::int IS NULL OR queue_id = %(queue)s::int)",
+        {'start': start, 'end': end, 'queue': queue})
+
+
+@myLogger
+def getSummonerMatchesSummary(summonerName, matchesList):
+    """Summarizes a summoner's games in matchesList in one aggregate query, see getSummonerPeriodSummary."""
     cPrintS(f'{{green}}Found {{cyan}}{len(matchesList)}{{green}} matches for {{cyan}}{summonerName}')
-    wins = 0
-    losses = 0
-    for match in matchesList:
-        matchData = getMatchDataFromDB(match)
-        knownMatchParticipants = getMatchKnownParticipantsIndex(match)
-        summonerIndex = knownMatchParticipants[getDetailsFromSummonerName(summonerName)]
-        if matchData['participants'][summonerIndex]['win']:
-            wins += 1
-        else:
-            losses += 1
+    return getSummonerSummary(getDetailsFromSummonerName(summonerName), "matchid = ANY(%(matchIds)s)",
+                              {'matchIds': list(matchesList)})
 
-    return wins, losses
+
+#@st.cache_data
+@myLogger
+def getSummonerWinLossRatioFromDB(summonerName, matchesList):
+    summary = getSummonerMatchesSummary(summonerName, matchesList)
+    return summary['victories'], summary['defeats']
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getSummonerHoursAndGamesFromDB(summonerName, matchesList):
-    cPrintS(f'{{green}}Found {{cyan}}{len(matchesList)}{{green}} matches for {{cyan}}{summonerName}')
-    hoursPlayedInSeconds = 0
-    for match in matchesList:
-        matchData = getMatchDataFromDB(match)
-        matchDuration = matchData['matchinfo']['gameDuration']
-        hoursPlayedInSeconds += matchDuration
-    hoursPlayed = int(hoursPlayedInSeconds / 3600)
-    minutesPlayed = ((hoursPlayedInSeconds / 3600) - hoursPlayed) * 60
-    return hoursPlayed, round(minutesPlayed), len(matchesList)
+    summary = getSummonerMatchesSummary(summonerName, matchesList)
+    return summary['hoursPlayed'], summary['minutesPlayed'], summary['gamesPlayed']
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getChampionPoolDiversityAndFavoriteChampionFromDB(summonerName, matchesList):
-    cPrintS(
-        f'{{green}}Found {{cyan}}{len(matchesList)}{{green}} matches this week for {{cyan}}{summonerName}')
-    championPool = {}
-    for match in matchesList:
-        matchData = getMatchDataFromDB(match)
-        knownMatchParticipants = getMatchKnownParticipantsIndex(match)
-        summonerIndex = knownMatchParticipants[getDetailsFromSummonerName(summonerName)]
-        championName = matchData['participants'][summonerIndex]['championName']
-        if championName in championPool:
-            championPool[championName] += 1
-        else:
-            championPool[championName] = 1
-
-    if championPool:
-        mostPlayedChampion = max(championPool, key=championPool.get)
-        mostPlayedTimes = championPool[mostPlayedChampion]
-        if mostPlayedTimes == 1:
-            mostPlayedChampion = None
-    else:
-        # Handles the case where no matches were found or no champions were played
-        mostPlayedChampion = None
-        mostPlayedTimes = 0
-
-    return mostPlayedChampion, mostPlayedTimes, championPool
+    summary = getSummonerMatchesSummary(summonerName, matchesList)
+    return summary['favoriteChampion'], summary['favoriteTimes'], summary['championPool']
 
 
 #@st.cache_data
-# @myLogger
+@myLogger
 def getBestGameFromDB(summonerName, matchesList):
-    cPrintS(f'{{green}}Found {{cyan}}{len(matchesList)}{{green}} matches for {{cyan}}{summonerName}')
-    bestGame = None
-    bestGameKDA = 0
-    for match in matchesList:
-        matchData = getMatchDataFromDB(match)
-        knownMatchParticipants = getMatchKnownParticipantsIndex(match)
-        summonerIndex = knownMatchParticipants[getDetailsFromSummonerName(summonerName)]
-        assists = matchData['participants'][summonerIndex]['assists']
-        kills = matchData['participants'][summonerIndex]['kills']
-        deaths = matchData['participants'][summonerIndex]['deaths']
-        champion = matchData['participants'][summonerIndex]['championName']
-        if deaths == 0:
-            kda = assists + kills
-        else:
-            kda = (assists + kills) / deaths
-        if kda > bestGameKDA:
-            bestGame = match
-        return bestGame, champion, kills, deaths, assists
+    summary = getSummonerMatchesSummary(summonerName, matchesList)
+    return summary['bestGame'], summary['bestChampion'], summary['bestKills'], summary['bestDeaths'], \
+        summary['bestAssists']
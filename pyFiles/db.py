@@ -0,0 +1,161 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2 as ps
+import psycopg2.extensions
+import psycopg2.pool
+
+from metrics import metrics
+from utils import cPrintS, getDataFromConfig
+
+databaseConfig = getDataFromConfig(key='Database')
+dbname = databaseConfig['DataBaseConnectInfo']['dbname']
+user = databaseConfig['DataBaseConnectInfo']['user']
+password = databaseConfig['DataBaseConnectInfo']['password']
+port = databaseConfig['DataBaseConnectInfo']['port']
+host = databaseConfig['DataBaseConnectInfo']['host']
+
+poolDefaults = {
+    'minConnections': 1,
+    'maxConnections': 10,
+    'healthCheckAfter': 60,  # seconds a connection may sit idle before it is pinged on checkout
+}
+poolConfig = {**poolDefaults, **databaseConfig.get('Pool', {})}
+
+connectionPool = None
+connectionSlots = threading.BoundedSemaphore(poolConfig['maxConnections'])
+connectionLastUsed = {}
+poolLock = threading.Lock()
+engine = None
+
+
+# @myLogger
+def connect_db():
+    """
+    Opens a new, unpooled connection. Prefer getConnection(), which borrows one from the process-wide pool.
+    """
+    return ps.connect(
+        dbname=dbname,
+        user=user,
+        password=password,
+        host=host,
+        port=port
+    )
+
+
+def getConnectionPool():
+    """Returns the process-wide ThreadedConnectionPool, creating it on first use."""
+    global connectionPool
+    if connectionPool is None:
+        with poolLock:
+            if connectionPool is None:
+                connectionPool = psycopg2.pool.ThreadedConnectionPool(
+                    poolConfig['minConnections'], poolConfig['maxConnections'],
+                    dbname=dbname, user=user, password=password, host=host, port=port)
+    return connectionPool
+
+
+def isConnectionHealthy(conn):
+    """Checks a connection that sat idle for longer than healthCheckAfter with a SELECT 1."""
+    if conn.closed:
+        return False
+    if time.monotonic() - connectionLastUsed.get(id(conn), 0) < poolConfig['healthCheckAfter']:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except ps.Error:
+        return False
+
+
+@contextmanager
+def getConnection():
+    """
+    Borrows a connection from the process-wide pool for the duration of a with block.
+
+    Waits while all maxConnections connections are borrowed. A connection that failed its health check is discarded
+    and replaced. On leaving the block an uncommitted transaction is rolled back (callers commit explicitly), and a
+    connection that broke inside the block is closed instead of returned to the pool.
+
+    The wait for a free connection and the time it is held are recorded in the lol_db_connection_* metrics, the
+    latter labeled with the name of the function borrowing it.
+
+    Usage:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(...)
+            conn.commit()
+    """
+    # frame 0 is this generator, 1 the __enter__ of the context manager and 2 the function with the with block
+    function = sys._getframe(2).f_code.co_name
+    waitStart = time.monotonic()
+    connectionSlots.acquire()
+    try:
+        pool = getConnectionPool()
+        conn = None
+        heldStart = None
+        try:
+            conn = pool.getconn()
+            while not isConnectionHealthy(conn):
+                cPrintS('{yellow}Discarding a broken pooled DB connection')
+                connectionLastUsed.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = None  # already returned, don't return it again if the next getconn fails
+                conn = pool.getconn()
+            heldStart = time.monotonic()
+            metrics.observe('lol_db_connection_wait_seconds', heldStart - waitStart)
+            yield conn
+        finally:
+            if heldStart is not None:
+                metrics.observe('lol_db_connection_seconds', time.monotonic() - heldStart, function=function)
+            if conn is not None:
+                broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+                if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except ps.Error:
+                        broken = True
+                if broken:
+                    connectionLastUsed.pop(id(conn), None)
+                else:
+                    connectionLastUsed[id(conn)] = time.monotonic()
+                pool.putconn(conn, close=broken)
+    finally:
+        # Released even if the pool couldn't be created or a connection couldn't be returned, a leaked slot would
+        # block every later getConnection() once all maxConnections slots are gone
+        connectionSlots.release()
+
+
+def getEngine():
+    """
+    Returns the process-wide SQLAlchemy engine for pandas readers, creating it on first use.
+
+    The engine keeps its own pool of poolConfig['maxConnections'] connections and pings a connection before reusing
+    it (pool_pre_ping).
+    """
+    global engine
+    if engine is None:
+        from sqlalchemy import create_engine
+
+        with poolLock:
+            if engine is None:
+                engine = create_engine(databaseConfig['ConnectionString'], pool_size=poolConfig['maxConnections'],
+                                       pool_pre_ping=True)
+    return engine
+
+
+def closeConnectionPool():
+    """Closes every pooled connection and disposes the engine."""
+    global connectionPool, engine
+    with poolLock:
+        if connectionPool is not None:
+            connectionPool.closeall()
+            connectionPool = None
+        connectionLastUsed.clear()
+        if engine is not None:
+            engine.dispose()
+            engine = None
@@ -0,0 +1,264 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from db import getConnection
+from utils import cPrintS, getDataFromConfig
+
+# Postgres type OID -> DuckDB type of a mirrored column, anything else is mirrored as VARCHAR
+duckTypes = {16: 'BOOLEAN', 20: 'BIGINT', 21: 'SMALLINT', 23: 'INTEGER', 700: 'REAL', 701: 'DOUBLE', 1700: 'DOUBLE',
+             1114: 'TIMESTAMP', 1184: 'TIMESTAMPTZ', 114: 'JSON', 3802: 'JSON'}
+jsonTypes = {114, 3802}
+
+# The Postgres tables mirrored into DuckDB. A table with a 'since' column is synced incrementally: only the rows
+# written after the last sync are read, and they replace their old rows by key. The others are small and copied whole.
+# Rows deleted in Postgres (old partitions dropped by detachOldPartitions) are removed from an incremental mirror by
+# its 'deletes': 'keys' compares the mirror with the keys still in Postgres, 'parent' drops the rows whose parent
+# table row is gone from the mirror (the parent is synced first).
+# The matches mirror keeps the participant JSON the match analysis reads, with the match key and queue as columns.
+mirroredTables = {
+    'matches': {
+        'sql': f"""
+        SELECT matchid, platform, game_id, datetime, (matchinfo ->> 'queueId')::int AS queue_id,
+               matchmetadata -> 'participants' AS participants,
+               {', '.join(f'matchparticipant{i}' for i in range(10))}, ingested_at
+        FROM matches
+        WHERE ingested_at > %(since)s
+        ORDER BY ingested_at;
+        """,
+        'keys': ['platform', 'game_id'],
+        'since': 'ingested_at',
+        'deletes': 'keys',
+    },
+    'match_participants': {
+        'sql': """
+        SELECT mp.*, m.ingested_at
+        FROM match_participants mp
+        JOIN matches m ON m.platform = mp.platform AND m.game_id = mp.game_id
+        WHERE m.ingested_at > %(since)s
+        ORDER BY m.ingested_at;
+        """,
+        'keys': ['platform', 'game_id', 'participant_index'],
+        'since': 'ingested_at',
+        'deletes': 'parent',
+        'parent': 'matches',
+    },
+    # One row per summoner, period and queue, small enough to copy whole, which also drops the rows a rebuild removed
+    'summoner_period_stats': {
+        'sql': "SELECT * FROM summoner_period_stats;",
+        'keys': None,
+        'since': None,
+        'deletes': None,
+    },
+    'summoners': {
+        'sql': "SELECT * FROM summoners;",
+        'keys': None,
+        'since': None,
+        'deletes': None,
+    },
+}
+
+
+def importDuckDB():
+    """Import duckdb, an optional dependency only needed with "Analytics": {"backend": "duckdb"} or for the sync."""
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError('The DuckDB analytics backend needs the duckdb package (pip install duckdb)') from None
+    return duckdb
+
+
+def getAnalyticsConfig():
+    """Return the settings of the optional 'Analytics' config section ({"backend": "postgres" or "duckdb", ...})."""
+    return {'backend': 'postgres', 'path': '../duckdb/analytics.duckdb', 'batchSize': 50000, 'overlapSeconds': 300,
+            'lockTimeout': 10, **getDataFromConfig().get('Analytics', {})}
+
+
+class DuckStore:
+    """
+    A local DuckDB file mirroring the matches, participants, period stats and summoners of Postgres.
+
+    The dashboard and analysis readers of data.py query it instead of Postgres when it is the configured backend, so
+    they run in-process and keep working while Postgres is unreachable. syncDuckDB brings it up to date.
+
+    DuckDB lets one process write a file or several read it. Readers open a short-lived read-only connection per
+    query and wait up to lockTimeout seconds while a sync is writing.
+
+    Parameters:
+    path (str): The DuckDB file, created on the first sync.
+    lockTimeout (float): Seconds a reader waits for a running sync. Defaults to 10.
+    """
+
+    def __init__(self, path, lockTimeout=10):
+        self.duckdb = importDuckDB()
+        self.path = path
+        self.lockTimeout = lockTimeout
+
+    def connect(self, readOnly=True):
+        deadline = time.monotonic() + self.lockTimeout
+        while True:
+            try:
+                return self.duckdb.connect(self.path, read_only=readOnly)
+            except self.duckdb.IOException:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def fetchall(self, sql, params=None):
+        """Run a query with DuckDB ? placeholders and return its rows."""
+        with self.connect() as conn:
+            return conn.execute(sql, params or []).fetchall()
+
+    def fetchdf(self, sql, params=None):
+        """Run a query with DuckDB ? placeholders and return it as a DataFrame."""
+        with self.connect() as conn:
+            return conn.execute(sql, params or []).df()
+
+
+def getAnalyticsStore():
+    """
+    Create the DuckDB store if it is the backend of the optional 'Analytics' config section.
+
+    Returns:
+    DuckStore or None: The store, or None when the readers use Postgres.
+    """
+    config = getAnalyticsConfig()
+    if config['backend'] != 'duckdb':
+        return None
+    return DuckStore(config['path'], config['lockTimeout'])
+
+
+def createMirrorTable(duck, name, description):
+    columns = ', '.join(f'"{column.name}" {duckTypes.get(column.type_code, "VARCHAR")}' for column in description)
+    duck.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({columns});')
+
+
+def mirrorTable(duck, name, since, batchSize):
+    """
+    Copies the rows of one mirrored table changed after since into the DuckDB file.
+
+    Returns:
+    tuple: (rows copied, the newest 'since' value seen or None)
+    """
+    import pandas as pd
+
+    spec = mirroredTables[name]
+    copied = 0
+    newest = None
+    with getConnection() as conn:
+        with conn.cursor(name=f'duckdb_mirror_{name}') as cur:
+            cur.itersize = batchSize
+            cur.execute(spec['sql'], {'since': since})
+            created = False
+            while True:
+                rows = cur.fetchmany(batchSize)
+                if not created and cur.description is not None:
+                    createMirrorTable(duck, name, cur.description)
+                    if spec['since'] is None:
+                        duck.execute(f'DELETE FROM "{name}";')
+                    created = True
+                if not rows:
+                    break
+                columns = [column.name for column in cur.description]
+                batch = pd.DataFrame.from_records(rows, columns=columns)
+                for column in cur.description:
+                    if column.type_code in jsonTypes:
+                        batch[column.name] = batch[column.name].map(lambda value: None if value is None
+                                                                    else json.dumps(value))
+                duck.register('mirror_batch', batch)
+                duck.execute('BEGIN TRANSACTION;')
+                if spec['keys']:
+                    keyMatch = ' AND '.join(f't."{key}" = b."{key}"' for key in spec['keys'])
+                    duck.execute(f'DELETE FROM "{name}" AS t USING mirror_batch AS b WHERE {keyMatch};')
+                duck.execute(f'INSERT INTO "{name}" SELECT * FROM mirror_batch;')
+                duck.execute('COMMIT;')
+                duck.unregister('mirror_batch')
+                copied += len(rows)
+                if spec['since'] is not None:
+                    newest = batch[spec['since']].max().to_pydatetime()
+                cPrintS(f'{{green}}Mirrored {{cyan}}{copied}{{green}} {name} rows to DuckDB')
+        conn.commit()
+    return copied, newest
+
+
+def removeDeletedRows(duck, name, batchSize):
+    """
+    Deletes the rows of an incrementally mirrored table that were deleted in Postgres, see 'deletes' in mirroredTables.
+
+    Returns:
+    int: The mirror rows deleted.
+    """
+    import pandas as pd
+
+    spec = mirroredTables[name]
+    tableExists = duck.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = ?;",
+                               [name]).fetchone()[0]
+    if spec['deletes'] is None or not tableExists:
+        return 0
+    if spec['deletes'] == 'parent':
+        keyMatch = ' AND '.join(f'p."{key}" = t."{key}"' for key in mirroredTables[spec['parent']]['keys'])
+        return duck.execute(f'DELETE FROM "{name}" AS t WHERE NOT EXISTS '
+                            f'(SELECT 1 FROM "{spec["parent"]}" AS p WHERE {keyMatch});').fetchone()[0]
+
+    # Stream the keys still in Postgres into a temporary table, the key columns are small and index-only scanned
+    keys = spec['keys']
+    keyColumns = ', '.join(f'"{key}"' for key in keys)
+    duck.execute(f'CREATE OR REPLACE TEMP TABLE _live_keys AS SELECT {keyColumns} FROM "{name}" LIMIT 0;')
+    with getConnection() as conn:
+        with conn.cursor(name=f'duckdb_keys_{name}') as cur:
+            cur.itersize = batchSize
+            cur.execute(f'SELECT {", ".join(keys)} FROM {name};')
+            while True:
+                rows = cur.fetchmany(batchSize)
+                if not rows:
+                    break
+                duck.register('key_batch', pd.DataFrame.from_records(rows, columns=keys))
+                duck.execute(f'INSERT INTO _live_keys SELECT {keyColumns} FROM key_batch;')
+                duck.unregister('key_batch')
+        conn.commit()
+    keyMatch = ' AND '.join(f'k."{key}" = t."{key}"' for key in keys)
+    removed = duck.execute(f'DELETE FROM "{name}" AS t WHERE NOT EXISTS '
+                           f'(SELECT 1 FROM _live_keys AS k WHERE {keyMatch});').fetchone()[0]
+    duck.execute('DROP TABLE _live_keys;')
+    return removed
+
+
+def syncDuckDB(path=None, full=False):
+    """
+    Incrementally mirrors the Postgres tables the dashboard and the analysis read into the local DuckDB file.
+
+    Only the matches and participants written since the last sync are read (by matches.ingested_at, minus a small
+    overlap for transactions that committed late). Matches deleted in Postgres are then found by comparing the match
+    keys, and removed with their participants. The small summoners and summoner_period_stats tables are copied whole.
+
+    Parameters:
+    path (str, optional): The DuckDB file. Defaults to the 'Analytics' config path.
+    full (bool): Copy everything again instead of only what changed. Defaults to False.
+
+    Returns:
+    dict: Table name -> rows copied.
+    """
+    duckdb = importDuckDB()
+    config = getAnalyticsConfig()
+    path = path or config['path']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    overlap = timedelta(seconds=config['overlapSeconds'])
+
+    copied = {}
+    with duckdb.connect(path) as duck:
+        duck.execute('CREATE TABLE IF NOT EXISTS _mirror_state (name VARCHAR PRIMARY KEY, synced_until TIMESTAMP);')
+        if full:
+            duck.execute('DELETE FROM _mirror_state;')
+            for name in mirroredTables:
+                duck.execute(f'DROP TABLE IF EXISTS "{name}";')
+        state = dict(duck.execute('SELECT name, synced_until FROM _mirror_state;').fetchall())
+        for name in mirroredTables:
+            since = state[name] - overlap if name in state else datetime(1970, 1, 1)
+            copied[name], newest = mirrorTable(duck, name, since, config['batchSize'])
+            if newest is not None:
+                duck.execute('INSERT OR REPLACE INTO _mirror_state VALUES (?, ?);', [name, newest])
+            removed = removeDeletedRows(duck, name, config['batchSize'])
+            if removed:
+                cPrintS(f'{{yellow}}Removed {{cyan}}{removed}{{yellow}} {name} rows deleted in Postgres from DuckDB')
+    return copied
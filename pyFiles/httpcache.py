@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils import getDataFromConfig
+
+# Seconds a cached response is served without asking the server, by URL substring. Anything else is revalidated on
+# every request (a conditional request that costs a 304 when nothing changed).
+defaultTtls = {
+    'ddragon.leagueoflegends.com/api/versions.json': 60 * 60,
+    'ddragon.leagueoflegends.com/cdn/': 30 * 24 * 60 * 60,  # versioned paths, the content never changes
+    '/lol/platform/v3/champion-rotations': 60 * 60,
+}
+
+# Response headers kept with a cached body, the body is stored decoded so Content-Encoding is dropped
+keptHeaders = ['Content-Type', 'ETag', 'Last-Modified', 'Cache-Control']
+
+
+class HttpCache:
+    """
+    Persistent HTTP cache for GET responses, kept in a SQLite file.
+
+    A cached entry is served locally while it is younger than the TTL of its URL. After that the request is sent with
+    If-None-Match / If-Modified-Since from the stored ETag / Last-Modified, and a 304 answer refreshes the entry and
+    serves the stored body, so an unchanged static file costs a few hundred bytes instead of a full download.
+
+    Parameters:
+    path (str): The SQLite file of the cache, created on first use.
+    ttls (dict, optional): URL substring -> seconds, merged over defaultTtls.
+    """
+
+    def __init__(self, path, ttls=None):
+        self.path = path
+        self.ttls = {**defaultTtls, **(ttls or {})}
+        self.initialized = False
+
+    def connect(self):
+        if not self.initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self.initialized:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                headers TEXT,
+                body BLOB
+            )""")
+            self.initialized = True
+        return conn
+
+    @staticmethod
+    def getKey(url, params=None):
+        return f'{url}?{urlencode(sorted(params.items()))}' if params else url
+
+    def getTtl(self, url):
+        return max((ttl for pattern, ttl in self.ttls.items() if pattern in url), default=0)
+
+    def lookup(self, key):
+        """Return the cached entry for key as a dict, or None."""
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute('SELECT etag, last_modified, stored_at, headers, body FROM responses WHERE key = ?',
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        etag, lastModified, storedAt, headers, body = row
+        return {'etag': etag, 'lastModified': lastModified, 'storedAt': storedAt, 'headers': json.loads(headers),
+                'body': body}
+
+    def isFresh(self, entry, url):
+        return time.time() - entry['storedAt'] < self.getTtl(url)
+
+    @staticmethod
+    def getValidators(entry):
+        """Return the conditional request headers for a cached entry."""
+        validators = {}
+        if entry['etag']:
+            validators['If-None-Match'] = entry['etag']
+        if entry['lastModified']:
+            validators['If-Modified-Since'] = entry['lastModified']
+        return validators
+
+    def store(self, key, response):
+        headers = {name: response.headers[name] for name in keptHeaders if name in response.headers}
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, response.headers.get('ETag'), response.headers.get('Last-Modified'), time.time(),
+                          json.dumps(headers), response.content))
+
+    def touch(self, key, response):
+        """Mark an entry as fresh again after a 304, taking any new validators from the response."""
+        with closing(self.connect()) as conn, conn:
+            conn.execute("""
+            UPDATE responses
+            SET stored_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+            WHERE key = ?""", (time.time(), response.headers.get('ETag'), response.headers.get('Last-Modified'), key))
+
+    @staticmethod
+    def toResponse(entry, url):
+        """Build a 200 requests.Response from a cached entry."""
+        response = requests.Response()
+        response.status_code = 200
+        response._content = entry['body']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.url = url
+        return response
+
+
+def getHttpCache():
+    """
+    Create the HTTP cache from the optional 'HttpCache' config section ({"path": ..., "enabled": ..., "ttls": ...}).
+
+    Returns:
+    HttpCache or None: The cache, or None if it is disabled in the config.
+    """
+    cacheConfig = getDataFromConfig().get('HttpCache', {})
+    if not cacheConfig.get('enabled', True):
+        return None
+    return HttpCache(cacheConfig.get('path', '../httpCache/httpCache.sqlite'), cacheConfig.get('ttls'))
@@ -0,0 +1,115 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from utils import cPrintS
+
+# The entry points whose cold import time is measured
+entryPoints = ['main', 'tracking', 'app']
+
+# Heavy packages an entry point must not load at import time, they are imported by the functions that need them.
+# app.py is the dashboard, it needs streamlit, pandas and plotly up front.
+heavyModules = ['streamlit', 'pandas', 'numpy', 'sqlalchemy', 'pyarrow', 'plotly', 'duckdb']
+forbiddenImports = {
+    'main': heavyModules,
+    'tracking': heavyModules,
+}
+
+
+def parseImportTime(stderr):
+    """
+    Parses the report of python -X importtime.
+
+    Returns:
+    dict: Module name -> cumulative import time in seconds, for every module that was imported.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+
+def measureImport(module, runs=5):
+    """
+    Measures the cold import time of a module, each run in a fresh interpreter so nothing is already imported.
+
+    Parameters:
+    module (str): The module to import, from this directory.
+    runs (int): The number of interpreters started. Defaults to 5.
+
+    Returns:
+    dict: 'median' and 'runs' (wall seconds of the interpreter), 'slowest' (the 5 slowest top level imports of the
+    last run with their cumulative seconds), 'heavy' (heavyModules it loaded) and 'error' (None if it imported).
+    """
+    timings = []
+    modules = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            return {'median': None, 'runs': timings, 'slowest': [], 'heavy': [],
+                    'error': process.stderr.strip().splitlines()[-1]}
+        modules = parseImportTime(process.stderr)
+    topLevel = {name: seconds for name, seconds in modules.items() if '.' not in name and name != module}
+    return {
+        'median': statistics.median(timings),
+        'runs': timings,
+        'slowest': sorted(topLevel.items(), key=lambda item: item[1], reverse=True)[:5],
+        'heavy': [name for name in heavyModules if name in modules],
+        'error': None,
+    }
+
+
+def benchmarkImports(modules=None, runs=5, budget=None):
+    """
+    Measures the cold import time of the entry points and checks them for regressions.
+
+    An entry point regresses when it fails to import, loads one of its forbiddenImports, or takes longer than budget.
+
+    Parameters:
+    modules (list, optional): The modules to measure. Defaults to entryPoints.
+    runs (int): Interpreters started per module. Defaults to 5.
+    budget (float, optional): Seconds the median import may take. Defaults to no limit.
+
+    Returns:
+    tuple: (module -> measureImport result, True if no entry point regressed)
+    """
+    report = {}
+    passed = True
+    for module in modules or entryPoints:
+        result = measureImport(module, runs)
+        report[module] = result
+        if result['error'] is not None:
+            cPrintS(f'{{red}}{module}: import failed: {result["error"]}')
+            passed = False
+            continue
+        slowest = ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in result['slowest'])
+        cPrintS(f'{{green}}{module}: {{cyan}}{result["median"] * 1000:.0f}ms{{green}} median of {runs} '
+                f'({{cyan}}{slowest}{{green}})')
+        forbidden = [name for name in result['heavy'] if name in forbiddenImports.get(module, [])]
+        if forbidden:
+            cPrintS(f'{{red}}{module} loads {", ".join(forbidden)} at import time')
+            passed = False
+        if budget is not None and result['median'] > budget:
+            cPrintS(f'{{red}}{module} takes longer than the {budget * 1000:.0f}ms budget to import')
+            passed = False
+    return report, passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cold import time of the entry points')
+    parser.add_argument('modules', nargs='*', help=f'modules to measure, defaults to {" ".join(entryPoints)}')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, help='seconds the median import of each module may take')
+    args = parser.parse_args()
+    _, passed = benchmarkImports(args.modules, args.runs, args.budget)
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,272 @@
+import asyncio
+import time
+
+import aiohttp
+
+from applog import getLogger
+from data import permanentErrorCodes, requestHeaders, matchStore, upsertErrorToDB, upsertMatchDataBatch
+from metrics import metrics, observeRiotRequest, startMetrics
+from ratelimit import governor
+from utils import getDataFromConfig
+
+log = getLogger('ingest')
+
+ingestionDefaults = {
+    'concurrency': 8,  # concurrent match fetchers
+    'batchSize': 100,  # matches written per DB transaction
+    'queueSize': 200,  # fetched matches waiting for a writer before fetchers pause
+    'writers': 1,  # concurrent DB writers
+    'progressInterval': 10,  # seconds between progress reports
+    'timelines': False,  # also fetch and store match timelines, one more match-v5 request per match
+}
+
+
+def getIngestionConfig():
+    """Return the ingestion settings, with the optional 'Ingestion' config section overriding ingestionDefaults."""
+    return {**ingestionDefaults, **getDataFromConfig().get('Ingestion', {})}
+
+
+async def fetchMatch(session, matchID, region='europe', max_retries=5):
+    """
+    Fetch one match from the local match store, or from match-v5, pacing every attempt through the shared rate limit
+    governor. Matches fetched from the API are saved to the store.
+
+    Parameters:
+    session (aiohttp.ClientSession): The session to send the request with.
+    matchID (str): The ID of the match to fetch.
+    region (str): The routing region of the match-v5 endpoint. Defaults to 'europe'.
+    max_retries (int): Maximum number of attempts on rate limits and connection errors. Defaults to 5.
+
+    Returns:
+    dict or int or None: The match data on success, the HTTP status code on an error response, or None if every
+    attempt failed without a response.
+    """
+    if matchStore is not None:
+        matchData = await asyncio.to_thread(matchStore.get, matchID)
+        if matchData is not None:
+            return matchData
+
+    matchData = await fetchJson(session, f'https://{region}.api.riotgames.com/lol/match/v5/matches/{matchID}',
+                                f'match {matchID}', max_retries)
+    if isinstance(matchData, dict) and matchStore is not None:
+        await asyncio.to_thread(matchStore.put, matchData)
+    return matchData
+
+
+async def fetchTimeline(session, matchID, region='europe', max_retries=5):
+    """
+    Fetch the timeline of one match from match-v5, see fetchMatch.
+
+    Returns:
+    dict or int or None: The timeline on success, the HTTP status code on an error response, or None if every attempt
+    failed without a response.
+    """
+    return await fetchJson(session, f'https://{region}.api.riotgames.com/lol/match/v5/matches/{matchID}/timeline',
+                           f'timeline {matchID}', max_retries)
+
+
+async def fetchJson(session, url, label, max_retries=5):
+    """
+    GET a Riot API URL, pacing every attempt through the rate limit governor and retrying on 429.
+
+    Network errors, timeouts and bodies that aren't valid JSON are retried too, and count as no response (None) once
+    the attempts run out.
+    """
+    status = None
+    for attempt in range(max_retries):
+        start = time.monotonic()
+        responded = False
+        try:
+            await governor.acquireAsync(url, requestHeaders)
+            async with session.get(url, headers=requestHeaders) as response:
+                governor.update(url, requestHeaders, response.headers, response.status)
+                responded = True
+                observeRiotRequest(url, response.status, time.monotonic() - start)
+                status = response.status
+                if status == 200:
+                    return await response.json()
+                elif status == 429:
+                    continue  # the governor holds the next attempt until Retry-After has passed
+                return status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if not responded:  # a response with a bad body was already reported to the governor
+                governor.update(url, requestHeaders, None, None)
+                observeRiotRequest(url, None, time.monotonic() - start)
+            status = None
+            log.warning('Error fetching %s: %r', label, e)
+    return status
+
+
+async def ingestMatches(matchIds, concurrency=None, batchSize=None, queueSize=None, writers=None, region='europe',
+                        timelines=None):
+    """
+    Fetch and upsert a list of matches with a producer/consumer pipeline.
+
+    `concurrency` fetchers pull match IDs and put the fetched matches on a bounded queue; `writers` DB writers drain the
+    queue in batches of up to `batchSize` matches, one transaction per batch. When the writers fall behind the queue
+    fills up and the fetchers wait, so memory stays bounded at `queueSize` matches. Matches that cannot be fetched
+    because of a permanent HTTP status (permanentErrorCodes) are logged to upsert_errors. Transient fetch failures
+    and matches the DB rejects are only reported in the 'failed' stats and the log, so the next sync retries them.
+
+    With timelines, every fetcher also fetches the match's timeline, which is written as a compact frame array to
+    match_timelines in the same transaction as the match. A match whose timeline can't be fetched is still ingested.
+
+    Parameters left as None are taken from getIngestionConfig().
+
+    Returns:
+    dict: Ingestion stats: 'upserted', 'succeeded' (match IDs), 'failed' (match ID -> status code or error),
+    'elapsed' seconds and 'matchesPerSecond'.
+    """
+    config = getIngestionConfig()
+    concurrency = concurrency or config['concurrency']
+    batchSize = batchSize or config['batchSize']
+    queueSize = queueSize or config['queueSize']
+    writers = writers or config['writers']
+    timelines = config['timelines'] if timelines is None else timelines
+
+    stats = {'fetched': 0, 'upserted': 0, 'succeeded': [], 'failed': {}}
+    idQueue = asyncio.Queue()
+    for matchID in matchIds:
+        idQueue.put_nowait(matchID)
+    matchQueue = asyncio.Queue(maxsize=queueSize)
+    startTime = time.monotonic()
+    startMetrics()
+
+    def recordProgress():
+        metrics.set('lol_ingest_queue_depth', idQueue.qsize(), queue='ids')
+        metrics.set('lol_ingest_queue_depth', matchQueue.qsize(), queue='matches')
+        metrics.set('lol_ingest_matches_per_second', stats['upserted'] / (time.monotonic() - startTime))
+
+    async def fetcher(session):
+        while True:
+            try:
+                matchID = idQueue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            matchData = await fetchMatch(session, matchID, region)
+            if isinstance(matchData, dict):
+                stats['fetched'] += 1
+                timelineData = await fetchTimeline(session, matchID, region) if timelines else None
+                if timelines and not isinstance(timelineData, dict):
+                    log.info('No timeline for match %s (%s)', matchID, timelineData)
+                await matchQueue.put((matchID, matchData, timelineData if isinstance(timelineData, dict) else None))
+            else:
+                stats['failed'][matchID] = matchData
+                metrics.inc('lol_ingest_matches_total', result='fetch_failed')
+                if matchData in permanentErrorCodes:
+                    await asyncio.to_thread(upsertErrorToDB, matchID, matchData)
+                else:
+                    log.warning('Could not fetch match %s (%s), it is left for the next sync', matchID, matchData)
+
+    async def writer():
+        finished = False
+        while not finished:
+            batch = []
+            batchTimelines = {}
+            item = await matchQueue.get()
+            while item is not None:
+                matchID, matchData, timelineData = item
+                batch.append(matchData)
+                if timelineData is not None:
+                    batchTimelines[matchID] = timelineData
+                if len(batch) >= batchSize or matchQueue.empty():
+                    break
+                item = matchQueue.get_nowait()
+            finished = item is None
+            if not batch:
+                continue
+            results = await asyncio.to_thread(upsertMatchDataBatch, batch, batchTimelines)
+            for matchID, result in results.items():
+                if result is True:
+                    stats['upserted'] += 1
+                    stats['succeeded'].append(matchID)
+                    metrics.inc('lol_ingest_matches_total', result='upserted')
+                else:
+                    stats['failed'][matchID] = result
+                    metrics.inc('lol_ingest_matches_total', result='rejected')
+                    log.warning('The DB rejected match %s: %s', matchID, result)
+            recordProgress()
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(config['progressInterval'])
+            elapsed = time.monotonic() - startTime
+            recordProgress()
+            log.info('Ingested %s of %s matches (%.2f matches/sec, %s waiting for the DB, %s failed)',
+                     stats['upserted'], len(matchIds), stats['upserted'] / elapsed, matchQueue.qsize(),
+                     len(stats['failed']))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        reporterTask = asyncio.create_task(reporter())
+        writerTasks = [asyncio.create_task(writer()) for _ in range(writers)]
+        fetcherTasks = [asyncio.create_task(fetcher(session)) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*fetcherTasks)
+        finally:
+            # Even if a fetcher failed, stop the others and let the writers drain what was already fetched
+            for task in fetcherTasks:
+                task.cancel()
+            await asyncio.gather(*fetcherTasks, return_exceptions=True)
+            for _ in range(writers):
+                await matchQueue.put(None)  # one stop marker per writer
+            await asyncio.gather(*writerTasks)
+            reporterTask.cancel()
+    recordProgress()
+
+    stats['elapsed'] = time.monotonic() - startTime
+    stats['matchesPerSecond'] = stats['upserted'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    log.info('Ingestion finished: %s matches upserted, %s failed in %.1fs (%.2f matches/sec)', stats['upserted'],
+             len(stats['failed']), stats['elapsed'], stats['matchesPerSecond'])
+    return stats
+
+
+def replayMatchStore(store=None, batchSize=None, matchIds=None):
+    """
+    Rebuild the 'matches' table from the local match store, without touching the Riot API.
+
+    Stored matches are read and upserted in batches of `batchSize` with upsertMatchDataBatch, so a full rebuild after a
+    schema change runs at local disk and DB speed.
+
+    Parameters:
+    store (MatchStore, optional): The store to replay. Defaults to the store configured for data.py.
+    batchSize (int, optional): Matches per transaction. Defaults to the 'Ingestion' config batch size.
+    matchIds (iterable, optional): Only replay these match IDs. Defaults to every stored match.
+
+    Returns:
+    dict: Replay stats: 'upserted', 'failed' (match ID -> error), 'elapsed' seconds and 'matchesPerSecond'.
+    """
+    store = store or matchStore
+    if store is None:
+        raise ValueError('The match store is disabled in the config, there is nothing to replay')
+    batchSize = batchSize or getIngestionConfig()['batchSize']
+    matchIds = store.iterMatchIds() if matchIds is None else matchIds
+
+    stats = {'upserted': 0, 'failed': {}}
+    startTime = time.monotonic()
+
+    def flush(batch):
+        for matchID, result in upsertMatchDataBatch(batch).items():
+            if result is True:
+                stats['upserted'] += 1
+            else:
+                stats['failed'][matchID] = result
+        log.info('Replayed %s matches from the match store (%.2f matches/sec)', stats['upserted'],
+                 stats['upserted'] / (time.monotonic() - startTime))
+
+    batch = []
+    for matchID in matchIds:
+        matchData = store.get(matchID)
+        if matchData is None:
+            stats['failed'][matchID] = 'not in the match store'
+            continue
+        batch.append(matchData)
+        if len(batch) >= batchSize:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    stats['elapsed'] = time.monotonic() - startTime
+    stats['matchesPerSecond'] = stats['upserted'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    return stats
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+
+from data import findMissingMatchesInDB, getAllSummonerMatches
+from db import getConnection
+from ingest import ingestMatches
+from utils import cPrintS, getDataFromConfig
+
+# Job states: pending -> running (leased by a worker) -> done, or back to pending on a retryable error, or failed
+# once a job is out of attempts or failed with a permanent error (404 etc.)
+
+
+def createIngestJobsTable():
+    """
+    Creates the 'ingest_jobs' work queue table used for distributed match backfills.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                matchid text PRIMARY KEY,
+                status text NOT NULL DEFAULT 'pending',
+                attempts int NOT NULL DEFAULT 0,
+                lease_owner text,
+                lease_expires_at timestamp,
+                last_error text,
+                created_at timestamp NOT NULL DEFAULT NOW(),
+                updated_at timestamp NOT NULL DEFAULT NOW(),
+                completed_at timestamp
+            );
+            CREATE INDEX IF NOT EXISTS ingest_jobs_claimable_idx
+                ON ingest_jobs (created_at) WHERE status IN ('pending', 'running');
+            """)
+        conn.commit()
+
+
+def enqueueIngestJobs(matchIds):
+    """
+    Adds match IDs to the queue, skipping matches already in the DB, known to fail, or already queued.
+
+    Returns:
+    int: The number of jobs added.
+    """
+    matchIds = findMissingMatchesInDB(list(matchIds))
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            INSERT INTO ingest_jobs (matchid)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (matchid) DO NOTHING;
+            """, (matchIds,))
+            added = cur.rowcount
+        conn.commit()
+    cPrintS(f'{{green}}Queued {{cyan}}{added}{{green}} new ingest jobs')
+    return added
+
+
+def claimIngestJobs(workerId, batchSize=100, leaseSeconds=600, maxAttempts=5):
+    """
+    Leases up to batchSize claimable jobs to a worker.
+
+    Jobs are claimed with FOR UPDATE SKIP LOCKED, so any number of workers can claim concurrently without waiting on
+    each other or getting the same job. Jobs whose lease expired (their worker died) are claimable again until they
+    run out of attempts.
+
+    Returns:
+    list: The claimed match IDs.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'failed', last_error = 'lease expired after the last attempt', lease_owner = NULL,
+                lease_expires_at = NULL, updated_at = NOW()
+            WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= %s;
+            """, (maxAttempts,))
+            cur.execute("""
+            UPDATE ingest_jobs AS j
+            SET status = 'running',
+                attempts = j.attempts + 1,
+                lease_owner = %s,
+                lease_expires_at = NOW() + make_interval(secs => %s),
+                updated_at = NOW()
+            WHERE j.matchid IN (
+                SELECT matchid
+                FROM ingest_jobs
+                WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < NOW()))
+                  AND attempts < %s
+                ORDER BY created_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING j.matchid;
+            """, (workerId, leaseSeconds, maxAttempts, batchSize))
+            matchIds = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return matchIds
+
+
+def extendIngestJobsLease(workerId, matchIds, leaseSeconds=600):
+    """Extends the lease of jobs a worker is still processing."""
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            UPDATE ingest_jobs
+            SET lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE matchid = ANY(%s) AND lease_owner = %s AND status = 'running';
+            """, (leaseSeconds, matchIds, workerId))
+        conn.commit()
+
+
+def completeIngestJobs(matchIds):
+    """Marks jobs as done."""
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'done', completed_at = NOW(), updated_at = NOW(), lease_owner = NULL, lease_expires_at = NULL,
+                last_error = NULL
+            WHERE matchid = ANY(%s);
+            """, (list(matchIds),))
+        conn.commit()
+
+
+def failIngestJobs(workerId, failures, maxAttempts=5):
+    """
+    Records failed jobs of a worker.
+
+    Parameters:
+    workerId (str): The worker holding the lease.
+    failures (dict): Match ID -> HTTP status code, error message, or None for a network failure.
+    maxAttempts (int): Jobs with this many attempts are failed for good.
+
+    Retryable errors (rate limits, server errors, network and DB errors) put the job back to pending until it runs out
+    of attempts; any other status code fails it right away.
+    """
+    if not failures:
+        return
+    matchIds = list(failures)
+    errors = [str(failures[matchID]) for matchID in matchIds]
+    permanent = [isinstance(failures[matchID], int) and failures[matchID] != 429 and failures[matchID] < 500
+                 for matchID in matchIds]
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            UPDATE ingest_jobs AS j
+            SET status = CASE WHEN f.permanent OR j.attempts >= %s THEN 'failed' ELSE 'pending' END,
+                last_error = f.error,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                updated_at = NOW()
+            FROM unnest(%s::text[], %s::text[], %s::boolean[]) AS f (matchid, error, permanent)
+            WHERE j.matchid = f.matchid AND j.lease_owner = %s;
+            """, (maxAttempts, matchIds, errors, permanent, workerId))
+        conn.commit()
+
+
+def getIngestJobCounts():
+    """Returns the number of jobs per status."""
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status;")
+            counts = dict(cur.fetchall())
+    return counts
+
+
+def runIngestWorker(workerId=None, batchSize=100, leaseSeconds=600, maxAttempts=5, concurrency=None, pollInterval=30,
+                    exitWhenEmpty=False):
+    """
+    Runs an ingest worker: claims a batch of jobs, ingests it with the async pipeline, records the results, repeat.
+
+    Any number of workers on any number of machines can run against the same queue. While a batch is being ingested
+    a heartbeat thread keeps extending its lease, so only the jobs of a dead worker become claimable again, and a
+    restarted backfill resumes with exactly the jobs that are not done.
+
+    Parameters:
+    workerId (str, optional): The lease owner name. Defaults to hostname:pid.
+    batchSize (int): Jobs claimed per batch. Defaults to 100.
+    leaseSeconds (int): Lease length, extended every third of it while the batch runs. Defaults to 600.
+    maxAttempts (int): Attempts before a job is failed for good. Defaults to 5.
+    concurrency (int, optional): Concurrent fetchers of the ingest pipeline. Defaults to the 'Ingestion' config.
+    pollInterval (int): Seconds to wait when the queue is empty. Defaults to 30.
+    exitWhenEmpty (bool): Return when no job is claimable instead of polling. Defaults to False.
+    """
+    workerId = workerId or f'{socket.gethostname()}:{os.getpid()}'
+    cPrintS(f'{{green}}Ingest worker {{cyan}}{workerId}{{green}} started')
+    while True:
+        matchIds = claimIngestJobs(workerId, batchSize, leaseSeconds, maxAttempts)
+        if not matchIds:
+            if exitWhenEmpty:
+                cPrintS(f'{{green}}No claimable ingest jobs left, worker {{cyan}}{workerId}{{green}} exiting')
+                return
+            time.sleep(pollInterval)
+            continue
+
+        cPrintS(f'{{green}}Worker {{cyan}}{workerId}{{green}} claimed {{cyan}}{len(matchIds)}{{green}} jobs')
+        batchDone = threading.Event()
+
+        def heartbeat():
+            while not batchDone.wait(leaseSeconds / 3):
+                extendIngestJobsLease(workerId, matchIds, leaseSeconds)
+
+        heartbeatThread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeatThread.start()
+        try:
+            stats = asyncio.run(ingestMatches(matchIds, concurrency=concurrency))
+        finally:
+            batchDone.set()
+            heartbeatThread.join()
+
+        completeIngestJobs(stats['succeeded'])
+        failIngestJobs(workerId, stats['failed'], maxAttempts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Durable match backfill queue (ingest_jobs)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('init', help='create the ingest_jobs table')
+
+    enqueueParser = subparsers.add_parser('enqueue', help='queue the full match history of summoners')
+    enqueueParser.add_argument('--puuid', action='append', help='summoner puuid, defaults to every puuid in the config')
+
+    workerParser = subparsers.add_parser('worker', help='run an ingest worker')
+    workerParser.add_argument('--worker-id')
+    workerParser.add_argument('--batch-size', type=int, default=100)
+    workerParser.add_argument('--lease-seconds', type=int, default=600)
+    workerParser.add_argument('--max-attempts', type=int, default=5)
+    workerParser.add_argument('--concurrency', type=int)
+    workerParser.add_argument('--poll-interval', type=int, default=30)
+    workerParser.add_argument('--exit-when-empty', action='store_true')
+
+    subparsers.add_parser('status', help='show the number of jobs per status')
+
+    args = parser.parse_args()
+    if args.command == 'init':
+        createIngestJobsTable()
+    elif args.command == 'enqueue':
+        for puuid in args.puuid or getDataFromConfig(key='puuids'):
+            enqueueIngestJobs(getAllSummonerMatches(puuid))
+    elif args.command == 'worker':
+        runIngestWorker(args.worker_id, args.batch_size, args.lease_seconds, args.max_attempts, args.concurrency,
+                        args.poll_interval, args.exit_when_empty)
+    elif args.command == 'status':
+        for status, count in sorted(getIngestJobCounts().items()):
+            cPrintS(f'{{green}}{status}: {{cyan}}{count}')
+
+
+if __name__ == "__main__":
+    main()
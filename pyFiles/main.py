@@ -1,4 +1,7 @@
 from data import *
+from duckstore import syncDuckDB
+from migrations import migrate
+from partitions import createFuturePartitions
 from utils import *
 
 # cPrintS('{yellow} Running main.py')
@@ -26,6 +29,23 @@ from utils import *
 # upsertListOfMatches(get50LatestSummonerMatches(getDataFromConfig(key='SummonerData')['GuySun']['puuid']))
 # cPrintS(f'{{green}} Done upserting matches for summoners in config')
 
+# ----------------- Schema Upgrade (python manage.py migrate)  -----------------#
+# migrate()  # creates summoner_sync_state, ingest_jobs, match_participants, the reader indexes and the rollup
+
+# ----------------- Monthly Partitions Of matches (python manage.py create-partitions)  -----------------#
+# createFuturePartitions()  # once the table is partitioned (python manage.py partition-matches), run it monthly
+
+# ----------------- Local DuckDB Mirror For The Dashboard (python manage.py sync-duckdb)  -----------------#
+# syncDuckDB()  # with "Analytics": {"backend": "duckdb"} the app and the analysis read the mirror
+
+# ----------------- Incremental Sync Of Matches For All Summoners In Config  -----------------#
+# syncAllSummonersMatches()
+# cPrintS(f'{{green}} Done syncing new matches for summoners in config')
+
+# ----------------- Normalized Participants Table (python manage.py backfill-participants)  -----------------#
+# backfillMatchParticipants()
+# rebuildSummonerPeriodStats()  # after adding a summoner, the rollup only covers summoners in the DB
+
 # ----------------- Get All Matches Data For All Summoners In Config  -----------------#
 # # Get the puuids of the summoners from the config file
 # dorShaiGuyPuuids = getDataFromConfig(key='puuids')
@@ -0,0 +1,99 @@
+import argparse
+
+from data import backfillMatchParticipants, createMatchParticipantsTable, rebuildSummonerPeriodStats
+from duckstore import syncDuckDB
+from migrations import explainReaderQueries, getSchemaVersion, migrate
+from parquetstore import exportParquet
+from partitions import createFuturePartitions, detachOldPartitions, partitionMatches
+from projection import compactMatches
+from utils import cPrintS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DB maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrateParser = subparsers.add_parser('migrate', help='upgrade the schema to the newest migration')
+    migrateParser.add_argument('--target', type=int, help='stop at this schema version')
+
+    subparsers.add_parser('schema-version', help='show the version of the newest applied migration')
+
+    explainParser = subparsers.add_parser('explain', help='check that the reader queries use an index')
+    explainParser.add_argument('--disable-seqscan', action='store_true',
+                               help='plan with enable_seqscan off, for tables too small to make an index worth it')
+
+    subparsers.add_parser('create-participants', help='create the match_participants table')
+
+    backfillParser = subparsers.add_parser('backfill-participants',
+                                           help='fill match_participants from the matches already in the DB')
+    backfillParser.add_argument('--batch-size', type=int, default=1000)
+    backfillParser.add_argument('--all', action='store_true',
+                                help='rewrite the rows of matches that already have participants')
+
+    rebuildParser = subparsers.add_parser('rebuild-period-stats',
+                                          help='rebuild summoner_period_stats from match_participants')
+    rebuildParser.add_argument('--batch-size', type=int, default=1000)
+
+    exportParser = subparsers.add_parser('export-parquet',
+                                         help='export matches and participants to Parquet, partitioned by month and queue')
+    exportParser.add_argument('--root', help='export directory, defaults to the Parquet config path')
+    exportParser.add_argument('--full', action='store_true', help='export everything instead of what changed')
+
+    compactParser = subparsers.add_parser('compact-matches',
+                                          help='rewrite the stored matches down to the configured projection')
+    compactParser.add_argument('--batch-size', type=int, default=500)
+    compactParser.add_argument('--no-archive', action='store_true',
+                               help='drop the fields without saving the full match to the match store first')
+
+    partitionParser = subparsers.add_parser('partition-matches',
+                                            help='convert matches to monthly range partitions on datetime')
+    partitionParser.add_argument('--months-ahead', type=int, default=3)
+
+    futureParser = subparsers.add_parser('create-partitions',
+                                         help='create the matches partitions of the current and next months')
+    futureParser.add_argument('--months-ahead', type=int, default=3)
+
+    detachParser = subparsers.add_parser('detach-partitions',
+                                         help='detach the matches partitions older than --keep-months')
+    detachParser.add_argument('--keep-months', type=int, required=True)
+    detachParser.add_argument('--drop', action='store_true', help='drop the old partitions instead of archiving them')
+
+    duckParser = subparsers.add_parser('sync-duckdb',
+                                       help='mirror matches, participants and the rollup into the local DuckDB file')
+    duckParser.add_argument('--path', help='DuckDB file, defaults to the Analytics config path')
+    duckParser.add_argument('--full', action='store_true',
+                            help='copy everything again, e.g. after a schema change of a mirrored table')
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        migrate(args.target)
+    elif args.command == 'schema-version':
+        cPrintS(f'{{green}}Schema version: {{cyan}}{getSchemaVersion()}')
+    elif args.command == 'explain':
+        report = explainReaderQueries(args.disable_seqscan)
+        if not all(report.values()):
+            raise SystemExit(1)
+    elif args.command == 'create-participants':
+        createMatchParticipantsTable()
+    elif args.command == 'backfill-participants':
+        backfillMatchParticipants(args.batch_size, onlyMissing=not args.all)
+    elif args.command == 'rebuild-period-stats':
+        rebuildSummonerPeriodStats(args.batch_size)
+    elif args.command == 'export-parquet':
+        for name, rows in exportParquet(args.root, args.full).items():
+            cPrintS(f'{{green}}{name}: {{cyan}}{rows}{{green}} rows exported')
+    elif args.command == 'compact-matches':
+        compactMatches(args.batch_size, archive=not args.no_archive)
+    elif args.command == 'partition-matches':
+        partitionMatches(args.months_ahead)
+    elif args.command == 'create-partitions':
+        createFuturePartitions(args.months_ahead)
+    elif args.command == 'detach-partitions':
+        detachOldPartitions(args.keep_months, drop=args.drop)
+    elif args.command == 'sync-duckdb':
+        for name, rows in syncDuckDB(args.path, args.full).items():
+            cPrintS(f'{{green}}{name}: {{cyan}}{rows}{{green}} rows mirrored')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Compact match keys: a match ID like 'EUW1_6907242392' is stored as (platform smallint, game_id bigint), the key of
+# 'matches' and 'match_participants'. The codes are persisted, so this list only ever grows (migration 9 has a copy).
+platformIds = {
+    'BR1': 1,
+    'EUN1': 2,
+    'EUW1': 3,
+    'JP1': 4,
+    'KR': 5,
+    'LA1': 6,
+    'LA2': 7,
+    'NA1': 8,
+    'OC1': 9,
+    'TR1': 10,
+    'RU': 11,
+    'PH2': 12,
+    'SG2': 13,
+    'TH2': 14,
+    'TW2': 15,
+    'VN2': 16,
+    'ME1': 17,
+}
+platformCodes = {platformId: code for code, platformId in platformIds.items()}
+
+# Platform of the bare game IDs the spectator API returns for the tracked summoners
+defaultPlatform = 'EUW1'
+
+
+def getPlatformId(platform):
+    """Return the smallint id of a platform given as its code ('EUW1', 'euw1') or as the id itself."""
+    if isinstance(platform, int):
+        if platform not in platformCodes:
+            raise ValueError(f'Unknown platform id {platform}')
+        return platform
+    try:
+        return platformIds[platform.upper()]
+    except KeyError:
+        raise ValueError(f'Unknown platform {platform!r}') from None
+
+
+def getMatchKey(matchID, platform=defaultPlatform):
+    """
+    Splits a match ID into its compact key.
+
+    Parameters:
+    matchID (str or int): 'EUW1_6907242392', or a bare game ID (the spectator and tracker IDs).
+    platform (str or int): The platform of a bare game ID. Defaults to defaultPlatform.
+
+    Returns:
+    tuple: (platform id, game ID), e.g. (3, 6907242392).
+    """
+    matchID = str(matchID)
+    if '_' in matchID:
+        platform, matchID = matchID.split('_', 1)
+    return getPlatformId(platform), int(matchID)
+
+
+def getMatchId(platform, gameID):
+    """
+    Builds the match ID of a compact key, e.g. (3, 6907242392) or ('euw1', 6907242392) -> 'EUW1_6907242392'.
+    """
+    return f'{platformCodes[getPlatformId(platform)]}_{int(gameID)}'
@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from utils import getDataFromConfig
+
+
+class MatchStore:
+    """
+    On-disk store of raw match-v5 responses, one gzip compressed JSON file per match.
+
+    Files are addressed by match ID and sharded into two directory levels taken from the SHA-1 of the ID
+    (root/ab/cd/EUW1_123.json.gz), so no directory grows past a few thousand files. Finished matches never change, so
+    an entry is written once and never invalidated.
+
+    Parameters:
+    root (str): The directory of the store, created on first write.
+    compressLevel (int): The gzip compression level. Defaults to 6.
+    """
+
+    def __init__(self, root, compressLevel=6):
+        self.root = root
+        self.compressLevel = compressLevel
+
+    def getPath(self, matchID):
+        digest = hashlib.sha1(matchID.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], f'{matchID}.json.gz')
+
+    def contains(self, matchID):
+        return os.path.exists(self.getPath(matchID))
+
+    def get(self, matchID):
+        """Return the stored match data for matchID, or None if the match is not in the store."""
+        try:
+            with gzip.open(self.getPath(matchID), 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def put(self, matchData):
+        """
+        Store a match-v5 response, unless the match is already stored.
+
+        The file is written to a temporary name and renamed into place, so readers never see a partial file.
+
+        Returns:
+        str: The path of the stored match.
+        """
+        path = self.getPath(matchData['metadata']['matchId'])
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(json.dumps(matchData, separators=(',', ':')).encode(), self.compressLevel))
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+        return path
+
+    def iterMatchIds(self):
+        """Yield the ID of every stored match."""
+        for dirPath, dirNames, fileNames in os.walk(self.root):
+            dirNames.sort()
+            for fileName in sorted(fileNames):
+                if fileName.endswith('.json.gz'):
+                    yield fileName[:-len('.json.gz')]
+
+    def iterMatches(self):
+        """Yield the data of every stored match."""
+        for matchID in self.iterMatchIds():
+            matchData = self.get(matchID)
+            if matchData is not None:
+                yield matchData
+
+
+def getMatchStore():
+    """
+    Create the match store from the optional 'MatchStore' config section ({"path": ..., "enabled": ...}).
+
+    Returns:
+    MatchStore or None: The store, or None if it is disabled in the config.
+    """
+    storeConfig = getDataFromConfig().get('MatchStore', {})
+    if not storeConfig.get('enabled', True):
+        return None
+    return MatchStore(storeConfig.get('path', '../matchStore'), storeConfig.get('compressLevel', 6))
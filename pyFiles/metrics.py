@@ -0,0 +1,194 @@
+import atexit
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from applog import getLogger
+from ratelimit import getRiotMethod
+from utils import getDataFromConfig
+
+log = getLogger('metrics')
+
+# Latency buckets in seconds, from a cached DDragon response to a Riot request held back by the rate limit
+latencyBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Every metric the project exposes: name -> (type, help, histogram buckets)
+metricDefinitions = {
+    'lol_riot_requests_total': ('counter', 'Riot API responses by endpoint and status (error when no response)', None),
+    'lol_riot_request_seconds': ('histogram', 'Riot API request latency by endpoint, rate limit wait included',
+                                 latencyBuckets),
+    'lol_riot_rate_limited_total': ('counter', 'Riot API 429 responses by endpoint', None),
+    'lol_db_connection_seconds': ('histogram', 'Time a pooled DB connection was held, by the function borrowing it',
+                                  latencyBuckets),
+    'lol_db_connection_wait_seconds': ('histogram', 'Time spent waiting for a free pooled DB connection',
+                                       latencyBuckets),
+    'lol_ingest_matches_total': ('counter', 'Matches handled by the ingestion pipeline by result', None),
+    'lol_ingest_queue_depth': ('gauge', 'Items waiting in an ingestion queue (ids to fetch, matches to write)', None),
+    'lol_ingest_matches_per_second': ('gauge', 'Matches upserted per second by the running ingestion', None),
+    'lol_tracker_polls_total': ('counter', 'Spectator polls of the tracker by summoner and state', None),
+}
+
+metricsDefaults = {'port': None, 'host': '127.0.0.1', 'textfile': None, 'interval': 15}
+
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def formatValue(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms, rendered in the Prometheus text exposition format.
+
+    Series are keyed by their label values, so keep labels to small closed sets (endpoint methods, statuses,
+    function and summoner names), never match IDs. Every update is a dict update under one lock.
+
+    Parameters:
+    definitions (dict): Metric name -> (type, help, histogram buckets). Defaults to metricDefinitions.
+    """
+
+    def __init__(self, definitions=None):
+        self.definitions = definitions or metricDefinitions
+        self.lock = threading.Lock()
+        self.series = {name: {} for name in self.definitions}
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[name][key] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = [[0] * (len(buckets) + 1), 0.0, 0]  # bucket counts (+Inf last), sum, count
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            for name, (kind, description, buckets) in self.definitions.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in self.series[name].items():
+                    if kind != 'histogram':
+                        lines.append(f'{name}{formatLabels(key)} {formatValue(value)}')
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucketCount in zip([*buckets, '+Inf'], counts):
+                        cumulative += bucketCount
+                        lines.append(f'{name}_bucket{formatLabels((*key, ("le", str(bound))))} {cumulative}')
+                    lines.append(f'{name}_sum{formatLabels(key)} {formatValue(total)}')
+                    lines.append(f'{name}_count{formatLabels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# The registry of the process, every module records into it
+metrics = MetricsRegistry()
+
+
+def observeRiotRequest(url, status, seconds):
+    """
+    Records one Riot API request.
+
+    Parameters:
+    url (str): The requested URL, reduced to its Riot method (getRiotMethod) so match IDs don't become series.
+    status (int or None): The response status, None when no response came back.
+    seconds (float): The request latency, rate limit wait included.
+    """
+    endpoint = getRiotMethod(urlparse(url).path)
+    metrics.inc('lol_riot_requests_total', endpoint=endpoint, status='error' if status is None else status)
+    metrics.observe('lol_riot_request_seconds', seconds, endpoint=endpoint)
+    if status == 429:
+        metrics.inc('lol_riot_rate_limited_total', endpoint=endpoint)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line
+
+
+def writeTextfile(path):
+    """Writes the metrics to a file for the node_exporter textfile collector, replacing it atomically."""
+    temporaryPath = f'{path}.{os.getpid()}.tmp'
+    with open(temporaryPath, 'w') as f:
+        f.write(metrics.render())
+    os.replace(temporaryPath, path)
+
+
+def dumpTextfile(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            writeTextfile(path)
+        except OSError as error:
+            log.warning('Could not write the metrics textfile %s: %s', path, error)
+
+
+metricsStarted = False
+metricsLock = threading.Lock()
+
+
+def startMetrics(config=None):
+    """
+    Starts the metrics exporters of the optional 'Metrics' config section, once per process.
+
+    With a 'port' the metrics are served at http://host:port/metrics (host defaults to 127.0.0.1). With a 'textfile'
+    they are written to that file every 'interval' seconds and once more at exit. Without either the metrics are only
+    recorded.
+
+    Parameters:
+    config (dict, optional): {"port": 9464, "host": "127.0.0.1", "textfile": "../metrics/lol.prom", "interval": 15}.
+        Defaults to the 'Metrics' config section.
+    """
+    global metricsStarted
+    with metricsLock:
+        if metricsStarted:
+            return
+        metricsStarted = True
+        config = {**metricsDefaults, **(config or getDataFromConfig().get('Metrics', {}))}
+
+        if config['port']:
+            server = ThreadingHTTPServer((config['host'], int(config['port'])), MetricsHandler)
+            threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+            log.info('Serving metrics on http://%s:%s/metrics', config['host'], config['port'])
+        if config['textfile']:
+            path = config['textfile']
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            threading.Thread(target=dumpTextfile, args=(path, config['interval']), name='metrics-textfile',
+                             daemon=True).start()
+            atexit.register(writeTextfile, path)
+            log.info('Writing metrics to %s every %ss', path, config['interval'])
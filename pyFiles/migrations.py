@@ -0,0 +1,324 @@
+import json
+
+from db import getConnection
+from utils import cPrintS, getMonthStart
+
+# Arbitrary key of the advisory lock that keeps two migrators from upgrading the schema at the same time
+migrationLockId = 7240001
+
+# Versioned schema changes, applied in order, each in its own transaction and recorded in 'schema_migrations'.
+# Applied migrations never change: a schema change is always a new entry at the end of the list.
+# The base tables (matches, summoners, champions, upsert_errors, ...) predate this list and are expected to exist.
+migrations = [
+    (1, 'summoner_sync_state', """
+    CREATE TABLE IF NOT EXISTS summoner_sync_state (
+        puuid text PRIMARY KEY,
+        last_game_start_timestamp bigint NOT NULL,
+        updated_at timestamp NOT NULL DEFAULT NOW()
+    );
+    """),
+    (2, 'ingest_jobs', """
+    CREATE TABLE IF NOT EXISTS ingest_jobs (
+        matchid text PRIMARY KEY,
+        status text NOT NULL DEFAULT 'pending',
+        attempts int NOT NULL DEFAULT 0,
+        lease_owner text,
+        lease_expires_at timestamp,
+        last_error text,
+        created_at timestamp NOT NULL DEFAULT NOW(),
+        updated_at timestamp NOT NULL DEFAULT NOW(),
+        completed_at timestamp
+    );
+    CREATE INDEX IF NOT EXISTS ingest_jobs_claimable_idx
+        ON ingest_jobs (created_at) WHERE status IN ('pending', 'running');
+    """),
+    (3, 'match_participants', """
+    CREATE TABLE IF NOT EXISTS match_participants (
+        matchid text NOT NULL,
+        participant_index smallint NOT NULL,
+        game_start timestamp NOT NULL,
+        queue_id int,
+        game_duration int,
+        puuid text,
+        team_id smallint,
+        champion_id int,
+        champion_name text,
+        team_position text,
+        win boolean,
+        kills int,
+        deaths int,
+        assists int,
+        gold_earned int,
+        gold_spent int,
+        total_damage_dealt_to_champions int,
+        total_damage_taken int,
+        total_minions_killed int,
+        vision_score int,
+        wards_placed int,
+        wards_killed int,
+        time_played int,
+        PRIMARY KEY (matchid, participant_index)
+    );
+    CREATE INDEX IF NOT EXISTS match_participants_puuid_game_start_idx
+        ON match_participants (puuid, game_start DESC);
+    """),
+    # Indexes on the exact expressions the data.py readers filter on, a query only uses an expression index when it
+    # repeats the indexed expression
+    (4, 'matches_reader_indexes', """
+    CREATE INDEX IF NOT EXISTS matches_game_id_idx
+        ON matches (((matchinfo ->> 'gameId')::bigint));
+    CREATE INDEX IF NOT EXISTS matches_queue_id_datetime_idx
+        ON matches (((matchinfo -> 'queueId')::int), datetime);
+    CREATE INDEX IF NOT EXISTS matches_datetime_idx
+        ON matches (datetime DESC);
+    CREATE INDEX IF NOT EXISTS matches_participants_gin_idx
+        ON matches USING gin ((matchmetadata -> 'participants') jsonb_path_ops);
+    """),
+    (5, 'summoner_period_stats', """
+    CREATE TABLE IF NOT EXISTS summoner_period_stats (
+        puuid text NOT NULL,
+        granularity text NOT NULL,
+        period_start timestamp NOT NULL,
+        queue_id int NOT NULL,
+        wins int NOT NULL,
+        losses int NOT NULL,
+        total_duration bigint NOT NULL,
+        champion_counts jsonb NOT NULL,
+        best_matchid text,
+        best_champion_name text,
+        best_kills int,
+        best_deaths int,
+        best_assists int,
+        best_kda numeric,
+        updated_at timestamp NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (puuid, granularity, period_start, queue_id)
+    );
+    """),
+    # When a match was last written, the incremental Parquet export picks up the matches written since its last run
+    (6, 'matches_ingested_at', """
+    ALTER TABLE matches ADD COLUMN IF NOT EXISTS ingested_at timestamp NOT NULL DEFAULT NOW();
+    CREATE INDEX IF NOT EXISTS matches_ingested_at_idx ON matches (ingested_at);
+    """),
+    # Per-minute participant frames of a match, a zlib compressed little-endian int32 array of shape
+    # (frame_count, participant_count, metrics), see timelines.py
+    (7, 'match_timelines', """
+    CREATE TABLE IF NOT EXISTS match_timelines (
+        matchid text PRIMARY KEY,
+        frame_interval int NOT NULL,
+        frame_count smallint NOT NULL,
+        participant_count smallint NOT NULL,
+        metrics text[] NOT NULL,
+        frames bytea NOT NULL,
+        ingested_at timestamp NOT NULL DEFAULT NOW()
+    );
+    """),
+    # The match upserts conflict on (matchid, datetime), the only unique key a 'matches' table partitioned by datetime
+    # can have (see partitions.py). A match's datetime is its game start, so this is as unique as matchid alone.
+    (8, 'matches_matchid_datetime_key', """
+    CREATE UNIQUE INDEX IF NOT EXISTS matches_matchid_datetime_idx ON matches (matchid, datetime);
+    """),
+    # Compact match keys (see matchkeys.py): 'EUW1_6907242392' becomes (platform smallint, game_id bigint), the primary
+    # key of 'matches' (with datetime when it is partitioned) and of 'match_participants'. matchid stays as a column.
+    (9, 'compact_match_keys', """
+    CREATE TABLE IF NOT EXISTS platforms (
+        id smallint PRIMARY KEY,
+        code text NOT NULL UNIQUE
+    );
+    INSERT INTO platforms (id, code) VALUES
+        (1, 'BR1'), (2, 'EUN1'), (3, 'EUW1'), (4, 'JP1'), (5, 'KR'), (6, 'LA1'), (7, 'LA2'), (8, 'NA1'), (9, 'OC1'),
+        (10, 'TR1'), (11, 'RU'), (12, 'PH2'), (13, 'SG2'), (14, 'TH2'), (15, 'TW2'), (16, 'VN2'), (17, 'ME1')
+    ON CONFLICT DO NOTHING;
+
+    ALTER TABLE matches ADD COLUMN IF NOT EXISTS platform smallint, ADD COLUMN IF NOT EXISTS game_id bigint;
+    UPDATE matches m SET platform = p.id, game_id = split_part(m.matchid, '_', 2)::bigint
+    FROM platforms p
+    WHERE p.code = split_part(m.matchid, '_', 1) AND m.platform IS NULL;
+    ALTER TABLE matches ALTER COLUMN platform SET NOT NULL, ALTER COLUMN game_id SET NOT NULL;
+
+    ALTER TABLE match_participants ADD COLUMN IF NOT EXISTS platform smallint, ADD COLUMN IF NOT EXISTS game_id bigint;
+    UPDATE match_participants mp SET platform = p.id, game_id = split_part(mp.matchid, '_', 2)::bigint
+    FROM platforms p
+    WHERE p.code = split_part(mp.matchid, '_', 1) AND mp.platform IS NULL;
+    ALTER TABLE match_participants ALTER COLUMN platform SET NOT NULL, ALTER COLUMN game_id SET NOT NULL;
+
+    DROP INDEX IF EXISTS matches_game_id_idx;
+    DROP INDEX IF EXISTS matches_matchid_datetime_idx;
+    DO $$
+    DECLARE
+        tableName text;
+        keyName text;
+    BEGIN
+        FOREACH tableName IN ARRAY ARRAY['matches', 'match_participants'] LOOP
+            SELECT conname INTO keyName FROM pg_constraint WHERE conrelid = tableName::regclass AND contype = 'p';
+            IF keyName IS NOT NULL THEN
+                EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', tableName, keyName);
+            END IF;
+        END LOOP;
+        IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'matches'::regclass) THEN
+            ALTER TABLE matches ADD PRIMARY KEY (platform, game_id, datetime);
+        ELSE
+            ALTER TABLE matches ADD PRIMARY KEY (platform, game_id);
+            -- the upserts' conflict target, the only unique key a partitioned 'matches' can have
+            CREATE UNIQUE INDEX matches_key_datetime_idx ON matches (platform, game_id, datetime);
+        END IF;
+    END $$;
+    ALTER TABLE match_participants ADD PRIMARY KEY (platform, game_id, participant_index);
+    CREATE INDEX IF NOT EXISTS matches_matchid_idx ON matches (matchid);
+    CREATE INDEX IF NOT EXISTS match_participants_matchid_idx ON match_participants (matchid);
+    """),
+]
+
+
+def createSchemaMigrationsTable(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version int PRIMARY KEY,
+        name text NOT NULL,
+        applied_at timestamp NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+def getSchemaVersion():
+    """Returns the version of the newest applied migration, 0 for a schema without migrations."""
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            createSchemaMigrationsTable(cur)
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations;")
+            version = cur.fetchone()[0]
+        conn.commit()
+    return version
+
+
+def migrate(target=None):
+    """
+    Upgrades the schema by applying every migration newer than the current version, up to target.
+
+    Each migration runs in its own transaction together with its 'schema_migrations' row, so a failed migration leaves
+    the schema at the previous version and the next run starts again from it.
+
+    Parameters:
+    target (int, optional): The version to stop at. Defaults to the newest migration.
+
+    Returns:
+    int: The schema version after the upgrade.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            createSchemaMigrationsTable(cur)
+            conn.commit()
+            cur.execute("SELECT pg_advisory_lock(%s);", (migrationLockId,))
+            try:
+                cur.execute("SELECT version FROM schema_migrations;")
+                applied = {row[0] for row in cur.fetchall()}
+                conn.commit()
+                for version, name, sql in migrations:
+                    if version in applied or (target is not None and version > target):
+                        continue
+                    cPrintS(f'{{green}}Applying migration {{cyan}}{version}{{green}} ({{cyan}}{name}{{green}})')
+                    try:
+                        cur.execute(sql)
+                        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                                    (version, name))
+                        conn.commit()
+                    except Exception as error:
+                        conn.rollback()
+                        cPrintS(f'{{red}}Migration {version} ({name}) failed: {error}')
+                        raise
+                    applied.add(version)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (migrationLockId,))
+                conn.commit()
+    version = max(applied, default=0)
+    cPrintS(f'{{green}}Schema is at version {{cyan}}{version}')
+    return version
+
+
+# The query shapes of the data.py readers, with psycopg2 placeholders for the values EXPLAIN is run with
+readerQueries = {
+    'getSummonerMatchDataFromDB': """
+    SELECT m.matchparticipant0 -> 'kills' FROM matches AS m WHERE m.platform = %(platform)s AND m.game_id = %(gameId)s
+    """,
+    'getLastNMatchIDSOfSummonerFromDB': """
+    SELECT m.matchID FROM matches m WHERE m.matchmetadata -> 'participants' @> %(participants)s::jsonb
+      AND m.datetime >= %(lastMonthStart)s
+    ORDER BY datetime desc LIMIT 3
+    """,
+    'getThisWeekMatchIDSFromDB': """
+    SELECT matchID FROM matches
+    WHERE datetime >= %(monthStart)s AND datetime < %(nextMonthStart)s
+      AND (matchinfo -> 'queueId')::int = 420
+      AND matchmetadata -> 'participants' @> %(participants)s::jsonb
+    """,
+    'getPreviousMonthMatchIDSFromDB': """
+    SELECT matchID FROM matches
+    WHERE datetime >= %(lastMonthStart)s AND datetime < %(monthStart)s
+      AND (matchinfo -> 'queueId')::int = 420
+      AND matchmetadata -> 'participants' @> %(participants)s::jsonb
+    """,
+    'getMatchKnownParticipantsIndex': """
+    SELECT puuid, participant_index FROM match_participants WHERE matchid = %(matchId)s AND puuid = ANY(%(puuids)s)
+    """,
+    'getSummonerPeriodStatsFromDB': """
+    SELECT wins, losses FROM summoner_period_stats
+    WHERE puuid = %(puuid)s AND granularity = 'month' AND period_start = date_trunc('month', CURRENT_DATE)::timestamp
+      AND queue_id = 420
+    """,
+}
+
+
+def getPlanScans(plan, scans=None):
+    """Collects (node type, relation, index) of every scan node of an EXPLAIN (FORMAT JSON) plan."""
+    scans = [] if scans is None else scans
+    if 'Relation Name' in plan:
+        scans.append((plan['Node Type'], plan['Relation Name'], plan.get('Index Name')))
+    elif plan['Node Type'] == 'Bitmap Index Scan':
+        scans.append((plan['Node Type'], None, plan.get('Index Name')))
+    for child in plan.get('Plans', []):
+        getPlanScans(child, scans)
+    return scans
+
+
+def explainReaderQueries(disableSeqScan=False):
+    """
+    Runs EXPLAIN on the reader query shapes and reports whether each one uses an index or scans a table sequentially.
+
+    The queries are explained with the IDs of an arbitrary stored match. On a small table the planner rightly prefers
+    a sequential scan, disableSeqScan=True shows whether an index could be used at all.
+
+    Returns:
+    dict: Reader name -> True if no table in its plan is scanned sequentially.
+    """
+    report = {}
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            SELECT matchid, platform, game_id, matchmetadata -> 'participants' ->> 0
+            FROM matches LIMIT 1;
+            """)
+            row = cur.fetchone()
+            if row is None:
+                cPrintS('{yellow}The matches table is empty, there is nothing to explain')
+                return report
+            matchId, platform, gameId, puuid = row
+            params = {'matchId': matchId, 'platform': platform, 'gameId': gameId, 'participants': json.dumps([puuid]), 'puuids': [puuid],
+                      'puuid': puuid, 'monthStart': getMonthStart(), 'nextMonthStart': getMonthStart(offset=1),
+                      'lastMonthStart': getMonthStart(offset=-1)}
+            if disableSeqScan:
+                cur.execute("SET LOCAL enable_seqscan = off;")
+
+            for name, sql in readerQueries.items():
+                cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                scans = getPlanScans(cur.fetchone()[0][0]['Plan'])
+                seqScans = [relation for nodeType, relation, _ in scans if nodeType == 'Seq Scan']
+                report[name] = not seqScans
+                if seqScans:
+                    cPrintS(f'{{red}}{name}: sequential scan on {{cyan}}{", ".join(seqScans)}')
+                else:
+                    indexes = sorted({index for _, _, index in scans if index})
+                    cPrintS(f'{{green}}{name}: uses {{cyan}}{", ".join(indexes)}')
+                # On a partitioned 'matches' this shows whether the date bounds pruned the other months
+                relations = sorted({relation for _, relation, _ in scans if relation})
+                cPrintS(f'{{blue}}{name}: reads {{cyan}}{", ".join(relations)}')
+        conn.rollback()
+    return report
@@ -0,0 +1,212 @@
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data import participantFields
+from db import getConnection
+from utils import cPrintS, getDataFromConfig
+
+sqlToArrowTypes = {'text': pa.string(), 'smallint': pa.int16(), 'int': pa.int32(), 'boolean': pa.bool_()}
+
+# Hive style partition directories: <dataset>/month=YYYY-MM/queue_id=<queueId>/part-0.parquet
+partitioning = ds.partitioning(pa.schema([('month', pa.string()), ('queue_id', pa.int32())]), flavor='hive')
+
+# Every exported query selects month and queue_id first, then the columns of the dataset schema in order. Rows are
+# picked up by matches.ingested_at, so a re-upserted match is exported again and replaces its old rows (by key).
+datasets = {
+    'matches': {
+        'schema': pa.schema([
+            ('matchid', pa.string()),
+            ('game_id', pa.int64()),
+            ('game_start', pa.timestamp('us')),
+            ('game_duration', pa.int32()),
+            ('game_version', pa.string()),
+            ('game_mode', pa.string()),
+            ('platform_id', pa.string()),
+            ('map_id', pa.int32()),
+            ('ingested_at', pa.timestamp('us')),
+        ]),
+        'keys': ['matchid'],
+        'sql': """
+        SELECT to_char(m.datetime, 'YYYY-MM'), COALESCE((m.matchinfo ->> 'queueId')::int, 0),
+               m.matchid, m.game_id, m.datetime, (m.matchinfo ->> 'gameDuration')::int,
+               m.matchinfo ->> 'gameVersion', m.matchinfo ->> 'gameMode', m.matchinfo ->> 'platformId',
+               (m.matchinfo ->> 'mapId')::int, m.ingested_at
+        FROM matches m
+        WHERE m.ingested_at > %(since)s
+        ORDER BY m.ingested_at;
+        """,
+    },
+    'participants': {
+        'schema': pa.schema([
+            ('matchid', pa.string()),
+            ('participant_index', pa.int16()),
+            ('game_start', pa.timestamp('us')),
+            ('game_duration', pa.int32()),
+            *[(column, sqlToArrowTypes[sqlType]) for column, _, sqlType in participantFields],
+            ('ingested_at', pa.timestamp('us')),
+        ]),
+        'keys': ['matchid', 'participant_index'],
+        'sql': f"""
+        SELECT to_char(mp.game_start, 'YYYY-MM'), COALESCE(mp.queue_id, 0),
+               mp.matchid, mp.participant_index, mp.game_start, mp.game_duration,
+               {', '.join(f'mp.{column}' for column, _, _ in participantFields)}, m.ingested_at
+        FROM match_participants mp
+        JOIN matches m ON m.platform = mp.platform AND m.game_id = mp.game_id
+        WHERE m.ingested_at > %(since)s
+        ORDER BY m.ingested_at;
+        """,
+    },
+}
+
+
+def getParquetConfig():
+    """Return the export settings of the optional 'Parquet' config section ({"path": ..., "compression": ...})."""
+    return {'path': '../parquet', 'compression': 'zstd', 'batchSize': 50000, 'overlapSeconds': 300,
+            **getDataFromConfig().get('Parquet', {})}
+
+
+def getStatePath(root):
+    # Files starting with '_' are skipped by pyarrow dataset discovery
+    return os.path.join(root, '_exportState.json')
+
+
+def readExportState(root):
+    try:
+        with open(getStatePath(root), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def writeExportState(root, state):
+    tmpPath = getStatePath(root) + '.tmp'
+    with open(tmpPath, 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(tmpPath, getStatePath(root))
+
+
+def getKeyColumn(table, keys):
+    """A single string column identifying each row, for replacing the rows of re-exported matches."""
+    columns = [pc.cast(table[key], pa.string()) for key in keys]
+    return columns[0] if len(columns) == 1 else pc.binary_join_element_wise(*columns, '#')
+
+
+def writePartition(datasetPath, month, queueId, table, keys, compression):
+    """
+    Merges rows into the single file of a month/queue partition, replacing existing rows with the same key.
+
+    The file is written next to the old one and swapped in with os.replace, so readers never see a partial file.
+    """
+    partitionPath = os.path.join(datasetPath, f'month={month}', f'queue_id={queueId}')
+    filePath = os.path.join(partitionPath, 'part-0.parquet')
+    os.makedirs(partitionPath, exist_ok=True)
+    if os.path.exists(filePath):
+        existing = pq.ParquetFile(filePath).read().cast(table.schema)
+        replaced = pc.is_in(getKeyColumn(existing, keys), value_set=getKeyColumn(table, keys))
+        table = pa.concat_tables([existing.filter(pc.invert(replaced)), table])
+    table = table.sort_by([('game_start', 'ascending')])
+    tmpPath = filePath + '.tmp'
+    pq.write_table(table, tmpPath, compression=compression)
+    os.replace(tmpPath, filePath)
+
+
+def exportDataset(name, root, since, batchSize, compression):
+    """
+    Exports the rows of one dataset whose match was ingested after since.
+
+    Returns:
+    tuple: (rows exported, the newest ingested_at seen or None)
+    """
+    spec = datasets[name]
+    schema = spec['schema']
+    datasetPath = os.path.join(root, name)
+    exported = 0
+    newest = None
+    with getConnection() as conn:
+        # A named (server-side) cursor streams the rows in batches instead of loading the whole table
+        with conn.cursor(name=f'parquet_export_{name}') as cur:
+            cur.itersize = batchSize
+            cur.execute(spec['sql'], {'since': since})
+            while True:
+                rows = cur.fetchmany(batchSize)
+                if not rows:
+                    break
+                partitions = defaultdict(list)
+                for row in rows:
+                    partitions[(row[0], row[1])].append(row[2:])
+                for (month, queueId), partitionRows in partitions.items():
+                    columns = list(zip(*partitionRows))
+                    table = pa.table([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                     schema=schema)
+                    writePartition(datasetPath, month, queueId, table, spec['keys'], compression)
+                exported += len(rows)
+                newest = rows[-1][-1]  # rows come ordered by ingested_at
+                cPrintS(f'{{green}}Exported {{cyan}}{exported}{{green}} {name} rows to Parquet')
+        conn.commit()
+    return exported, newest
+
+
+def exportParquet(root=None, full=False):
+    """
+    Incrementally exports 'matches' and 'match_participants' to typed, compressed Parquet files partitioned by month
+    and queueId.
+
+    Only matches ingested since the last export are read (matches.ingested_at, minus a small overlap for transactions
+    that committed late), and only the partitions they fall into are rewritten.
+
+    Parameters:
+    root (str, optional): The export directory. Defaults to the 'Parquet' config path.
+    full (bool): Export everything again instead of only what changed. Defaults to False.
+
+    Returns:
+    dict: Dataset name -> rows exported.
+    """
+    config = getParquetConfig()
+    root = root or config['path']
+    os.makedirs(root, exist_ok=True)
+    state = {} if full else readExportState(root)
+    overlap = timedelta(seconds=config['overlapSeconds'])
+
+    exported = {}
+    for name in datasets:
+        since = datetime.fromisoformat(state[name]) - overlap if name in state else datetime(1970, 1, 1)
+        exported[name], newest = exportDataset(name, root, since, config['batchSize'], config['compression'])
+        if newest is not None:
+            state[name] = newest.isoformat()
+            writeExportState(root, state)
+    return exported
+
+
+def loadParquet(dataset='participants', columns=None, months=None, queues=None, rowFilter=None, root=None):
+    """
+    Loads an exported dataset into a DataFrame, reading only the needed columns and partitions.
+
+    Parameters:
+    dataset (str): 'matches' or 'participants'. Defaults to 'participants'.
+    columns (list, optional): The columns to read (month and queue_id can be selected too). Defaults to every column.
+    months (list, optional): 'YYYY-MM' months to read, other month directories are never opened.
+    queues (list, optional): Queue IDs to read, other queue directories are never opened.
+    rowFilter (pyarrow.dataset.Expression, optional): An extra row filter, e.g. ds.field('puuid') == puuid, applied
+        with the Parquet row group statistics.
+    root (str, optional): The export directory. Defaults to the 'Parquet' config path.
+
+    Returns:
+    pandas.DataFrame: The selected rows and columns.
+    """
+    root = root or getParquetConfig()['path']
+    dataset = ds.dataset(os.path.join(root, dataset), format='parquet', partitioning=partitioning)
+    expression = rowFilter
+    if months is not None:
+        monthFilter = ds.field('month').isin(list(months))
+        expression = monthFilter if expression is None else expression & monthFilter
+    if queues is not None:
+        queueFilter = ds.field('queue_id').isin(list(queues))
+        expression = queueFilter if expression is None else expression & queueFilter
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -0,0 +1,203 @@
+import re
+from datetime import datetime
+
+from db import getConnection
+from migrations import migrations
+from utils import cPrintS, getMonthStart
+
+# Monthly partitions of 'matches' are named matches_yYYYYmMM and hold the games started in [month start, next month)
+partitionNamePattern = re.compile(r'^matches_y(\d{4})m(\d{2})$')
+
+# Detached partitions kept for later are moved to this schema, ALTER TABLE ... ATTACH PARTITION brings one back
+archiveSchema = 'matches_archive'
+
+# The migrations whose indexes are rebuilt on the partitioned table (the reader indexes and ingested_at), see
+# migrations.py. The key the upserts conflict on becomes the new primary key.
+matchesIndexMigrations = [4, 6]
+
+# Months known to have a partition, None until first checked, empty when 'matches' is not partitioned
+knownPartitions = None
+matchesPartitioned = None
+
+
+def getPartitionName(monthStart):
+    return f'matches_y{monthStart.year}m{monthStart.month:02d}'
+
+
+def isMatchesPartitioned(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('matches'));")
+    return cur.fetchone()[0]
+
+
+def getMatchPartitions(cur):
+    """Returns month start -> partition name of the monthly partitions attached to 'matches'."""
+    cur.execute("""
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'matches'::regclass;
+    """)
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = partitionNamePattern.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def createMatchPartition(cur, monthStart):
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {getPartitionName(monthStart)} PARTITION OF matches
+    FOR VALUES FROM (%s) TO (%s);
+    """, (monthStart, getMonthStart(monthStart, 1)))
+
+
+def createFuturePartitions(monthsAhead=3):
+    """
+    Creates the partitions of the current month and of the next monthsAhead months, if they do not exist yet.
+
+    Returns:
+    list: The names of the partitions created.
+    """
+    created = []
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            if not isMatchesPartitioned(cur):
+                cPrintS('{yellow}The matches table is not partitioned, run partition-matches first')
+                return created
+            existing = getMatchPartitions(cur)
+            for offset in range(monthsAhead + 1):
+                monthStart = getMonthStart(offset=offset)
+                if monthStart not in existing:
+                    createMatchPartition(cur, monthStart)
+                    created.append(getPartitionName(monthStart))
+        conn.commit()
+    for name in created:
+        cPrintS(f'{{green}}Created partition {{cyan}}{name}')
+    return created
+
+
+def ensureMatchPartitions(matchDateTimes):
+    """
+    Makes sure the months of the given game starts have a partition before matches are written to them.
+
+    Backfilled matches can be older than every partition created ahead of time. The known months are cached, so
+    this only touches the DB for a month not seen before, in its own short transaction (a failed match upsert does
+    not roll the partition back). Does nothing when 'matches' is not partitioned.
+
+    Parameters:
+    matchDateTimes (iterable): 'YYYY-MM-DD HH:MM:SS' strings or datetimes, as in the 'matches'.datetime column.
+    """
+    global knownPartitions, matchesPartitioned
+    months = {datetime.strptime(str(value)[:7], '%Y-%m') for value in matchDateTimes}
+    if matchesPartitioned is False or (knownPartitions is not None and months <= knownPartitions):
+        return
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            if matchesPartitioned is None:
+                matchesPartitioned = isMatchesPartitioned(cur)
+                if not matchesPartitioned:
+                    return
+            knownPartitions = set(getMatchPartitions(cur))
+            for monthStart in sorted(months - knownPartitions):
+                createMatchPartition(cur, monthStart)
+        conn.commit()
+    knownPartitions |= months
+
+
+def partitionMatches(monthsAhead=3):
+    """
+    Converts 'matches' into a table range partitioned by month on datetime, in one transaction.
+
+    The rows are copied into a partition per month that has games (plus monthsAhead future months), then the old
+    table is dropped and the indexes of matchesIndexMigrations are built on the new one. The primary key becomes
+    (platform, game_id, datetime), since a partitioned table's unique keys must include the partition key. The table is locked
+    for the whole copy, so run it while nothing is ingesting.
+
+    Returns:
+    int: The number of partitions created.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            if isMatchesPartitioned(cur):
+                cPrintS('{yellow}The matches table is already partitioned')
+                return 0
+            cur.execute("LOCK TABLE matches IN ACCESS EXCLUSIVE MODE;")
+            cur.execute("SELECT MIN(datetime), COUNT(*) FROM matches;")
+            oldest, rowCount = cur.fetchone()
+
+            cur.execute("ALTER TABLE matches RENAME TO matches_unpartitioned;")
+            cur.execute("""
+            CREATE TABLE matches (LIKE matches_unpartitioned INCLUDING DEFAULTS)
+            PARTITION BY RANGE (datetime);
+            """)
+            monthStart = getMonthStart(oldest) if oldest is not None else getMonthStart()
+            lastMonth = getMonthStart(offset=monthsAhead)
+            partitionCount = 0
+            while monthStart <= lastMonth:
+                createMatchPartition(cur, monthStart)
+                partitionCount += 1
+                monthStart = getMonthStart(monthStart, 1)
+            cPrintS(f'{{green}}Copying {{cyan}}{rowCount}{{green}} matches into {{cyan}}{partitionCount}{{green}} '
+                    f'monthly partitions')
+            cur.execute("INSERT INTO matches SELECT * FROM matches_unpartitioned;")
+            cur.execute("DROP TABLE matches_unpartitioned;")
+
+            # The compact match key of migration 9, or matchid on a schema that predates it
+            cur.execute("""
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = 'matches' AND column_name = 'game_id');
+            """)
+            compactKeys = cur.fetchone()[0]
+            if compactKeys:
+                cur.execute("ALTER TABLE matches ADD PRIMARY KEY (platform, game_id, datetime);")
+                cur.execute("CREATE INDEX IF NOT EXISTS matches_matchid_idx ON matches (matchid);")
+            else:
+                cur.execute("ALTER TABLE matches ADD PRIMARY KEY (matchid, datetime);")
+            for version, name, sql in migrations:
+                if version in matchesIndexMigrations:
+                    cur.execute(sql)
+            if compactKeys:
+                # Replaced by the game_id column of the key
+                cur.execute("DROP INDEX IF EXISTS matches_game_id_idx;")
+        conn.commit()
+    cPrintS(f'{{green}}The matches table is partitioned by month')
+    return partitionCount
+
+
+def detachOldPartitions(keepMonths, drop=False):
+    """
+    Detaches the partitions of the months before the last keepMonths months (the current month included).
+
+    Detached partitions are moved to the archiveSchema schema, where they can be dumped or attached back, or dropped
+    with drop=True. Their match_participants, period stats and Parquet rows are left as they are.
+
+    Parameters:
+    keepMonths (int): The number of recent months to keep attached.
+    drop (bool): Drop the old partitions instead of archiving them. Defaults to False.
+
+    Returns:
+    list: The names of the detached partitions.
+    """
+    cutoff = getMonthStart(offset=1 - keepMonths)
+    detached = []
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            if not isMatchesPartitioned(cur):
+                cPrintS('{yellow}The matches table is not partitioned, there is nothing to detach')
+                return detached
+            if not drop:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {archiveSchema};")
+            for monthStart, name in sorted(getMatchPartitions(cur).items()):
+                if monthStart >= cutoff:
+                    continue
+                cur.execute(f"ALTER TABLE matches DETACH PARTITION {name};")
+                if drop:
+                    cur.execute(f"DROP TABLE {name};")
+                else:
+                    cur.execute(f"ALTER TABLE {name} SET SCHEMA {archiveSchema};")
+                detached.append(name)
+        conn.commit()
+    for name in detached:
+        cPrintS(f'{{green}}{"Dropped" if drop else "Archived"} partition {{cyan}}{name}')
+    return detached
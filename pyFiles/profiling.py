@@ -0,0 +1,256 @@
+import atexit
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# LOL_PROFILE picks the functions to profile in depth, e.g. 'upsertMatchDataBatch,getSummonerMatchDataFromDB=sample'.
+# Each function runs under cProfile (the default, '=cprofile') or a stack sampler ('=sample'), '*' matches every
+# decorated function. The results are written to LOL_PROFILE_DIR at exit.
+profileEnvVar = 'LOL_PROFILE'
+profileDirEnvVar = 'LOL_PROFILE_DIR'
+sampleIntervalEnvVar = 'LOL_PROFILE_INTERVAL'
+reportEnvVar = 'LOL_PROFILE_REPORT'
+
+defaultProfileDir = '../profiles'
+defaultSampleInterval = 0.005
+
+# The percentiles are computed over this many of the latest calls of a function
+latencyWindow = 2048
+
+
+def parseProfileTargets(value):
+    """Parse LOL_PROFILE ('name,name=sample,...') into function name -> 'cprofile' or 'sample'."""
+    targets = {}
+    for entry in (value or '').split(','):
+        name, _, mode = entry.strip().partition('=')
+        if not name:
+            continue
+        mode = mode.strip().lower() or 'cprofile'
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f'{profileEnvVar}: unknown profiling mode {mode!r} for {name}, use cprofile or sample')
+        targets[name] = mode
+    return targets
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ProfileRegistry:
+    """
+    Call counts, wall time and exceptions of the functions decorated with profiled, per function.
+
+    Recording a call costs two perf_counter reads and a dict update under a lock. The functions named in LOL_PROFILE
+    are additionally run under cProfile, or sampled by a background thread, and dumped at exit.
+
+    Parameters:
+    targets (dict, optional): Function name -> 'cprofile' or 'sample'. Defaults to the LOL_PROFILE variable.
+    """
+
+    def __init__(self, targets=None):
+        self.targets = parseProfileTargets(os.environ.get(profileEnvVar)) if targets is None else targets
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.profilers = {}
+        self.samples = {}
+        self.sampledThreads = {}  # thread ident -> function name, the calls the sampler is looking at
+        self.sampler = None
+        self.local = threading.local()
+
+    def getMode(self, name):
+        return self.targets.get(name, self.targets.get('*'))
+
+    def record(self, name, seconds, error=None):
+        with self.lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'errors': Counter(),
+                                            'latencies': deque(maxlen=latencyWindow)}
+            entry['calls'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['latencies'].append(seconds)
+            if error is not None:
+                entry['errors'][type(error).__name__] += 1
+
+    def startDeepProfile(self, name, mode):
+        """Start cProfile or the sampler for one call, unless this thread is already profiling an outer call."""
+        if getattr(self.local, 'active', False):
+            return None
+        self.local.active = True
+        if mode == 'cprofile':
+            with self.lock:
+                profiler = self.profilers.setdefault(name, cProfile.Profile())
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler, like a debugger's, is active
+                self.local.active = False
+                return None
+            return profiler
+        with self.lock:
+            self.sampledThreads[threading.get_ident()] = name
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, name='profile-sampler', daemon=True)
+                self.sampler.start()
+        return mode
+
+    def stopDeepProfile(self, handle):
+        if handle is None:
+            return
+        if isinstance(handle, cProfile.Profile):
+            handle.disable()
+        else:
+            with self.lock:
+                self.sampledThreads.pop(threading.get_ident(), None)
+        self.local.active = False
+
+    def sample(self):
+        interval = float(os.environ.get(sampleIntervalEnvVar, defaultSampleInterval))
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                sampled = dict(self.sampledThreads)
+            if not sampled:
+                continue
+            frames = sys._current_frames()
+            for threadId, name in sampled.items():
+                frame = frames.get(threadId)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    if code.co_name == name:
+                        break
+                    frame = frame.f_back
+                if stack:
+                    with self.lock:
+                        self.samples.setdefault(name, Counter())[';'.join(reversed(stack))] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+        dict: Function name -> 'calls', 'total', 'mean', 'p95' and 'max' seconds and 'errors' (exception name ->
+        count), the p95 of the latest calls only.
+        """
+        with self.lock:
+            return {name: {'calls': entry['calls'], 'total': entry['total'], 'mean': entry['total'] / entry['calls'],
+                           'p95': percentile(entry['latencies'], 0.95), 'max': entry['max'],
+                           'errors': dict(entry['errors'])}
+                    for name, entry in self.stats.items()}
+
+    def formatReport(self):
+        """Return the snapshot as a table, the functions with the most cumulative time first."""
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]['total'], reverse=True)
+        if not rows:
+            return ''
+        width = max(len('function'), *(len(name) for name, _ in rows))
+        lines = [f'{"function":<{width}} {"calls":>8} {"total s":>10} {"mean ms":>10} {"p95 ms":>10} {"max ms":>10}'
+                 f'  errors']
+        for name, entry in rows:
+            errors = ', '.join(f'{error} x{count}' for error, count in entry['errors'].items())
+            lines.append(f'{name:<{width}} {entry["calls"]:>8} {entry["total"]:>10.3f} {entry["mean"] * 1000:>10.2f} '
+                         f'{entry["p95"] * 1000:>10.2f} {entry["max"] * 1000:>10.2f}  {errors}')
+        return '\n'.join(lines)
+
+    def dumpDeepProfiles(self, directory):
+        """
+        Writes <function>.prof (cProfile, for pstats or snakeviz) and <function>.folded (sampled stacks in the
+        collapsed format flamegraph.pl and speedscope read) files.
+
+        Returns:
+        list: The files written.
+        """
+        with self.lock:
+            profilers = dict(self.profilers)
+            samples = {name: Counter(stacks) for name, stacks in self.samples.items()}
+        if not profilers and not samples:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        for name, profiler in profilers.items():
+            path = os.path.join(directory, f'{name}.prof')
+            profiler.dump_stats(path)
+            written.append(path)
+        for name, stacks in samples.items():
+            path = os.path.join(directory, f'{name}.folded')
+            with open(path, 'w') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            written.append(path)
+        return written
+
+    def report(self, stream=None):
+        """
+        Prints the timing table and the top of every cProfile, and writes the deep profiles. Runs at exit.
+
+        The table goes to stderr, or as JSON to the file named by LOL_PROFILE_REPORT.
+        """
+        stream = stream or sys.stderr
+        table = self.formatReport()
+        if not table:
+            return
+        reportPath = os.environ.get(reportEnvVar)
+        if reportPath:
+            with open(reportPath, 'w') as f:
+                json.dump(self.snapshot(), f, indent=2)
+        else:
+            print(f'\nProfiled functions\n{table}', file=stream)
+        for name, profiler in list(self.profilers.items()):
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(15)
+            print(f'\ncProfile of {name}\n{output.getvalue()}', file=stream)
+        for path in self.dumpDeepProfiles(os.environ.get(profileDirEnvVar, defaultProfileDir)):
+            print(f'Wrote {path}', file=stream)
+
+
+# The registry of the process
+profiles = ProfileRegistry()
+atexit.register(profiles.report)
+
+
+def profiled(func):
+    """
+    Decorator recording every call of a function (or coroutine function) in the profiles registry: call count,
+    cumulative, mean, p95 and max wall time, and the exceptions it raised. The function is also run under cProfile
+    or the sampler when LOL_PROFILE names it. Coroutine functions are only timed, their await time included.
+    """
+    name = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def asyncWrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as error:
+                profiles.record(name, time.perf_counter() - start, error)
+                raise
+            profiles.record(name, time.perf_counter() - start)
+            return result
+
+        return asyncWrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        mode = profiles.getMode(name) if profiles.targets else None
+        handle = profiles.startDeepProfile(name, mode) if mode else None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as error:
+            profiles.record(name, time.perf_counter() - start, error)
+            raise
+        finally:
+            profiles.stopDeepProfile(handle)
+        profiles.record(name, time.perf_counter() - start)
+        return result
+
+    return wrapper
@@ -0,0 +1,142 @@
+from db import getConnection
+from matchstore import getMatchStore
+from utils import cPrintS, getDataFromConfig
+
+# The match fields kept in Postgres when the projection is enabled. This covers everything the readers, the dashboard
+# and the analysis use, the full responses stay in the match store. None for a section keeps all of its fields.
+defaultProjection = {
+    'metadata': ['dataVersion', 'matchId', 'participants'],
+    'info': ['endOfGameResult', 'gameCreation', 'gameDuration', 'gameEndTimestamp', 'gameId', 'gameMode',
+             'gameStartTimestamp', 'gameType', 'gameVersion', 'mapId', 'platformId', 'queueId', 'teams'],
+    'participant': ['assistMePings', 'assists', 'champLevel', 'championId', 'championName', 'deaths', 'goldEarned',
+                    'goldSpent', 'individualPosition', 'item0', 'item1', 'item2', 'item3', 'item4', 'item5', 'item6',
+                    'kills', 'magicDamageDealtToChampions', 'participantId', 'physicalDamageDealtToChampions', 'puuid',
+                    'riotIdGameName', 'riotIdTagline', 'summoner1Id', 'summoner2Id', 'summonerId', 'summonerName',
+                    'teamId', 'teamPosition', 'timePlayed', 'totalDamageDealtToChampions', 'totalDamageTaken',
+                    'totalMinionsKilled', 'trueDamageDealtToChampions', 'visionScore', 'wardsKilled', 'wardsPlaced',
+                    'win'],
+}
+
+
+def getProjection():
+    """
+    Return the field projection of the optional 'Projection' config section, or None if it is not enabled.
+
+    The section is {"enabled": true, "metadata": [...], "info": [...], "participant": [...]}, a missing list falls
+    back to defaultProjection and null keeps every field of that section.
+    """
+    projectionConfig = getDataFromConfig().get('Projection', {})
+    if not projectionConfig.get('enabled', False):
+        return None
+    return {section: projectionConfig.get(section, fields) for section, fields in defaultProjection.items()}
+
+
+def projectFields(data, fields):
+    if data is None or fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def projectMatch(matchData, projection):
+    """Return a copy of a match-v5 match with only the fields of the projection."""
+    info = dict(projectFields(matchData['info'], projection['info']))
+    info['participants'] = [projectFields(participant, projection['participant'])
+                            for participant in matchData['info']['participants']]
+    return {'metadata': projectFields(matchData['metadata'], projection['metadata']), 'info': info}
+
+
+def getProjectionSql(column, param):
+    """SQL that keeps only the keys in the text[] parameter param of a jsonb column."""
+    return f"""CASE WHEN {column} IS NULL THEN NULL ELSE COALESCE(
+        (SELECT jsonb_object_agg(e.key, e.value) FROM jsonb_each({column}) AS e WHERE e.key = ANY(%({param})s)),
+        '{{}}'::jsonb) END"""
+
+
+def getMatchFromRow(row):
+    """Rebuild a match-v5 response from a 'matches' row (matchid, metadata, info, participant columns)."""
+    info = dict(row[2])
+    info['participants'] = [participant for participant in row[3:] if participant is not None]
+    return {'metadata': row[1], 'info': info}
+
+
+def compactMatches(batchSize=500, archive=True):
+    """
+    Rewrites the existing 'matches' rows down to the configured projection and reports the bytes saved.
+
+    Parameters:
+    batchSize (int): Matches rewritten per transaction. Defaults to 500.
+    archive (bool): Save the full match to the match store first if it is not there yet, so no field is lost.
+        Defaults to True.
+
+    Returns:
+    dict: 'matches' rewritten, 'bytesBefore' and 'bytesAfter' (stored size of the JSON columns of those rows).
+
+    The freed space is reused by new rows; VACUUM FULL (or pg_repack) returns it to the operating system.
+    """
+    projection = getProjection()
+    if projection is None:
+        raise ValueError('The projection is not enabled in the config, there is nothing to compact to')
+    store = getMatchStore() if archive else None
+    if archive and store is None:
+        raise ValueError('The match store is disabled in the config, compact with archive=False to drop the fields')
+
+    participantColumns = [f'matchparticipant{i}' for i in range(10)]
+    jsonColumns = ['matchmetadata', 'matchinfo', *participantColumns]
+    sizeSql = ' + '.join(f'COALESCE(pg_column_size({column}), 0)' for column in jsonColumns)
+    # Rows that still have a field outside the projection (checked on the first participant)
+    staleConditions = [f"EXISTS (SELECT 1 FROM jsonb_object_keys({column}) AS k WHERE NOT k = ANY(%({section})s))"
+                       for column, section in [('matchmetadata', 'metadata'), ('matchinfo', 'info'),
+                                               ('matchparticipant0', 'participant')]
+                       if projection[section] is not None]
+    if not staleConditions:
+        raise ValueError('The projection keeps every field, there is nothing to compact')
+    assignments = [f'{column} = {getProjectionSql(column, section)}'
+                   for column, section in [('matchmetadata', 'metadata'), ('matchinfo', 'info'),
+                                           *[(column, 'participant') for column in participantColumns]]
+                   if projection[section] is not None]
+
+    stats = {'matches': 0, 'bytesBefore': 0, 'bytesAfter': 0}
+    lastMatchID = ''
+    while True:
+        with getConnection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                SELECT matchid, {sizeSql}
+                FROM matches
+                WHERE matchid > %(after)s AND ({' OR '.join(staleConditions)})
+                ORDER BY matchid
+                LIMIT %(limit)s
+                FOR UPDATE;
+                """, {**projection, 'after': lastMatchID, 'limit': batchSize})
+                batch = cur.fetchall()
+                if not batch:
+                    break
+                matchIds = [row[0] for row in batch]
+
+                if archive:
+                    missing = [matchID for matchID in matchIds if not store.contains(matchID)]
+                    if missing:
+                        cur.execute(f"""
+                        SELECT matchid, matchmetadata, matchinfo, {', '.join(participantColumns)}
+                        FROM matches WHERE matchid = ANY(%s);
+                        """, (missing,))
+                        for row in cur.fetchall():
+                            store.put(getMatchFromRow(row))
+
+                cur.execute(f"UPDATE matches SET {', '.join(assignments)} WHERE matchid = ANY(%(matchIds)s);",
+                            {**projection, 'matchIds': matchIds})
+                cur.execute(f"SELECT COALESCE(SUM({sizeSql}), 0) FROM matches WHERE matchid = ANY(%s);", (matchIds,))
+                stats['bytesAfter'] += cur.fetchone()[0]
+            conn.commit()
+        stats['matches'] += len(batch)
+        stats['bytesBefore'] += sum(row[1] for row in batch)
+        lastMatchID = matchIds[-1]
+        cPrintS(f'{{green}}Compacted {{cyan}}{stats["matches"]}{{green}} matches, '
+                f'{{cyan}}{(stats["bytesBefore"] - stats["bytesAfter"]) / 2 ** 20:.1f} MiB{{green}} saved so far')
+
+    saved = stats['bytesBefore'] - stats['bytesAfter']
+    cPrintS(f'{{green}}Compaction finished: {{cyan}}{stats["matches"]}{{green}} matches rewritten, '
+            f'{{cyan}}{stats["bytesBefore"] / 2 ** 20:.1f} MiB{{green}} -> {{cyan}}{stats["bytesAfter"] / 2 ** 20:.1f} MiB'
+            f'{{green}} ({{cyan}}{saved / 2 ** 20:.1f} MiB{{green}}, '
+            f'{{cyan}}{100 * saved / stats["bytesBefore"] if stats["bytesBefore"] else 0:.0f}%{{green}} saved)')
+    return stats
@@ -0,0 +1,337 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from utils import cPrintS
+
+# Riot method names for the endpoints we call, matched by path prefix (and suffix where needed)
+methodPatterns = [
+    ('/lol/match/v5/matches/by-puuid/', '/ids', 'match-v5.getMatchIdsByPUUID'),
+    ('/lol/match/v5/matches/', '/timeline', 'match-v5.getTimeline'),
+    ('/lol/match/v5/matches/', '', 'match-v5.getMatch'),
+    ('/lol/league/v4/entries/by-summoner/', '', 'league-v4.getLeagueEntriesForSummoner'),
+    ('/lol/summoner/v4/summoners/by-name/', '', 'summoner-v4.getBySummonerName'),
+    ('/lol/summoner/v4/summoners/by-puuid/', '', 'summoner-v4.getByPUUID'),
+    ('/lol/platform/v3/champion-rotations', '', 'champion-v3.getChampionInfo'),
+    ('/lol/spectator/v5/active-games/by-summoner/', '', 'spectator-v5.getCurrentGameInfoByPuuid'),
+]
+
+
+def getRiotMethod(path):
+    """
+    Map a Riot API path to the method name its method rate limit is counted against.
+
+    Parameters:
+    path (str): The URL path, e.g. '/lol/match/v5/matches/EUW1_123'.
+
+    Returns:
+    str: The method name, or the first four path segments for endpoints we do not know.
+    """
+    for prefix, suffix, method in methodPatterns:
+        if path.startswith(prefix) and path.endswith(suffix):
+            return method
+    return '/'.join(path.split('/')[:5])
+
+
+def parseRateLimitHeader(value):
+    """
+    Parse a rate limit header such as '20:1,100:120' into a list of (count, seconds) tuples.
+
+    For the X-*-Rate-Limit headers the first number is the limit, for the X-*-Rate-Limit-Count headers it is the
+    number of requests the server has counted in that window.
+    """
+    if not value:
+        return []
+    pairs = []
+    for part in value.split(','):
+        count, seconds = part.strip().split(':')
+        pairs.append((int(count), int(seconds)))
+    return pairs
+
+
+class RateLimitBucket:
+    """
+    Sliding window permit bucket for one rate limit scope (an application key on a region, or one method of it).
+
+    Until the limits of the bucket are learned from the response headers only one probe request is let through at a
+    time, so a fresh process never bursts past a limit it has not seen yet.
+    """
+
+    probeTimeout = 10
+
+    def __init__(self, padding):
+        self.padding = padding
+        self.windows = {}  # window seconds -> [limit, deque of permit timestamps]
+        self.blockedUntil = 0
+        self.probeStartedAt = None
+
+    def setLimits(self, limits):
+        for limit, seconds in limits:
+            if seconds in self.windows:
+                self.windows[seconds][0] = limit
+            else:
+                self.windows[seconds] = [limit, deque()]
+        self.probeStartedAt = None
+
+    def syncCounts(self, counts, now):
+        # Other processes using the same key show up in the server side counts, so never trust a lower local count
+        for count, seconds in counts:
+            if seconds not in self.windows:
+                continue
+            stamps = self.windows[seconds][1]
+            self.prune(stamps, seconds, now)
+            for _ in range(count - len(stamps)):
+                stamps.append(now)
+
+    def prune(self, stamps, seconds, now):
+        while stamps and stamps[0] + seconds + self.padding <= now:
+            stamps.popleft()
+
+    def waitTime(self, now):
+        wait = self.blockedUntil - now
+        if not self.windows:
+            if self.probeStartedAt is not None and now - self.probeStartedAt < self.probeTimeout:
+                wait = max(wait, 0.05)
+            return wait
+        for seconds, (limit, stamps) in self.windows.items():
+            self.prune(stamps, seconds, now)
+            if len(stamps) >= limit:
+                # The permit that has to expire before another one fits into this window
+                wait = max(wait, stamps[len(stamps) - limit] + seconds + self.padding - now)
+        return wait
+
+    def record(self, now):
+        if not self.windows:
+            self.probeStartedAt = now
+        for seconds, (limit, stamps) in self.windows.items():
+            stamps.append(now)
+
+
+class RateLimitGovernor:
+    """
+    Process-wide rate limit governor for the Riot API, shared by the sync `data.request` and the async
+    `tracking.asyncRequest`.
+
+    Callers take a permit before every request with `acquire` (blocking) or `acquireAsync` (asyncio), and report every
+    response with `update`. The governor learns the X-App-Rate-Limit / X-Method-Rate-Limit headers and their -Count
+    headers, and keeps a sliding window bucket per API key and region (application limit) and per API key, region and
+    method (method limit). A 429 blocks the scope named by X-Rate-Limit-Type for Retry-After seconds.
+
+    Hosts other than *.api.riotgames.com (ddragon) are not rate limited and pass through without a permit.
+    """
+
+    def __init__(self, padding=0.1):
+        self.padding = padding
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def getBucketKeys(self, url, headers):
+        parsedUrl = urlparse(url)
+        if not parsedUrl.netloc.endswith('.api.riotgames.com'):
+            return None
+        apiKey = (headers or {}).get('X-Riot-Token')
+        region = parsedUrl.netloc.split('.')[0]
+        return (apiKey, region), (apiKey, region, getRiotMethod(parsedUrl.path))
+
+    def getBucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = RateLimitBucket(self.padding)
+        return bucket
+
+    def reserve(self, keys):
+        """Take a permit from every bucket in keys and return 0, or return how long to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            buckets = [self.getBucket(key) for key in keys]
+            wait = max(bucket.waitTime(now) for bucket in buckets)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.record(now)
+            return 0
+
+    def acquire(self, url, headers=None):
+        """
+        Block until a request to url may be sent without exceeding any known rate limit.
+
+        Returns:
+        float: The number of seconds spent waiting.
+        """
+        keys = self.getBucketKeys(url, headers)
+        if keys is None:
+            return 0
+        waited = 0
+        while True:
+            wait = self.reserve(keys)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquireAsync(self, url, headers=None):
+        """The asyncio version of `acquire`, waits with asyncio.sleep so the event loop keeps running."""
+        keys = self.getBucketKeys(url, headers)
+        if keys is None:
+            return 0
+        waited = 0
+        while True:
+            wait = self.reserve(keys)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def update(self, url, headers, responseHeaders, status, defaultRetryAfter=30):
+        """
+        Feed the rate limit headers of a response (or None for a request that failed without one) back into the
+        buckets of url.
+
+        Parameters:
+        url (str): The requested URL.
+        headers (dict): The request headers, used to find the API key.
+        responseHeaders (Mapping): The response headers, a case-insensitive mapping from requests or aiohttp.
+        status (int): The response status code, or None if the request raised.
+        defaultRetryAfter (int): Seconds to block for on a 429 without a Retry-After header.
+        """
+        keys = self.getBucketKeys(url, headers)
+        if keys is None:
+            return
+        responseHeaders = responseHeaders or {}
+        appKey, methodKey = keys
+        with self.lock:
+            now = time.monotonic()
+            appBucket = self.getBucket(appKey)
+            methodBucket = self.getBucket(methodKey)
+            for bucket, prefix in ((appBucket, 'X-App-Rate-Limit'), (methodBucket, 'X-Method-Rate-Limit')):
+                bucket.setLimits(parseRateLimitHeader(responseHeaders.get(prefix)))
+                bucket.syncCounts(parseRateLimitHeader(responseHeaders.get(f'{prefix}-Count')), now)
+                bucket.probeStartedAt = None
+
+            if status == 429:
+                retryAfter = int(responseHeaders.get('Retry-After', defaultRetryAfter))
+                limitType = responseHeaders.get('X-Rate-Limit-Type', 'method')
+                bucket = appBucket if limitType == 'application' else methodBucket
+                bucket.blockedUntil = max(bucket.blockedUntil, now + retryAfter)
+                cPrintS(f'{{yellow}}Rate limit governor is holding {{cyan}}{limitType}{{yellow}} requests for '
+                        f'{{cyan}}{methodKey[1]} {methodKey[2]}{{yellow}} for {retryAfter} seconds')
+
+
+governor = RateLimitGovernor()
+
+
+def simulateSustainedLoad(duration=15, syncWorkers=4, asyncWorkers=4):
+    """
+    Run sync and asyncio clients sharing one governor against a fake Riot server that enforces its rate limits the way
+    the real API does, and report how many requests were answered with a 429.
+
+    Returns:
+    tuple: (successful requests, 429 responses)
+    """
+    import json
+    import urllib.error
+    import urllib.request
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    appLimits = '10:1,40:5'
+    methodLimits = '6:1'
+    serverLock = threading.Lock()
+    serverWindows = {}  # (scope, seconds) -> [window start, count]
+
+    class FakeRiotHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with serverLock:
+                now = time.monotonic()
+                scopes = [('application', parseRateLimitHeader(appLimits)),
+                          ('method', parseRateLimitHeader(methodLimits))]
+                exceeded = None
+                for scope, limits in scopes:
+                    for limit, seconds in limits:
+                        window = serverWindows.setdefault((scope, seconds), [now, 0])
+                        if now - window[0] >= seconds:
+                            window[0], window[1] = now, 0
+                        if window[1] >= limit and exceeded is None:
+                            exceeded = (scope, window[0] + seconds - now)
+                if exceeded is None:
+                    for scope, limits in scopes:
+                        for limit, seconds in limits:
+                            serverWindows[(scope, seconds)][1] += 1
+                counts = {scope: ','.join(f'{serverWindows[(scope, seconds)][1]}:{seconds}'
+                                          for limit, seconds in limits) for scope, limits in scopes}
+
+            self.send_response(200 if exceeded is None else 429)
+            self.send_header('X-App-Rate-Limit', appLimits)
+            self.send_header('X-App-Rate-Limit-Count', counts['application'])
+            self.send_header('X-Method-Rate-Limit', methodLimits)
+            self.send_header('X-Method-Rate-Limit-Count', counts['method'])
+            if exceeded is not None:
+                self.send_header('X-Rate-Limit-Type', exceeded[0])
+                self.send_header('Retry-After', str(int(exceeded[1]) + 1))
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'path': self.path}).encode())
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRiotHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fakeHost = f'127.0.0.1:{server.server_address[1]}'
+
+    simulationGovernor = RateLimitGovernor()
+    headers = {'X-Riot-Token': 'RGAPI-simulation'}
+    # The governor only governs Riot hosts, so the requests are addressed to one and sent to the fake server
+    riotUrl = 'https://europe.api.riotgames.com/lol/match/v5/matches/EUW1_{}'
+    results = {'ok': 0, 'limited': 0}
+    resultsLock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def send(i):
+        url = riotUrl.format(i)
+        fakeUrl = url.replace('https://europe.api.riotgames.com', f'http://{fakeHost}')
+        try:
+            with urllib.request.urlopen(fakeUrl) as response:
+                status, responseHeaders = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            status, responseHeaders = e.code, e.headers
+        simulationGovernor.update(url, headers, responseHeaders, status)
+        with resultsLock:
+            results['ok' if status == 200 else 'limited'] += 1
+
+    def syncWorker(workerIndex):
+        i = 0
+        while time.monotonic() < deadline:
+            simulationGovernor.acquire(riotUrl.format(i), headers)
+            send(f'sync{workerIndex}_{i}')
+            i += 1
+
+    async def asyncWorker(workerIndex):
+        loop = asyncio.get_running_loop()
+        i = 0
+        while time.monotonic() < deadline:
+            await simulationGovernor.acquireAsync(riotUrl.format(i), headers)
+            await loop.run_in_executor(None, send, f'async{workerIndex}_{i}')
+            i += 1
+
+    async def runAsyncWorkers():
+        await asyncio.gather(*(asyncWorker(i) for i in range(asyncWorkers)))
+
+    threads = [threading.Thread(target=syncWorker, args=(i,)) for i in range(syncWorkers)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(runAsyncWorkers())
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    cPrintS(f'{{green}}Fake server load: {{cyan}}{results["ok"]}{{green}} requests served '
+            f'({results["ok"] / duration:.2f}/s, limit {appLimits} app / {methodLimits} method), '
+            f'{{cyan}}{results["limited"]}{{green}} rate limited')
+    return results['ok'], results['limited']
+
+
+if __name__ == "__main__":
+    served, limited = simulateSustainedLoad()
+    raise SystemExit(1 if limited else 0)
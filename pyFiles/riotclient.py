@@ -0,0 +1,185 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from applog import getLogger
+from metrics import observeRiotRequest
+from ratelimit import governor
+from utils import explainStatus
+
+log = getLogger('riotclient')
+
+
+class RiotClient:
+    """
+    HTTP client for the Riot API and Data Dragon that keeps one keep-alive connection pool per host.
+
+    Every host (europe.api.riotgames.com, euw1.api.riotgames.com, ddragon.leagueoflegends.com, ...) gets its own
+    requests.Session, so consecutive calls reuse the open TCP+TLS connection instead of handshaking again. The Riot API
+    sessions carry the request headers (the API key), so callers don't pass them on every call.
+
+    Parameters:
+    requestHeaders (dict): The headers sent to the Riot API hosts, e.g. {'X-Riot-Token': ...}.
+    platform (str): The default platform routing value for league-v4, summoner-v4 and champion-v3. Defaults to 'euw1'.
+    region (str): The default regional routing value for match-v5. Defaults to 'europe'.
+    poolSize (int): The maximum number of kept-alive connections per host. Defaults to 10.
+    httpCache (HttpCache, optional): The cache used by requests made with useCache=True. Defaults to None.
+    """
+
+    def __init__(self, requestHeaders, platform='euw1', region='europe', poolSize=10, httpCache=None):
+        self.requestHeaders = requestHeaders
+        self.platform = platform
+        self.region = region
+        self.poolSize = poolSize
+        self.httpCache = httpCache
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def getSession(self, host):
+        """Return the pooled session for host, creating it on first use."""
+        session = self.sessions.get(host)
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.poolSize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    if host.endswith('.api.riotgames.com'):
+                        session.headers.update(self.requestHeaders)
+                    self.sessions[host] = session
+        return session
+
+    def close(self):
+        """Close every pooled connection."""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+    def request(self, url, headers=None, params=None, max_retries=5, defaultRetryAfter=30, useCache=False):
+        """
+        Make a GET request through the pooled session of the URL's host. Automatically retries on rate limit.
+
+        Parameters:
+        url (str): The URL to make the request to.
+        headers (dict, optional): Extra headers for this request, on top of the session headers. Defaults to None.
+        params (dict, optional): The parameters to include in the request. Defaults to None.
+        max_retries (int, optional): Maximum number of retries if rate limited. Defaults to 5.
+        useCache (bool, optional): Serve the request from the HTTP cache while fresh, and revalidate it with a
+            conditional request after that. Defaults to False.
+
+        Returns:
+        The response object if the status code is 200, the status code if 429 or 404, and the status code with explanation for all other cases.
+
+        Every attempt takes a permit from the shared rate limit governor first, so requests are paced to the limits Riot
+        reports instead of sleeping only after a 429.
+        """
+        cacheKey = cachedEntry = None
+        if useCache and self.httpCache is not None:
+            cacheKey = self.httpCache.getKey(url, params)
+            cachedEntry = self.httpCache.lookup(cacheKey)
+            if cachedEntry is not None:
+                if self.httpCache.isFresh(cachedEntry, url):
+                    return self.httpCache.toResponse(cachedEntry, url)
+                headers = {**(headers or {}), **self.httpCache.getValidators(cachedEntry)}
+
+        session = self.getSession(urlparse(url).netloc)
+        rateLimitHeaders = {**session.headers, **(headers or {})}
+        for attempt in range(max_retries):
+            start = time.monotonic()
+            try:
+                governor.acquire(url, rateLimitHeaders)
+                response = session.get(url, headers=headers, params=params)
+                governor.update(url, rateLimitHeaders, response.headers, response.status_code, defaultRetryAfter)
+                observeRiotRequest(url, response.status_code, time.monotonic() - start)
+
+                if response.status_code == 200:
+                    log.debug('Request successful', extra={'url': url})
+                    if cacheKey is not None:
+                        self.httpCache.store(cacheKey, response)
+                    return response
+                elif response.status_code == 304 and cachedEntry is not None:
+                    # Not modified since the cached copy, serve the stored body
+                    self.httpCache.touch(cacheKey, response)
+                    return self.httpCache.toResponse(cachedEntry, url)
+                elif response.status_code == 429:
+                    # Rate limit hit. The governor holds the next attempt until Retry-After has passed.
+                    waitTime = response.headers.get('Retry-After', defaultRetryAfter)
+                    log.warning('Rate limit hit, retrying in %s seconds', waitTime, extra={'url': url})
+                    continue
+                elif response.status_code == 404:
+                    log.info('404 Not Found', extra={'url': url})
+                    return response
+                else:
+                    # Other errors
+                    log.error('Error code %s: %s', response.status_code, explainStatus(response.status_code),
+                              extra={'url': url})
+                    return response
+
+            except requests.exceptions.RequestException as e:
+                governor.update(url, rateLimitHeaders, None, None)
+                observeRiotRequest(url, None, time.monotonic() - start)
+                log.warning('Error making request: %s', e, extra={'url': url, 'attempt': attempt + 1})
+                if attempt == max_retries - 1:
+                    log.error('Max retries reached, unable to resolve the request error', extra={'url': url})
+                    return f'Error: {str(e)}'
+
+        # If all retries fail
+        return 'Failed after maximum retries'
+
+    # ----------------- match-v5 ----------------- #
+
+    def getMatch(self, matchID, region=None):
+        """GET /lol/match/v5/matches/{matchId}"""
+        return self.request(f'https://{region or self.region}.api.riotgames.com/lol/match/v5/matches/{matchID}')
+
+    def getMatchTimeline(self, matchID, region=None):
+        """GET /lol/match/v5/matches/{matchId}/timeline"""
+        return self.request(
+            f'https://{region or self.region}.api.riotgames.com/lol/match/v5/matches/{matchID}/timeline')
+
+    def getMatchIdsByPuuid(self, puuid, start=0, count=100, startTime=None, region=None):
+        """GET /lol/match/v5/matches/by-puuid/{puuid}/ids"""
+        params = {'start': start, 'count': count}
+        if startTime is not None:
+            params['startTime'] = startTime
+        return self.request(
+            f'https://{region or self.region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids',
+            params=params)
+
+    # ----------------- league-v4 / summoner-v4 / champion-v3 ----------------- #
+
+    def getLeagueEntriesBySummoner(self, summonerID, platform=None):
+        """GET /lol/league/v4/entries/by-summoner/{encryptedSummonerId}"""
+        return self.request(
+            f'https://{platform or self.platform}.api.riotgames.com/lol/league/v4/entries/by-summoner/{summonerID}')
+
+    def getSummonerByName(self, summonerName, platform=None):
+        """GET /lol/summoner/v4/summoners/by-name/{summonerName}"""
+        return self.request(
+            f'https://{platform or self.platform}.api.riotgames.com/lol/summoner/v4/summoners/by-name/{summonerName}')
+
+    def getChampionRotations(self, platform=None, useCache=False):
+        """GET /lol/platform/v3/champion-rotations"""
+        return self.request(f'https://{platform or self.platform}.api.riotgames.com/lol/platform/v3/champion-rotations',
+                            useCache=useCache)
+
+    # ----------------- Data Dragon ----------------- #
+
+    def getDdragonVersions(self, useCache=False):
+        """GET ddragon api/versions.json"""
+        return self.request('https://ddragon.leagueoflegends.com/api/versions.json', useCache=useCache)
+
+    def getDdragonChampions(self, version, language='en_US', useCache=False):
+        """GET ddragon cdn/{version}/data/{language}/champion.json"""
+        return self.request(f'https://ddragon.leagueoflegends.com/cdn/{version}/data/{language}/champion.json',
+                            useCache=useCache)
+
+    def getDdragonChampionIcon(self, version, champion):
+        """GET ddragon cdn/{version}/img/champion/{champion}.png"""
+        return self.request(f'https://ddragon.leagueoflegends.com/cdn/{version}/img/champion/{champion}.png')
@@ -0,0 +1,116 @@
+import zlib
+
+import numpy as np
+
+from db import getConnection
+
+# Per-minute participant frame values kept from a match-v5 timeline, dotted names are nested keys of the frame
+timelineMetrics = [
+    'totalGold',
+    'currentGold',
+    'xp',
+    'level',
+    'minionsKilled',
+    'jungleMinionsKilled',
+    'position.x',
+    'position.y',
+    'damageStats.totalDamageDoneToChampions',
+    'damageStats.totalDamageTaken',
+]
+
+timelineUpsertSql = """
+    INSERT INTO match_timelines (matchid, frame_interval, frame_count, participant_count, metrics, frames)
+    VALUES %s
+    ON CONFLICT (matchid)
+    DO UPDATE SET
+        frame_interval = EXCLUDED.frame_interval,
+        frame_count = EXCLUDED.frame_count,
+        participant_count = EXCLUDED.participant_count,
+        metrics = EXCLUDED.metrics,
+        frames = EXCLUDED.frames,
+        ingested_at = NOW()
+    """
+
+
+def getFrameValue(participantFrame, metric):
+    value = participantFrame
+    for key in metric.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return 0 if value is None else value
+
+
+def decodeTimeline(timelineData, metrics=None):
+    """
+    Turns a match-v5 timeline into a dense int32 array of shape (frames, participants, metrics).
+
+    Participants are ordered by participantId, so index i is the player at index i of the match's info.participants.
+    The events of each frame are not kept.
+
+    Parameters:
+    timelineData (dict): The match-v5 timeline response.
+    metrics (list, optional): The participant frame values to keep. Defaults to timelineMetrics.
+
+    Returns:
+    numpy.ndarray: The frames.
+    """
+    metrics = metrics or timelineMetrics
+    frames = timelineData['info']['frames']
+    participantIds = sorted({int(participantId) for frame in frames for participantId in frame['participantFrames']})
+    array = np.zeros((len(frames), len(participantIds), len(metrics)), dtype=np.int32)
+    for f, frame in enumerate(frames):
+        for p, participantId in enumerate(participantIds):
+            participantFrame = frame['participantFrames'].get(str(participantId), {})
+            array[f, p] = [getFrameValue(participantFrame, metric) for metric in metrics]
+    return array
+
+
+def encodeFrames(array):
+    """Compresses a frames array into the blob stored in match_timelines (little-endian int32, zlib)."""
+    return zlib.compress(np.ascontiguousarray(array, dtype='<i4').tobytes(), 6)
+
+
+def decodeFrames(blob, frameCount, participantCount, metricCount):
+    return np.frombuffer(zlib.decompress(blob), dtype='<i4').reshape(frameCount, participantCount, metricCount)
+
+
+def getTimelineRow(matchID, timelineData):
+    """Converts a match-v5 timeline into its 'match_timelines' row, in the column order of timelineUpsertSql."""
+    array = decodeTimeline(timelineData)
+    return (matchID, timelineData['info'].get('frameInterval', 60000), array.shape[0], array.shape[1],
+            timelineMetrics, encodeFrames(array))
+
+
+def loadTimelines(matchIds, metrics=None):
+    """
+    Loads the timelines of many matches at once into one array.
+
+    Parameters:
+    matchIds (list): The matches to load, matches without a stored timeline are left out.
+    metrics (list, optional): The metrics to return, in this order. Defaults to every stored metric.
+
+    Returns:
+    dict: 'matchIds' (the loaded matches, in the order of matchIds), 'metrics', 'frameCounts' (int array, one per
+    match) and 'frames', a float32 array of shape (matches, most frames, most participants, metrics), padded with
+    NaN where a match has fewer frames or players.
+    """
+    with getConnection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            SELECT matchid, frame_count, participant_count, metrics, frames
+            FROM match_timelines
+            WHERE matchid = ANY(%s);
+            """, (list(matchIds),))
+            rows = {row[0]: row[1:] for row in cur.fetchall()}
+
+    loadedIds = [matchID for matchID in dict.fromkeys(matchIds) if matchID in rows]
+    metrics = metrics or (rows[loadedIds[0]][2] if loadedIds else timelineMetrics)
+    frameCounts = np.array([rows[matchID][0] for matchID in loadedIds], dtype=np.int32)
+    maxParticipants = max((rows[matchID][1] for matchID in loadedIds), default=10)
+    frames = np.full((len(loadedIds), frameCounts.max(initial=0), maxParticipants, len(metrics)), np.nan,
+                     dtype=np.float32)
+    for i, matchID in enumerate(loadedIds):
+        frameCount, participantCount, storedMetrics, blob = rows[matchID]
+        array = decodeFrames(blob, frameCount, participantCount, len(storedMetrics))
+        columns = [storedMetrics.index(metric) for metric in metrics]
+        frames[i, :frameCount, :participantCount] = array[:, :, columns]
+    return {'matchIds': loadedIds, 'metrics': metrics, 'frameCounts': frameCounts, 'frames': frames}
@@ -1,16 +1,20 @@
 import asyncio
 import json
+import time
 import aiohttp
-from datetime import datetime
 
-from data import requestHeaders, getSummonerNamesFromDB, connect_db
+from applog import getLogger
+from db import getConnection
+from matchkeys import defaultPlatform, getMatchId
+from metrics import metrics, observeRiotRequest, startMetrics
+from ratelimit import governor
 
-from utils import cPrintS, getDetailsFromSummonerName, getSummonerNameFromPuuid, timestampToDate, \
-    getDataFromConfig
+from utils import getDetailsFromSummonerName, getSummonerNameFromPuuid, timestampToDate, \
+    getDataFromConfig, getRequestHeaders
 
+log = getLogger('tracking')
 
-def getCurrentHMS():
-    return datetime.now().strftime('%H:%M:%S')
+requestHeaders = getRequestHeaders()
 
 
 async def asyncRequest(url, headers=None, params=None, session=None, max_retries=5):
@@ -23,33 +27,38 @@ async def asyncRequest(url, headers=None, params=None, session=None, max_retries
 
 async def makeAsyncRequest(session, url, headers, params, max_retries):
     for attempt in range(max_retries):
+        start = time.monotonic()
         try:
+            await governor.acquireAsync(url, headers)
             async with session.get(url, headers=headers, params=params) as response:
+                governor.update(url, headers, response.headers, response.status)
+                observeRiotRequest(url, response.status, time.monotonic() - start)
                 if response.status == 200:
                     return await response.json()  # Successful response
                 elif response.status == 403:
-                    cPrintS('{{red}}Error 403: Forbidden. Check API key permissions.')
+                    log.error('Error 403: Forbidden. Check API key permissions.', extra={'url': url})
                     return None
                 elif response.status == 401:
-                    cPrintS(f'{{red}}Error 401: Unauthorized. Do not forget to renew the API key.')
+                    log.error('Error 401: Unauthorized. Do not forget to renew the API key.', extra={'url': url})
                     return None
                 elif response.status == 404:
                     return None
                 elif response.status == 429:
-                    # Handle rate limiting
+                    # Handle rate limiting, the governor holds the next attempt until Retry-After has passed
                     retry_after = int(
                         response.headers.get("Retry-After", 30))  # Default to 30 seconds if header is missing
-                    cPrintS(f'{{red}}Rate limit exceeded. Retrying in {retry_after} seconds.')
+                    log.warning('Rate limit exceeded, retrying in %s seconds', retry_after, extra={'url': url})
                     if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_after)
                         continue
                     else:
-                        cPrintS('{{red}}Maximum retries reached after rate limit. Aborting.')
+                        log.error('Maximum retries reached after rate limit, aborting', extra={'url': url})
                         return None
                 else:
                     return response  # Return the response object for further inspection
         except aiohttp.ClientError as e:
-            cPrintS(f'{{red}}Error occurred: {e}')
+            governor.update(url, headers, None, None)
+            observeRiotRequest(url, None, time.monotonic() - start)
+            log.warning('Error occurred: %s', e, extra={'url': url, 'attempt': attempt + 1})
             if attempt == max_retries - 1:
                 return None  # Return None in case of persistent errors
 
@@ -114,14 +123,8 @@ class SummonerTracker:
          - psycopg2.DatabaseError: If there is an error connecting to the database or executing the SQL query.
          """
 
-        conn = None
-        try:
-            # Connect to the PostgreSQL database
-            conn = connect_db()
-            cur = conn.cursor()
-
-            # SQL for upserting the champion link to db from the dictionary
-            upsert_sql = """
+        # SQL for upserting the champion link to db from the dictionary
+        upsert_sql = """
        INSERT INTO "summonerRanks" (puuid, tier, rank, "updateTimestamp", "leaguePoints")
         VALUES (%s, %s, %s, NOW(), %s)
         ON CONFLICT (puuid) DO UPDATE SET
@@ -131,24 +134,27 @@ class SummonerTracker:
         "leaguePoints" = EXCLUDED."leaguePoints";
         """
 
-            # Execute the upsert command for each champion
-            cur.execute(upsert_sql, vars=(puuid, tier, division, leaguePoints))
-            # Commit the changes
-            conn.commit()
-            cPrintS(f"{{cyan}}{getSummonerNameFromPuuid(puuid)} {{green}}Ranked data upserted successfully .")
+        try:
+            # Borrow a connection from the pool
+            with getConnection() as conn:
+                with conn.cursor() as cur:
+                    # Execute the upsert command for each champion
+                    cur.execute(upsert_sql, vars=(puuid, tier, division, leaguePoints))
+                # Commit the changes
+                conn.commit()
+            log.info('Ranked data upserted', extra={'summoner': getSummonerNameFromPuuid(puuid)})
 
         except Exception as e:
             # Handle any exceptions that occur during the upsert process
-            cPrintS(f"{{red}}Error upserting ranked data for {getSummonerNameFromPuuid(puuid)}: {e}")
+            log.error('Error upserting ranked data: %s', e, extra={'summoner': getSummonerNameFromPuuid(puuid)})
             raise e
-        finally:
-            if conn is not None:
-                conn.close()
 
     async def fetchSummonerStatus(self, summoner):
         """Check if the summoner is currently in a game."""
         url = f"https://euw1.api.riotgames.com/lol/spectator/v5/active-games/by-summoner/{summoner.puuid}"
         response = await asyncRequest(url, session=self.session, headers=requestHeaders)
+        metrics.inc('lol_tracker_polls_total', summoner=summoner.name,
+                    state='inGame' if isinstance(response, dict) else 'notInGame')
         if isinstance(response, dict):  # Assume response is JSON data when in game
             summoner.state = 'inGame'
             summoner.gameID = response.get('gameId', None)
@@ -163,7 +169,7 @@ class SummonerTracker:
         url = f"https://euw1.api.riotgames.com/lol/spectator/v5/active-games/by-summoner/{summoner.puuid}"
         response = await asyncRequest(url, session=self.session, headers=requestHeaders)
         if response is None:
-            cPrintS(f'{{yellow}} asyncRequest returned None for {summoner.name} preGameData')
+            log.warning('asyncRequest returned None for the pre-game data', extra={'summoner': summoner.name})
             return None
         if isinstance(response, dict):
             preGameData = {'gameID': response.get('gameId', None),
@@ -174,8 +180,6 @@ class SummonerTracker:
             return None
 
     async def asyncUpsertPreGameData(self, summoner, preGameData):
-        conn = connect_db()
-        curr = conn.cursor()
         sql = '''
     INSERT INTO summoner_matches (game_id, summoner_puuid, start_timestamp, "preGameMatchData")
     VALUES (%s, %s, %s, %s)
@@ -184,45 +188,44 @@ class SummonerTracker:
     "preGameMatchData" = EXCLUDED."preGameMatchData";
         '''
         if preGameData is None:
-            cPrintS(f"{{yellow}}{getCurrentHMS()} - {{red}}No pre-game data available for {{cyan}}{summoner.name}.")
+            log.warning('No pre-game data available', extra={'summoner': summoner.name})
             return False
 
         preGameMatchDataJson = json.dumps(preGameData)  # Ensure you serialize the complete pre-game data
-        curr.execute(sql, (
-            preGameData['gameID'],
-            summoner.puuid,
-            timestampToDate(preGameData['gameStartTime']),
-            preGameMatchDataJson
-        ))
-        conn.commit()
-        curr.close()
-        conn.close()
+        with getConnection() as conn:
+            with conn.cursor() as curr:
+                curr.execute(sql, (
+                    preGameData['gameID'],
+                    summoner.puuid,
+                    timestampToDate(preGameData['gameStartTime']),
+                    preGameMatchDataJson
+                ))
+            conn.commit()
         return True
 
     async def checkIfGameStillGoing(self, summoner, gameID):
         region = 'euw1'  # Example region
         url = f"https://{region}.api.riotgames.com/lol/spectator/v5/active-games/by-summoner/{summoner.puuid}"
         response = await asyncRequest(url, session=self.session, headers=requestHeaders)
+        metrics.inc('lol_tracker_polls_total', summoner=summoner.name, state='waitingForGameEnd')
 
         if response is None:
             # If the response is None, it means the asyncRequest returned None, likely due to a 404 or network error
-            cPrintS(
-                f'{{yellow}}{getCurrentHMS()} - {{cyan}}{getSummonerNameFromPuuid(summoner.puuid)} {{red}}Is not in game.')
+            log.info('Is not in game', extra={'summoner': summoner.name})
             return False
 
         if isinstance(response, dict):
             # Check if the gameID matches the expected gameID
             if response.get('gameId') == gameID:
-                cPrintS(
-                    f'{{yellow}}{getCurrentHMS()} - {{green}}{getSummonerNameFromPuuid(summoner.puuid)} is still in game.')
+                log.debug('Still in game', extra={'summoner': summoner.name, 'gameId': gameID})
                 return True
             else:
-                cPrintS(
-                    f'{{yellow}}{getCurrentHMS()} - {{red}}Game ID mismatch, summoner might have started a new game or the previous game ended.')
+                log.info('Game ID mismatch, the summoner might have started a new game or the previous game ended',
+                         extra={'summoner': summoner.name, 'gameId': gameID})
                 return False
         else:
             # Handle unexpected response format
-            print(response)
+            log.error('Unexpected response: %s', response, extra={'summoner': summoner.name})
             raise Exception("Unexpected response format: Response is not a dictionary.")
 
     async def waitForGameToEnd(self, summoner, game):
@@ -234,7 +237,7 @@ class SummonerTracker:
             await asyncio.sleep(sleep_duration)
             game_ongoing = await self.checkIfGameStillGoing(summoner, gameID=game.gameID)
 
-        cPrintS(f"{{yellow}}{getCurrentHMS()} - {{blue}}Game {game.gameID} has ended.")
+        log.info('Game has ended', extra={'summoner': summoner.name, 'gameId': game.gameID})
 
     async def asyncGetMatchKnownParticipantsIndex(self, matchDataResponse: object) -> object:
 
@@ -246,20 +249,17 @@ class SummonerTracker:
                 puuidFound = participant['puuid']
                 knownMatchParticipants[participant['puuid']] = i
                 summonersFound += 1
-                cPrintS(
-                    f'{{green}}Found Summoner puuid: {{cyan}}{puuidFound} {{green}}at index{{cyan}} {i} {{green}}and '
-                    f'added to result dict')
-        cPrintS(
-            f'{{green}}Found total of {{cyan}}{summonersFound}{{green}} summoners in match {{cyan}}{matchDataResponse["metadata"]["matchId"]}')
+                log.debug('Found summoner %s at participant index %s', puuidFound, i)
+        log.debug('Found %s summoners in match %s', summonersFound, matchDataResponse['metadata']['matchId'])
         return knownMatchParticipants
 
     async def fetchPostGameData(self, summoner, gameID):
         """Fetch postgame data for the given game ID."""
-        url = f"https://europe.api.riotgames.com/lol/match/v5/matches/EUW1_{gameID}"
+        url = f"https://europe.api.riotgames.com/lol/match/v5/matches/{getMatchId(defaultPlatform, gameID)}"
         response = await asyncRequest(url, session=self.session, headers=requestHeaders)
-        cPrintS(f'{{yellow}}fetchPostGameData - {{cyan}}{response}')
         if response is None:
-            cPrintS(f'{{yellow}} asyncRequest returned None for {summoner.name} postgame data')
+            log.warning('asyncRequest returned None for the post-game data',
+                        extra={'summoner': summoner.name, 'gameId': gameID})
             return None
         if isinstance(response, dict):
             postGameData = {}
@@ -272,8 +272,6 @@ class SummonerTracker:
             return None
 
     async def asyncUpsertPostGameData(self, summoner):
-        conn = connect_db()
-        curr = conn.cursor()
         sql = """
         UPDATE summoner_matches 
         SET 
@@ -286,13 +284,13 @@ class SummonerTracker:
         postGameMatchDataJson = json.dumps(summoner.game.postGameData)
 
         # Execute the SQL command with the JSON string
-        curr.execute(sql, ('win' if summoner.game.postGameData['gameResult'] else 'loss',
-                           postGameMatchDataJson,
-                           summoner.game.gameID,
-                           summoner.puuid))
-        conn.commit()
-        curr.close()
-        conn.close()
+        with getConnection() as conn:
+            with conn.cursor() as curr:
+                curr.execute(sql, ('win' if summoner.game.postGameData['gameResult'] else 'loss',
+                                   postGameMatchDataJson,
+                                   summoner.game.gameID,
+                                   summoner.puuid))
+            conn.commit()
 
     async def trackSummoner(self, summoner):
         """
@@ -306,54 +304,47 @@ class SummonerTracker:
         Args:
             summoner (Summoner): The summoner object to track.
         """
+        fields = {'summoner': summoner.name}
         while True:
             # Check if the summoner is currently in a game
             inGame = await self.fetchSummonerStatus(summoner)
             if inGame:
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{green}}In Game.')
+                log.debug('In game', extra=fields)
 
                 # If a new game instance is needed (summoner.game is None), fetch and store the pre-game data
                 if summoner.game is None:
-                    cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{blue}}fetching pregame data.')
+                    log.info('Fetching pre-game data', extra=fields)
                     preGameData = await self.fetchPreGameData(summoner)
                     summoner.game = Game(preGameData['gameID'],
                                          preGameData)  # Create a new game instance with pre-game data
-                    cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{blue}}upserting preGameData.')
                     if preGameData:
-                        cPrintS(
-                            f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{green}} Found PreGameData :) ')
                         # Upsert (insert or update) the pre-game data in the database
                         preGameDataUpserted = await self.asyncUpsertPreGameData(summoner=summoner,
                                                                                 preGameData=preGameData)
                         if preGameDataUpserted:
-                            cPrintS(
-                                f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{green}} PreGameData Upserted :)')
+                            log.info('Pre-game data upserted', extra={**fields, 'gameId': summoner.game.gameID})
                         else:
-                            cPrintS(
-                                f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{red}} PreGameData Upsert Failed :(')
+                            log.warning('Pre-game data upsert failed', extra=fields)
                     else:
-                        cPrintS(
-                            f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{red}} No PreGameData Found :(')
+                        log.warning('No pre-game data found', extra=fields)
 
                 # Wait until the current game ends
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{magenta}}waiting for game to end.')
+                log.info('Waiting for the game to end', extra={**fields, 'gameId': summoner.game.gameID})
                 await self.waitForGameToEnd(summoner=summoner, game=summoner.game)
 
                 # Fetch and store the post-game data
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{blue}}fetching postgame data.')
-                print(f'{summoner.game.gameID = }')
+                log.info('Fetching post-game data', extra={**fields, 'gameId': summoner.game.gameID})
                 postGameData = await self.fetchPostGameData(summoner, gameID=summoner.game.gameID)
                 summoner.game.updatePostGameData(postGameData)  # Update the game instance with post-game data
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{blue}}upserting postGameData.')
                 await self.asyncUpsertPostGameData(summoner)
                 await self.asyncUpsertSummonersRankedSoloData(summoner.puuid, postGameData['postGameMatchData']['tier'],
                                                               postGameData['postGameMatchData']['rank'],
                                                               postGameData['postGameMatchData']['leaguePoints'])
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{green}} PostGameData Upserted :).')
+                log.info('Post-game data upserted', extra={**fields, 'gameId': summoner.game.gameID})
                 summoner.game = None  # Clear the game instance
                 await asyncio.sleep(4 * 60)  # Check every 4 minutes if a new game starts
             else:
-                cPrintS(f'{{yellow}}{getCurrentHMS()} - {{cyan}}{summoner.name}: {{red}}Not In Game.')
+                log.debug('Not in game', extra=fields)
                 await asyncio.sleep(
                     3 * 60)  # If the summoner is not in a game, wait for 3 minutes before checking again
 
@@ -386,6 +377,9 @@ class Game:
 
 
 async def main():
+    from data import getSummonerNamesFromDB  # the tracker loop itself only needs the config, HTTP and the DB
+
+    startMetrics()
     summonerNames = getSummonerNamesFromDB()
     summonerPuuids = [getDetailsFromSummonerName(summoner, 'puuid') for summoner in summonerNames]
     tracker = SummonerTracker(summonerPuuids)
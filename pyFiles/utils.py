@@ -2,27 +2,21 @@ import json
 import sys
 import time
 from datetime import datetime
-from functools import wraps
 
 import pytz
 
+from configservice import defaultConfigPath, getConfigService
+from profiling import profiled
+
 selenia = 'Seleniá'
 
 
 def myLogger(func):
-    """Decorator to log function name on execution"""
-
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        now = datetime.now()
-        localTimezone = now.astimezone()
-        formattedDatetime = localTimezone.strftime("%Y-%m-%d %H:%M:%S")
-
-        # logging.info(f"Executing function: {func.__name__}")
-        cPrintS(f"{{yellow}}{formattedDatetime} || {{magenta}}Executing function: {{cyan}}{func.__name__}")
-        return func(*args, **kwargs)
-
-    return wrapper
+    """
+    Decorator profiling a function: its call count, cumulative, mean and p95 wall time and exceptions are recorded in
+    profiling.profiles and reported at exit. Set LOL_PROFILE to run it under cProfile or the sampler as well.
+    """
+    return profiled(func)
 
 
 def cPrint(text, color_name):
@@ -101,24 +95,24 @@ def cPrintS(text):
 
 
 #@myLogger
-def getDataFromConfig(file='/home/shai/Desktop/config.json', key=None):
+def getDataFromConfig(file=defaultConfigPath, key=None):
     """
     Retrieve data from the specified configuration file based on the provided key.
 
+    The file is parsed once and cached by the ConfigService (configservice.py), which reloads it when it changes. The
+    returned data is shared between callers and must not be modified.
+
     :param file: The path to the configuration file (default is 'config.json')
     :param key: The key for the value to retrieve from the configuration file
     :return: The value corresponding to the provided key in the configuration file
     :rtype: any
     """
-    if not key:
-        with open(file, 'r') as f:
-            config = json.load(f)
-        return config
+    return getConfigService(file).get(key or None)
+
 
-    with open(file, 'r') as f:
-        config = json.load(f)
-    value = config[key]
-    return value
+def getRequestHeaders():
+    """Return the Riot API request headers (with the API key) of the config."""
+    return getDataFromConfig(key='API')['requestHeaders']
 
 
 def coloredBar(percentage):
@@ -276,6 +270,22 @@ def timestampToDate(mili_timestamp, timezone='UTC', convert=False):
     return dt_object.strftime('%Y-%m-%d %H:%M:%S')
 
 
+def getMonthStart(moment=None, offset=0):
+    """
+    Returns the first instant of the month of moment, shifted by offset months.
+
+    Parameters:
+    moment (datetime, optional): Defaults to now (UTC).
+    offset (int): Months to add, negative for earlier months. Defaults to 0.
+
+    Returns:
+    datetime: A naive UTC datetime, like the 'matches'.datetime column.
+    """
+    moment = moment or datetime.utcnow()
+    months = moment.year * 12 + moment.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
 #@myLogger
 def findMissingMatches(DB_list, NewList):
     """
@@ -309,12 +319,8 @@ def getDetailsFromSummonerName(summonerName, detail='puuid'):
     Returns:
     str: The PUUID of the summoner, or None if not found.
     """
-    # Access the 'SummonerData' from the config
-    config = getDataFromConfig()
-    summoner_data = config.get('SummonerData', {})
-
-    # Attempt to get the summoner details by name, return the PUUID if found
-    summoner_details = summoner_data.get(summonerName)
+    # Look the summoner up in the name index of the cached 'SummonerData'
+    summoner_details = getConfigService().getSummonerDetails(summonerName)
     if summoner_details:
         return summoner_details.get(detail)
 
@@ -324,23 +330,11 @@ def getDetailsFromSummonerName(summonerName, detail='puuid'):
 
 #@myLogger
 def getSummonerNameFromID(summonerID):
-    # Access the 'SummonerData' from the config
-    config = getDataFromConfig()
-    for summoner, data in config['SummonerData'].items():
-        if data['summonerID'] == summonerID:
-            return data['summonerName']
-
-    # Return None if the summoner name is not found
-    return None
+    # summonerID -> name index of the cached 'SummonerData', None if the summoner is not found
+    return getConfigService().getSummonerNameFromID(summonerID)
 
 
 #@myLogger
 def getSummonerNameFromPuuid(puuid):
-    # Access the 'SummonerData' from the config
-    config = getDataFromConfig()
-    for summoner, data in config['SummonerData'].items():
-        if data['puuid'] == puuid:
-            return data['summonerName']
-
-    # Return None if the summoner name is not found
-    return None
+    # puuid -> name index of the cached 'SummonerData', None if the summoner is not found
+    return getConfigService().getSummonerNameFromPuuid(puuid)